@@ -0,0 +1,63 @@
+import argparse
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+#import-time budget for the CLI subcommands
+#each command is started with `python -X importtime` in an empty directory - it fails on the missing
+#data right after its imports, which is all we need. Exit code 1 when a budget is exceeded or a
+#command pulls in a library it should not need:
+#
+#   python benchmarks/import_budget.py
+
+CLI = Path(__file__).parent.parent / 'maps' / 'cli.py'
+
+# command -> (budget in seconds, top level packages it must not import)
+BUDGETS = {
+    '--help': (0.3, ['geopandas', 'folium', 'sklearn', 'shapely', 'pandas']),
+    'stats': (2.0, ['folium', 'sklearn', 'matplotlib']),
+    'build-network': (2.0, ['folium', 'sklearn', 'matplotlib']),
+    'analyze': (3.0, ['folium', 'matplotlib']),
+    'render': (4.0, ['matplotlib']),
+    'similar': (1.0, ['geopandas', 'folium', 'sklearn', 'shapely']),
+}
+
+LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def measure(command):
+    #total import time [s] + set of top level packages imported
+    with tempfile.TemporaryDirectory() as cwd:
+        proc = subprocess.run([sys.executable, '-X', 'importtime', str(CLI), *command.split()],
+                              cwd=cwd, capture_output=True, text=True)
+
+    total_us, packages = 0, set()
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            total_us += int(match.group(1))  # self time - summing cumulative would double count
+            packages.add(match.group(4).split('.')[0])
+    return total_us / 1e6, packages
+
+
+def check(repeat):
+    failed = False
+    print(f"{'command':<16} {'import [s]':>10} {'budget':>8}  forbidden imports")
+    for command, (budget, forbidden) in BUDGETS.items():
+        seconds = min(measure(command)[0] for _ in range(repeat))  # best of n - warm file cache
+        packages = measure(command)[1]
+        leaked = sorted(set(forbidden) & packages)
+
+        ok = seconds <= budget and not leaked
+        failed |= not ok
+        print(f"{command:<16} {seconds:>10.3f} {budget:>8.1f}  {', '.join(leaked) or '-'} {'✓' if ok else '❌'}")
+    return not failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import-time budget check for maps/cli.py')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    sys.exit(0 if check(args.repeat) else 1)
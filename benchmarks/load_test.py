@@ -0,0 +1,84 @@
+import argparse
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+#small load test for the query service (maps/query_service.py) - stdlib only:
+#
+#   python maps/cli.py serve &
+#   python benchmarks/load_test.py --requests 2000 --concurrency 8
+#
+#random bbox / nearest / radius queries inside the bounds reported by /health,
+#latency percentiles per endpoint + overall throughput. Exit code 1 if any request failed.
+
+
+def get(url):
+    start = time.perf_counter()
+    with urlopen(url, timeout=10) as resp:
+        payload = json.loads(resp.read())
+    return (time.perf_counter() - start) * 1000, payload
+
+
+def random_queries(bounds, n, seed):
+    rng = random.Random(seed)
+    min_lon, min_lat, max_lon, max_lat = bounds
+    queries = []
+    for _ in range(n):
+        lon, lat = rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)
+        kind = rng.choice(['bbox', 'nearest', 'radius'])
+        if kind == 'bbox':
+            size = rng.uniform(0.01, 0.1)  # ~1-10 km
+            queries.append((kind, f"/bbox?bbox={lon},{lat},{lon + size},{lat + size * 0.66}"))
+        elif kind == 'nearest':
+            queries.append((kind, f"/nearest?lat={lat}&lon={lon}&k={rng.choice([1, 3, 10])}"))
+        else:
+            queries.append((kind, f"/radius?lat={lat}&lon={lon}&r={rng.choice([500, 2000, 5000])}"))
+    return queries
+
+
+def run(url, n, concurrency, seed):
+    _, health = get(f"{url}/health")
+    print(f"Service: {health['segments']} segments, {health['rides']} rides, {health['candidates']} candidates")
+
+    queries = random_queries(health['bounds'], n, seed)
+    latencies, failures = {}, 0
+
+    def call(query):
+        kind, path = query
+        try:
+            return kind, get(url + path)
+        except Exception as e:
+            return kind, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for kind, result in pool.map(call, queries):
+            if isinstance(result, Exception):
+                failures += 1
+                continue
+            client_ms, payload = result
+            latencies.setdefault(kind, []).append((client_ms, payload['took_ms']))
+    wall = time.perf_counter() - start
+
+    print(f"\n{'endpoint':<10} {'n':>6} {'p50 [ms]':>9} {'p95 [ms]':>9} {'p99 [ms]':>9} {'server p50':>11}")
+    for kind, values in sorted(latencies.items()):
+        client = sorted(v[0] for v in values)
+        server = sorted(v[1] for v in values)
+        pct = lambda xs, p: xs[min(len(xs) - 1, int(p * len(xs)))]
+        print(f"{kind:<10} {len(values):>6} {pct(client, 0.5):>9.2f} {pct(client, 0.95):>9.2f} "
+              f"{pct(client, 0.99):>9.2f} {pct(server, 0.5):>11.3f}")
+    print(f"\n{n} requests in {wall:.2f}s = {n / wall:.0f} req/s (concurrency {concurrency}), {failures} failed")
+    return failures == 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test for the local trail query service')
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.url.rstrip('/'), args.requests, args.concurrency, args.seed) else 1)
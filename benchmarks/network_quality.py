@@ -0,0 +1,62 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import shapely
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'maps'))
+from config import Config
+from network_layer import NetworkBuilder
+from geometry_store import GeometryStore
+from synthetic import SyntheticRides
+
+#network quality on synthetic rides - the generator knows the hidden trail system, so the built network can be
+#checked against it: with more rides of the same trails the segment count and km have to level off (traces of
+#one trail merged into one corridor) and stay close to the hidden trails
+#
+#   python benchmarks/network_quality.py --sizes 100 300 1000 3000
+#
+#rides without the per ride connector (SyntheticRides.rides connectors=False) - a connector is a straight line off
+#the trail system, unique to its ride, so with it the network grows with ride count by construction
+
+COVER_BUFFER_M = 30  # a hidden trail counts as covered within this distance of the network
+
+
+def measure(generator, n_rides):
+    rides = generator.rides(n_rides, connectors=False)
+    store = GeometryStore()
+    store.register('rides', rides)
+    start = time.perf_counter()
+    NetworkBuilder.create_network(rides, tolerance=Config.SNAP_TOLERANCE, store=store)
+    seconds = time.perf_counter() - start
+
+    network = store.metric('network').values
+    trails = shapely.union_all(shapely.linestrings(generator.trails))
+    covered = shapely.intersection(trails, shapely.union_all(shapely.buffer(network, COVER_BUFFER_M)))
+    vertices = shapely.points(shapely.get_coordinates(shapely.segmentize(network, 20)))
+    return {
+        'segments': len(network),
+        'km': shapely.length(network).sum() / 1000,
+        'covered_km': shapely.length(covered) / 1000,
+        'offset_m': float(np.median(shapely.distance(vertices, trails))),
+        'seconds': seconds,
+    }
+
+
+def run(sizes, seed):
+    print(f"{'rides':>7} {'segments':>9} {'km':>7} {'trails km':>10} {'offset':>7} {'time':>7}")
+    for n in sizes:
+        generator = SyntheticRides(seed=seed)
+        r = measure(generator, n)
+        print(f"{n:>7} {r['segments']:>9} {r['km']:>7.0f} {r['covered_km']:>10.0f} {r['offset_m']:>6.1f}m "
+              f"{r['seconds']:>6.1f}s", flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Trail network quality on synthetic rides')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 300, 1000, 3000])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    run(args.sizes, args.seed)
@@ -0,0 +1,151 @@
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'maps'))
+from config import Config
+from loader import DataLoader
+from network_layer import NetworkBuilder
+from location_analysis import LocationAnalyzer
+from heatmap import HeatMapLayer
+from trails_layer import TrailsLayers
+from base_map import BaseLayers
+from geometry_store import GeometryStore
+from synthetic import SyntheticRides
+
+#scaling benchmark - times every pipeline stage on synthetic rides at growing sizes
+#results go to benchmarks/results/*.json so runs of different versions can be compared:
+#
+#   python benchmarks/run_benchmarks.py --sizes 100 1000 10000 100000
+#   python benchmarks/run_benchmarks.py --compare results/old.json results/new.json
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+
+def git_version():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def timed(timings, name, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[name] = round(time.perf_counter() - start, 4)
+    print(f"   {name:<24} {timings[name]:>9.3f}s")
+    return result
+
+
+def run_size(generator, n_rides, zones, skip=()):
+    #one full pipeline pass - stages listed in skip are left out (too slow at previous size)
+    timings = {}
+    rides = generator.rides(n_rides)
+    study_area = generator.study_area
+
+    store = GeometryStore()
+    store.register('rides', rides)
+    store.register('zones', zones)
+
+    rides = timed(timings, 'calculate_km', DataLoader.calculate_km, rides, store=store)
+
+    network = timed(timings, 'create_network', NetworkBuilder.create_network, rides,
+                    tolerance=Config.SNAP_TOLERANCE, store=store)
+
+    if 'map_rides_to_segments' in skip:
+        network['ride_count'] = 0
+    else:
+        network = timed(timings, 'map_rides_to_segments', NetworkBuilder.map_rides_to_segments,
+                        network, rides, buffer_distance=Config.INTERSECTION_BUFFER, store=store)
+
+    timed(timings, 'location_analysis', LocationAnalyzer.analyze, network, rides, study_area, zones, store=store)
+
+    bounds = study_area.total_bounds
+    m = BaseLayers.create_base_map([(bounds[1] + bounds[3]) / 2, (bounds[0] + bounds[2]) / 2], Config.DEFAULT_ZOOM)
+    if 'heatmap' not in skip:
+        timed(timings, 'heatmap', HeatMapLayer.add_heatmap, m, rides)
+    if 'html_render' not in skip:
+        TrailsLayers.add_trail_network(m, network, rides)
+        timed(timings, 'html_render', lambda: m.get_root().render())
+
+    return {
+        'rides': n_rides,
+        'segments': len(network),
+        'timings_s': timings,
+    }
+
+
+def run(sizes, seed, max_stage_seconds):
+    generator = SyntheticRides(seed=seed)
+    zones = generator.zones()
+    results = []
+    skip = set()
+
+    for n in sizes:
+        if 'create_network' in skip:
+            print(f"\n=== {n} rides === skipped (network build over budget at smaller size)")
+            results.append({'rides': n, 'skipped': True})
+            continue
+
+        print(f"\n=== {n} rides ===")
+        result = run_size(generator, n, zones, skip)
+        result['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        results.append(result)
+
+        # a stage that already takes too long is not run at the next (bigger) size
+        for stage, seconds in result['timings_s'].items():
+            if seconds > max_stage_seconds and stage in ('create_network', 'map_rides_to_segments', 'heatmap', 'html_render'):
+                print(f"   ⚠️ {stage} over {max_stage_seconds}s - skipped at larger sizes")
+                skip.add(stage)
+
+    return {
+        'version': git_version(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': seed,
+        'results': results,
+    }
+
+
+def compare(old_path, new_path):
+    old = {r['rides']: r for r in json.loads(Path(old_path).read_text())['results']}
+    new = json.loads(Path(new_path).read_text())
+    print(f"{'rides':>8} {'stage':<24} {'old [s]':>9} {'new [s]':>9} {'speedup':>8}")
+    for result in new['results']:
+        before = old.get(result['rides'])
+        if before is None or result.get('skipped') or before.get('skipped'):
+            continue
+        for stage, seconds in result['timings_s'].items():
+            if stage in before['timings_s']:
+                old_s = before['timings_s'][stage]
+                print(f"{result['rides']:>8} {stage:<24} {old_s:>9.3f} {seconds:>9.3f} {old_s / max(seconds, 1e-9):>7.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pipeline scaling benchmark on synthetic rides')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--max-stage-seconds', type=float, default=300,
+                        help='stop running a stage at larger sizes once it exceeds this')
+    parser.add_argument('--output', type=Path, default=None)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    report = run(args.sizes, args.seed, args.max_stage_seconds)
+    output = args.output or RESULTS_DIR / f"bench_{report['version']}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\n✓ Results saved to {output}")
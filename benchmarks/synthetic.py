@@ -0,0 +1,85 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely.geometry import box
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
+from config import Config
+from coord_arrays import lines_from_offsets
+
+#seeded synthetic rides inside a Šumava-like bounding box
+#a hidden trail system (trailheads + trails radiating from them) is generated first,
+#every ride goes out along one trail and comes back along another from the same trailhead
+#=> rides overlap heavily on shared trails, start points cluster, like real Strava data
+
+SUMAVA_BBOX = (13.2, 48.75, 14.1, 49.25)  # lon/lat
+
+
+class SyntheticRides:
+    def __init__(self, seed=42, n_trailheads=12, trails_per_head=8, trail_points=80, step_m=100, noise_m=5):
+        self.rng = np.random.default_rng(seed)
+        self.noise_m = noise_m
+        self.study_area = gpd.GeoDataFrame({'name': ['synthetic'], 'geometry': [box(*SUMAVA_BBOX)]}, crs='EPSG:4326')
+
+        # trail system in meters
+        xmin, ymin, xmax, ymax = self.study_area.to_crs(Config.METRIC_CRS).total_bounds
+        margin = trail_points * step_m
+        heads = np.column_stack([
+            self.rng.uniform(xmin + margin, xmax - margin, n_trailheads),
+            self.rng.uniform(ymin + margin, ymax - margin, n_trailheads),
+        ])
+
+        n_trails = n_trailheads * trails_per_head
+        # smooth random walk: heading changes a little every step
+        heading = self.rng.uniform(0, 2 * np.pi, (n_trails, 1)) + np.cumsum(
+            self.rng.normal(0, 0.15, (n_trails, trail_points)), axis=1)
+        steps = np.stack([np.cos(heading), np.sin(heading)], axis=-1) * step_m
+        self.trails = np.repeat(heads, trails_per_head, axis=0)[:, None, :] + np.cumsum(steps, axis=1)
+        self.trails[:, 0, :] = np.repeat(heads, trails_per_head, axis=0)
+        self.trails_per_head = trails_per_head
+        self.n_trailheads = n_trailheads
+
+    def rides(self, n_rides, every=2, connectors=True):
+        #n rides as GeoDataFrame in EPSG:4326 - same columns as the Strava download
+        #connectors=False => no straight line from the end of the way out to the start of the way back (a ride is
+        #then a MultiLineString of the two trail pieces) - every ride has its own connector, off the trail system
+        rng = self.rng
+        head = rng.integers(0, self.n_trailheads, n_rides)
+        out_trail = head * self.trails_per_head + rng.integers(0, self.trails_per_head, n_rides)
+        back_trail = head * self.trails_per_head + rng.integers(0, self.trails_per_head, n_rides)
+
+        # how far along each trail the rider goes (at least a quarter of the trail)
+        n_points = self.trails.shape[1]
+        out_len = rng.integers(n_points // 4, n_points, n_rides)
+        back_len = rng.integers(n_points // 4, n_points, n_rides)
+
+        pieces, counts = [], []
+        for o, b, lo, lb in zip(out_trail, back_trail, out_len, back_len):
+            ride = [self.trails[o, :lo:every], self.trails[b, lb - 1::-every]]
+            pieces.extend(ride if not connectors else [np.concatenate(ride)])
+            counts.extend(len(p) for p in (ride if not connectors else pieces[-1:]))
+
+        coords = np.concatenate(pieces) + rng.normal(0, self.noise_m, (sum(counts), 2))
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        lines = lines_from_offsets(coords, offsets)
+        if not connectors:
+            lines = shapely.multilinestrings(lines, indices=np.repeat(np.arange(n_rides), 2))
+
+        dates = pd.Timestamp('2017-01-01') + pd.to_timedelta(rng.integers(0, 8 * 365 * 24, n_rides), unit='h')
+        rides = gpd.GeoDataFrame({
+            'activity_id': np.arange(1, n_rides + 1),
+            'name': [f'Ride {i}' for i in range(1, n_rides + 1)],
+            'date': dates,
+        }, geometry=lines, crs=Config.METRIC_CRS)
+        return rides.to_crs('EPSG:4326')
+
+    def zones(self):
+        #protected zones - a core zone A around one trailhead, rest zone B
+        area = self.study_area.to_crs(Config.METRIC_CRS)
+        core = area.geometry.iloc[0].centroid.buffer(3000)
+        rest = area.geometry.iloc[0].difference(core)
+        return gpd.GeoDataFrame({'ZONA': ['A', 'B']}, geometry=[core, rest], crs=Config.METRIC_CRS).to_crs('EPSG:4326')
@@ -0,0 +1,171 @@
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'maps'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
+from config import Config
+from synthetic import SyntheticRides
+
+#local stand-in for Strava push events - no account, no network access:
+#
+#   python benchmarks/webhook_sim.py --base 200 --new 30 --deletes 5
+#
+#a base network is built from seeded synthetic rides in a temporary folder (region profile, maps/regions.py),
+#then the webhook receiver (preprocessing/strava_webhook.py) runs with a fetcher that serves the remaining synthetic
+#rides. Creates (one sent twice), title updates, deletes, a sport change and a create + delete pair are posted;
+#ride store and network are checked after the batch. Exit code 1 if anything does not match.
+
+
+class SyntheticFetcher:
+    #stands in for the Strava API - counts the requests the receiver would have made
+    def __init__(self, rides, delay=0.0):
+        self.records = {int(r['activity_id']): r for r in rides.to_dict('records')}
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, activity_id):
+        self.calls += 1
+        time.sleep(self.delay)
+        return dict(self.records[activity_id]) if activity_id in self.records else None
+
+
+def request(url, event=None):
+    data = json.dumps(event).encode() if event is not None else None
+    req = Request(url, data=data, headers={'Content-Type': 'application/json'} if data else {})
+    start = time.perf_counter()
+    try:
+        with urlopen(req, timeout=10) as resp:
+            return resp.status, json.loads(resp.read()), (time.perf_counter() - start) * 1000
+    except HTTPError as e:
+        return e.code, json.loads(e.read()), (time.perf_counter() - start) * 1000
+
+
+def event(activity_id, aspect, updates=None):
+    return {'object_type': 'activity', 'object_id': int(activity_id), 'aspect_type': aspect, 'updates': updates or {},
+            'owner_id': 1, 'subscription_id': 1, 'event_time': int(time.time())}
+
+
+def run(n_base, n_new, n_deletes, debounce, delay, seed, workdir):
+    from regions import Region
+    from pipeline import Pipeline
+    from progress import Progress
+    from ride_store import RideStore
+    from network_update import NetworkUpdater
+    from loader import DataLoader
+    from strava_webhook import serve
+
+    synthetic = SyntheticRides(seed=seed)
+    rides = synthetic.rides(n_base + n_new)
+    base, fresh = rides.iloc[:n_base], rides.iloc[n_base:]
+    synthetic.study_area.to_file(workdir / 'aoi.gpkg')
+    base.to_file(workdir / 'base.gpkg', layer='rides')
+    Region('webhook_sim', aoi=workdir / 'aoi.gpkg', metric_crs=Config.METRIC_CRS, output=workdir).apply(
+        rides=workdir / 'base.gpkg')
+    Config.RIDE_STORE, Config.STREAM_STORE = workdir / 'ride_store.gpkg', workdir / 'streams'
+    Config.WEBHOOK_QUEUE = workdir / 'events.sqlite'
+
+    print(f"\n⚙️ Base network from {n_base} synthetic rides ({workdir})")
+    Pipeline().run(['similarity', 'time_cube'], force={'enrich', 'network'})
+    store = RideStore(Config.RIDE_STORE)
+    store.append(base.to_dict('records'))  # the store as after a full sync
+
+    # events: every fresh ride created (the first one twice), titles changed, base rides deleted,
+    # one base ride turned into a run, the last fresh ride created and deleted again before the batch
+    ids, base_ids = fresh['activity_id'].tolist(), base['activity_id'].tolist()
+    deleted, to_run, flicker = base_ids[:n_deletes], base_ids[n_deletes], ids[-1]
+    events = [event(i, 'create') for i in ids] + [event(ids[0], 'create')]
+    events += [event(i, 'update', {'title': 'Evening ride'}) for i in ids[:5]]
+    events += [event(i, 'delete') for i in deleted] + [event(to_run, 'update', {'type': 'Run'}), event(flicker, 'delete')]
+    expected = (set(base_ids) - set(deleted) - {to_run}) | (set(ids) - {flicker})
+
+    fetcher = SyntheticFetcher(fresh, delay)
+    updates = []
+    updater = NetworkUpdater()
+    progress = Progress()
+    ready = threading.Event()
+    servers = []
+
+    def on_change(added, removed):
+        summary = updater.apply(added=added, removed=removed)
+        updates.append((time.perf_counter(), summary))
+
+    def started(server):
+        servers.append(server)
+        ready.set()
+
+    receiver = threading.Thread(target=serve, kwargs=dict(port=0, verify_token='sim', fetch=fetcher, on_change=on_change,
+                                                          store=store, debounce=debounce, progress=progress,
+                                                          ready=started, subscription_id=1))
+    receiver.start()
+    ready.wait()
+    url = f"http://127.0.0.1:{servers[0].server_port}"
+
+    ok = True
+    status, payload, _ = request(f"{url}/webhook?hub.mode=subscribe&hub.verify_token=sim&hub.challenge=c123")
+    handshake = status == 200 and payload == {'hub.challenge': 'c123'}
+    rejected = request(f"{url}/webhook?hub.mode=subscribe&hub.verify_token=wrong&hub.challenge=x")[0] == 403
+    bad_event = request(f"{url}/webhook", {'hello': 'world'})[0] == 400
+    foreign = request(f"{url}/webhook", dict(event(base['activity_id'].iloc[-1], 'delete'), subscription_id=999))[0] == 403
+    ok &= handshake and rejected and bad_event and foreign
+
+    posted = time.perf_counter()
+    latencies = sorted(request(f"{url}/webhook", e)[2] for e in events)
+    while not updates and time.perf_counter() - posted < debounce + 120:
+        time.sleep(0.1)
+    status_after = request(f"{url}/status")[1]
+    progress.cancel('done')
+    receiver.join()
+
+    stored = set(store.read()['activity_id'].tolist())
+    cleaned = set(DataLoader.load_rides(Config.CLEANED_RIDES)['activity_id'].tolist())
+    checks = {
+        'handshake + verify token + bad event': handshake and rejected and bad_event,
+        'event of another subscription refused': foreign,
+        'one network update': len(updates) == 1,
+        'ride store': stored == expected,
+        'network rides': cleaned == expected,
+        f'fetches = new rides ({len(ids) - 1})': fetcher.calls == len(ids) - 1,
+        'queue drained': status_after['queue'].get('pending', 0) == 0,
+    }
+    ok &= all(checks.values())
+
+    pct = lambda xs, p: xs[min(len(xs) - 1, int(p * len(xs)))]
+    print(f"\n{len(events)} events posted: POST p50 {pct(latencies, 0.5):.1f} ms, p99 {pct(latencies, 0.99):.1f} ms "
+          f"(Strava allows 2000 ms)")
+    if updates:
+        summary = updates[0][1]
+        print(f"event -> network updated in {updates[0][0] - posted:.1f}s ({debounce:.0f}s debounce, "
+              f"update {summary['seconds']}s): +{summary['added']} / -{summary['removed']} rides, "
+              f"{summary['new_segments']} new segments")
+    print(f"API requests: {fetcher.calls} activity fetches for {len(events)} events (polling pages through the activity list on every sync)")
+    for name, passed in checks.items():
+        print(f"  {'✓' if passed else '❌'} {name}")
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic Strava webhook events against a local receiver')
+    parser.add_argument('--base', type=int, default=200, help='rides in the network before the events')
+    parser.add_argument('--new', type=int, default=30, help='rides created through events')
+    parser.add_argument('--deletes', type=int, default=5, help='base rides deleted through events')
+    parser.add_argument('--debounce', type=float, default=2.0, help='receiver debounce (seconds)')
+    parser.add_argument('--delay', type=float, default=0.0, help='simulated API latency per fetch (seconds)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep', action='store_true', help='keep the temporary folder')
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix='webhook_sim_'))
+    try:
+        passed = run(args.base, args.new, args.deletes, args.debounce, args.delay, args.seed, workdir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if passed else 1)
@@ -8,21 +8,63 @@ class Config:
     OUTPUT_DIR = Path('maps')
 
     STUDY_AREA = 'data/sumava_data/sumava_aoi.gpkg'
+    AOI_CACHE = SUMAVA_DIR / 'sumava_aoi_prepared.gpkg'  # simplified 4326 + metric copies
+    HTTP_CACHE_DIR = DATA_DIR / 'cache' / 'http'
+    LAYER_CACHE = DATA_DIR / 'cache' / 'layers'  # serialized map layers by fingerprint (maps/layer_cache.py)
+    ASSET_CACHE = DATA_DIR / 'cache' / 'assets'  # Leaflet/folium JS + CSS downloaded for offline bundles (maps/map_bundle.py)
     STRAVA_RIDES = 'data/strava/strava_route_sample.geojson'
 
+    RIDE_STORE = STRAVA_DIR / 'strava_routes_sumava.gpkg'  # Strava download + GPX/FIT imports (preprocessing/bulk_ingest.py)
+    STREAM_STORE = STRAVA_DIR / 'streams'  # full resolution tracks, see preprocessing/stream_store.py
     CLEANED_RIDES = STRAVA_DIR / 'rides_cleaned.gpkg'
     TRAIL_NETWORK = STRAVA_DIR / 'trail_network.gpkg'
+    TIME_CUBE = STRAVA_DIR / 'time_cube.npz'  # segment x month/weekday/hour ride counts
+    WEBHOOK_QUEUE = STRAVA_DIR / 'webhook_events.sqlite'  # Strava push events not processed yet (preprocessing/strava_webhook.py)
+    RIDE_SIMILARITY = STRAVA_DIR / 'ride_similarity.npz'  # MinHash signatures of the rides (maps/ride_similarity.py)
     OUTPUT_MAP = OUTPUT_DIR / 'mtb_planner.html'
+    LOOPS_MAP = OUTPUT_DIR / 'loops.html'  # suggested loops for one start point (cli.py loops)
+    CANDIDATES = OUTPUT_DIR / 'candidate_locations.gpkg'
+    PROTECTED_ZONES = DATA_DIR / 'sumava_zones_2.geojson'
+    DEM = SUMAVA_DIR / 'dem.tif'  # optional - elevation profile of the segments (maps/elevation.py)
+    DEM_CACHE = SUMAVA_DIR / 'dem'  # DEM converted to a memory mapped .npy
+    TILE_DIR = DATA_DIR / 'tiles'  # spatial tiles of the rides, see maps/tiling.py
+    REGIONS = DATA_DIR / 'regions.json'  # region profiles for other parks (maps/regions.py)
+    REGION_DIR = DATA_DIR / 'regions'  # default output folder per region: REGION_DIR / <name>
     
+    METRIC_CRS = 'EPSG:32633'  # UTM 33N - all distances/buffers in meters
+    AOI_SIMPLIFY_TOLERANCE = 20  # meters - for clipping/filtering copies of the AOI
+    LOCAL_TIMEZONE = 'Europe/Prague'  # GPX/FIT times are UTC - ride dates are stored in local time like Strava's
+
     # Map settings
     DEFAULT_ZOOM = 11
     MIN_ZOOM = 8
     MAX_ZOOM = 1
+    MAP_BUNDLE = None  # None = CDN links as folium writes them, 'inline' / 'vendor' = offline bundle (render --bundle)
+    BUNDLE_COORD_DECIMALS = 6  # coordinates in a bundled map rounded to ~0.1 m
+    BROTLI_QUALITY = 11  # .br variant of a bundled map (0-11, written once, so the slowest/smallest)
     
     # === NETWORK SETTINGS ===
     SNAP_TOLERANCE = 50  # meters - merge lines within this distance
     SIMPLIFY_TOLERANCE = 10  # meters
+    CLEAN_MIN_STEP_M = 0.5  # track cleaning (DataLoader.clean_tracks): closer consecutive points are duplicates
+    CLEAN_SPIKE_M = 100  # out-and-back jumps longer than this are GPS spikes ...
+    CLEAN_SPIKE_STEP_FACTOR = 5  # ... and longer than this x the median step of the track (not a turnaround)
+    CLEAN_MAX_JUMP_M = 3000  # longer steps split the track (signal lost)
+    CLEAN_MAX_SPEED_KMH = 80  # faster => spike / jump (only where timestamps exist, i.e. streams)
+    CLEAN_PAUSE_RADIUS_M = 10  # pause = track stays within this radius ...
+    CLEAN_PAUSE_POINTS = 5  # ... over 2 x this many points
     INTERSECTION_BUFFER = 100  # meters - for mapping rides to segments
+    TILE_SIZE_M = 10000  # meters - grid for out-of-core processing (maps/tiling.py)
+    TILE_CHUNK_RIDES = 5000  # rides read/enriched at once when partitioning into tiles
+    DEM_SAMPLE_STEP = 25  # meters - elevation sampled along segments every ...
+    DIFFICULTY_GRADES = {'Easy': 6, 'Moderate': 10, 'Hard': 15}  # max gradient [%] up to which a class applies
+    MATCH_WORKERS = 1  # >1 => rides matched to segments in a process pool (shared memory, see maps/ride_arrays.py)
+    ROUTE_POPULARITY_WEIGHT = 1.0  # loop planner: edge cost = length / (1 + w * log(1 + ride_count)), 0 = shortest
+    MINHASH_PERMUTATIONS = 128  # ride similarity: signature length (error of a similarity estimate ~ 1/sqrt(n))
+    MINHASH_BANDS = 32  # LSH bands - 32 x 4 rows => rides from ~0.42 similarity up become candidates
+    MINHASH_PIECE_M = 250  # one token per 250 m of a traversed segment => similarity ~ shared trail length
+    WEBHOOK_DEBOUNCE_S = 60  # webhook worker waits this long after an event - a burst becomes one network update
+    WEBHOOK_MAX_ATTEMPTS = 5  # failed activity fetches are retried with the next batch, then given up
     CLUSTER_DISTANCE = 2000  # meters - for grouping nearby rides
     
     # Colors
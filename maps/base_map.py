@@ -141,9 +141,17 @@ else '⚠️ Located within Zone A (strictly protected core)<br>Development proh
         
         m.get_root().html.add_child(folium.Element(summary_html))
 
-    def save_map(m, output_path):
+    def save_map(m, output_path, bundle=None):
+        #bundle: 'inline' / 'vendor' = offline copy + .gz/.br variants (maps/map_bundle.py), None = Config.MAP_BUNDLE
+        from map_bundle import MapBundle
+
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         m.save(str(output_path))
+        bundle = bundle or Config.MAP_BUNDLE
+        if bundle:
+            MapBundle.bundle(output_path, bundle)
+        else:
+            MapBundle.clear_variants(output_path)
         print(f" Map saved to: {output_path}")
    
@@ -0,0 +1,414 @@
+import argparse
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
+from config import Config
+
+#command line entry point - every step of the pipeline as its own subcommand:
+#
+#   python maps/cli.py ingest          download new Strava rides (--dir: import a directory of GPX/FIT files)
+#   python maps/cli.py build-network   enrich rides + build trail network      (no folium/sklearn, --tiled for huge archives)
+#   python maps/cli.py analyze         candidate trail center locations        (no folium)
+#   python maps/cli.py render          interactive map from saved artifacts
+#   python maps/cli.py stats           summary of saved artifacts              (geopandas only)
+#   python maps/cli.py all             build-network + analyze + render + stats (stages run in parallel)
+#   python maps/cli.py serve           local HTTP query service over the saved artifacts
+#   python maps/cli.py serve-map       saved maps over HTTP, precompressed (render --bundle) + optional throttle
+#   python maps/cli.py run --stage X   one pipeline stage (+ whatever it needs that is not saved yet)
+#   python maps/cli.py loops --lat .. --lon .. --km 30   loop suggestions on popular trails from a start point
+#   python maps/cli.py webhook         Strava push events -> ride store + incremental network update
+#   python maps/cli.py regions         every region profile (data/regions.json) in parallel worker processes
+#   python maps/cli.py --region NAME all   any command for one region profile instead of Šumava
+#
+#heavy libraries are imported inside the commands - a cron job or a quick query only pays for what it uses
+#long commands print progress lines; --timeout or SIGTERM (scheduler) stops them cleanly between batches
+
+
+def stats(study_area, rides, network):
+    import geopandas as gpd
+
+    print("\n=== SUMMARY ===")
+    print(f"Total Rides: {len(rides)}")
+    print(f"Total Distance: {rides['distance_km'].sum():.1f} km")
+    print(f"Average Ride: {rides['distance_km'].mean():.1f} km")
+    print(f"Longest Ride: {rides['distance_km'].max():.1f} km")
+
+    print(f"\nNetwork:")
+    print(f"  Segments: {len(network)}")
+    print(f"  Total Length: {network['distance_km'].sum():.1f} km")
+    print(f"  Most Popular: {network['ride_count'].max()} rides on one segment")
+
+    print(f"\nRoute Types:")
+    for route_type, count in rides['route_type'].value_counts().items():
+        print(f"  {route_type}: {count}")
+
+    if Config.CANDIDATES.exists():
+        candidates = gpd.read_file(Config.CANDIDATES)
+        print(f"\nTrail Center Candidates: {len(candidates)} locations")
+        best = candidates.iloc[0]
+        print(f"  Best: {best.geometry.y:.4f}°N, {best.geometry.x:.4f}°E")
+        print(f"  Score: {best['suitability_score']:.1f}/100")
+
+    print(f"\nOutput: {Config.OUTPUT_MAP}")
+
+
+def load_zones():
+    import geopandas as gpd
+    return gpd.read_file(Config.PROTECTED_ZONES) if Config.PROTECTED_ZONES.exists() else None
+
+
+def require(path, command):
+    if not Path(path).exists():
+        sys.exit(f"❌ {path} not found - run `python maps/cli.py {command}` first")
+
+
+def run_progress(args):
+    import signal
+    from progress import CancelToken, Progress, console
+
+    token = CancelToken(getattr(args, 'timeout', None))
+    signal.signal(signal.SIGTERM, lambda *_: token.cancel('SIGTERM'))
+    return Progress([console], token)
+
+
+# === COMMANDS ===
+def cmd_ingest(args):
+    if args.dir:
+        from bulk_ingest import ingest
+        ingest(args.dir, workers=args.workers, progress=run_progress(args))
+        return
+    from strava_data import download_strava_routes_incremental
+    download_strava_routes_incremental(progress=run_progress(args))
+
+
+def cmd_build_network(args):
+    from loader import DataLoader
+    from network_layer import NetworkBuilder
+    import geopandas as gpd
+    from geometry_store import GeometryStore
+    from stream_store import StreamStore
+    from time_cube import TimeCube
+    from ride_similarity import RideSimilarity
+    from elevation import Elevation
+    from spatial_index import index_dir
+
+    Config.ensure_directories()
+    progress = run_progress(args)
+    if args.tiled:
+        from tiling import TileGrid, TiledNetwork
+        TiledNetwork(TileGrid.for_study_area(Config.STUDY_AREA)).run(Config.STRAVA_RIDES, progress=progress)
+        network = NetworkBuilder.load_network(Config.TRAIL_NETWORK)
+        dates = gpd.read_file(Config.CLEANED_RIDES, columns=['date'], ignore_geometry=True)  # labels = row positions
+        if 'date' in dates.columns:
+            TimeCube.build(network, dates['date']).save(Config.TIME_CUBE)
+        RideSimilarity.build(network).save(Config.RIDE_SIMILARITY)
+        return
+
+    study_area, rides = DataLoader.load_data(Config.STUDY_AREA, Config.STRAVA_RIDES)
+    rides = DataLoader.clean_ride_names(rides)
+
+    geoms = GeometryStore()
+    geoms.register('rides', rides)
+    rides = DataLoader.clean_tracks(rides, store=geoms)
+    rides = DataLoader.calculate_km(rides, store=geoms)
+    DataLoader.save_rides(rides, Config.CLEANED_RIDES)
+
+    if Config.TRAIL_NETWORK.exists() and not args.force:
+        print(f"\n✓ Network already built: {Config.TRAIL_NETWORK} (--force to rebuild)")
+        return
+
+    streams = StreamStore(Config.STREAM_STORE) if Config.STREAM_STORE.exists() else None
+    print("\n⚙️ Building trail network (this may take a few minutes)...")
+    network = NetworkBuilder.create_network(rides, tolerance=Config.SNAP_TOLERANCE, streams=streams, store=geoms,
+                                            progress=progress)
+    network = NetworkBuilder.map_rides_to_segments(network, rides, buffer_distance=Config.INTERSECTION_BUFFER, store=geoms,
+                                                   workers=Config.MATCH_WORKERS, progress=progress,
+                                                   index_path=index_dir(Config.CLEANED_RIDES, 'ride_parts'))
+    network = Elevation.add_to_network(network, store=geoms)
+    NetworkBuilder.save_network(network, Config.TRAIL_NETWORK)
+    if 'date' in rides.columns:
+        TimeCube.build(network, rides['date']).save(Config.TIME_CUBE)
+    RideSimilarity.build(network).save(Config.RIDE_SIMILARITY)
+
+
+def cmd_analyze(args):
+    from aoi_service import StudyArea
+    from network_layer import NetworkBuilder
+    from location_analysis import LocationAnalyzer
+    from spatial_index import analysis_indexes
+
+    require(Config.TRAIL_NETWORK, 'build-network')
+    study_area = StudyArea.load(Config.STUDY_AREA).frame()
+    network = NetworkBuilder.load_network(Config.TRAIL_NETWORK)
+
+    print("\n⚙️ Running suitability analysis...")
+    results = LocationAnalyzer.analyze(network, None, study_area, load_zones(), index_paths=analysis_indexes())
+    if results is not None:
+        LocationAnalyzer.save_results(results, Config.CANDIDATES)
+
+
+def cmd_render(args):
+    import folium
+    import geopandas as gpd
+    from aoi_service import StudyArea
+    from loader import DataLoader
+    from network_layer import NetworkBuilder
+    from base_map import BaseLayers
+    from trails_layer import TrailsLayers
+    from heatmap import HeatMapLayer
+    from stream_store import StreamStore
+    from layer_cache import LayerCache
+
+    require(Config.CLEANED_RIDES, 'build-network')
+    require(Config.TRAIL_NETWORK, 'build-network')
+    study_area = StudyArea.load(Config.STUDY_AREA).frame()
+    rides = DataLoader.load_rides(Config.CLEANED_RIDES)
+    network = NetworkBuilder.load_network(Config.TRAIL_NETWORK)
+    streams = StreamStore(Config.STREAM_STORE) if Config.STREAM_STORE.exists() else None
+
+    print("\n🗺️ Creating interactive map...")
+    bounds = study_area.total_bounds
+    center = [(bounds[1] + bounds[3]) / 2, (bounds[0] + bounds[2]) / 2]
+    m = BaseLayers.create_base_map(center, Config.DEFAULT_ZOOM)
+
+    # unchanged inputs => serialized layer from the cache, only changed layers are rebuilt
+    layers = LayerCache()
+    layers.add_to(m, 'study_area', lambda s: BaseLayers.add_study_area(s, study_area), study_area)
+    layers.add_to(m, 'trail_net', lambda s: TrailsLayers.add_trail_net(s, rides), rides)
+    layers.add_to(m, 'network', lambda s: TrailsLayers.add_trail_network(s, network, rides), network, rides)
+    layers.add_to(m, 'length', lambda s: TrailsLayers.add_rides_by_length(s, rides.copy()), rides)
+    layers.add_to(m, 'clusters', lambda s: HeatMapLayer.add_route_clusters(s, rides.copy(), Config.CLUSTER_DISTANCE), rides)
+    layers.add_to(m, 'heatmap', lambda s: HeatMapLayer.add_heatmap(s, rides, streams=streams),
+                  rides, streams.root if streams else None)
+    if Config.TIME_CUBE.exists():
+        from time_cube import TimeCube
+        cube = TimeCube.load(Config.TIME_CUBE)
+        layers.add_to(m, 'time', lambda s: TrailsLayers.add_time_slider(s, network, cube), network, cube)
+
+    if Config.CANDIDATES.exists():
+        candidates = gpd.read_file(Config.CANDIDATES)
+        layers.add_to(m, 'description', lambda s: BaseLayers.add_description(s, network, candidates), network, candidates)
+
+    folium.LayerControl(position='topright', collapsed=False).add_to(m)
+    BaseLayers.save_map(m, Config.OUTPUT_MAP)
+
+
+def cmd_stats(args):
+    from loader import DataLoader
+    from network_layer import NetworkBuilder
+
+    require(Config.CLEANED_RIDES, 'build-network')
+    require(Config.TRAIL_NETWORK, 'build-network')
+    stats(None, DataLoader.load_rides(Config.CLEANED_RIDES), NetworkBuilder.load_network(Config.TRAIL_NETWORK))
+
+
+def cmd_serve(args):
+    from query_service import serve
+
+    require(Config.CLEANED_RIDES, 'build-network')
+    require(Config.TRAIL_NETWORK, 'build-network')
+    serve(args.host, args.port)
+
+
+def cmd_serve_map(args):
+    from map_bundle import serve_static
+
+    serve_static(args.dir, args.host, args.port, throttle_kbps=args.throttle)
+
+
+def cmd_loops(args):
+    import time
+    import folium
+    from network_layer import NetworkBuilder
+    from base_map import BaseLayers
+    from route_planner import TrailGraph, RoutePlannerLayer
+
+    require(Config.TRAIL_NETWORK, 'build-network')
+    network = NetworkBuilder.load_network(Config.TRAIL_NETWORK)
+    graph = TrailGraph.from_network(network)
+
+    start = time.perf_counter()
+    loops = graph.loops(args.lat, args.lon, args.km, n=args.n)
+    print(f"\n🔁 {len(loops)} loops of ~{args.km:.0f} km in {(time.perf_counter() - start) * 1000:.0f} ms")
+    if not loops:
+        sys.exit("❌ No loop found - start point too far from the network or target distance too long")
+    for i, loop in enumerate(loops, 1):
+        print(f"  {i}. {loop['length_km']:.1f} km, {loop['rides_per_km']:.1f} rides/km, "
+              f"{loop['overlap'] * 100:.0f}% out and back ({len(loop['segment_ids'])} segments)")
+
+    m = BaseLayers.create_base_map([args.lat, args.lon], Config.DEFAULT_ZOOM)
+    RoutePlannerLayer.add_loops(m, loops, args.lat, args.lon, graph.crs, args.km)
+    folium.LayerControl(position='topright', collapsed=False).add_to(m)
+    BaseLayers.save_map(m, Config.LOOPS_MAP)
+
+
+def cmd_similar(args):
+    import pandas as pd
+    from ride_similarity import RideSimilarity
+
+    require(Config.RIDE_SIMILARITY, 'build-network')
+    index = RideSimilarity.load(Config.RIDE_SIMILARITY)
+    if args.ride is not None:
+        found = index.similar(args.ride, k=args.k, min_similarity=args.threshold or 0.0)
+        if not len(found):
+            sys.exit(f"❌ No similar rides for ride {args.ride} (unknown ride or no shared trails)")
+        print(f"\n🔎 Rides most similar to ride {args.ride}:")
+    elif args.duplicates:
+        found = index.near_duplicates(args.threshold or 0.9)
+        print(f"\n🔎 {len(found)} ride pairs on (almost) the same trails:")
+    else:
+        labels = index.clusters(args.threshold or 0.5)
+        members = labels[labels >= 0]
+        found = pd.DataFrame({'rides': members.groupby(members).size(),
+                              'example_rides': members.groupby(members).apply(lambda s: list(s.index[:5]))})
+        print(f"\n🔎 {len(found)} route clusters, {(labels < 0).sum()} rides without a cluster:")
+    print(found.head(args.k).to_string(index=args.ride is None and not args.duplicates))
+
+
+def cmd_all(args):
+    from pipeline import Pipeline
+
+    Config.ensure_directories()
+    force = {'enrich', 'suitability'} | ({'network'} if args.force else set())
+    Pipeline(workers=args.workers, use_processes=args.processes).run(['render', 'stats', 'similarity'], force=force,
+                                                                     progress=run_progress(args))
+
+
+def cmd_webhook(args):
+    import os
+    from strava_webhook import serve
+    from network_update import NetworkUpdater
+
+    Config.ensure_directories()
+    on_change = None if args.no_network else NetworkUpdater().apply
+    serve(args.host, args.port, verify_token=args.verify_token or os.getenv('STRAVA_VERIFY_TOKEN', 'mtb-planner'),
+          on_change=on_change, debounce=args.debounce, progress=run_progress(args),
+          subscription_id=args.subscription_id or os.getenv('STRAVA_SUBSCRIPTION_ID'),
+          owner_id=args.owner_id or os.getenv('STRAVA_OWNER_ID'))
+
+
+def cmd_regions(args):
+    from regions import Region, RegionBatch
+
+    profiles = Region.load_profiles(args.profiles)
+    unknown = [name for name in args.only or () if name not in profiles]
+    if unknown:
+        sys.exit(f"❌ Unknown region(s): {', '.join(unknown)} - choose from {', '.join(profiles)}")
+    regions = [profiles[name] for name in args.only] if args.only else list(profiles.values())
+    results = RegionBatch(regions, workers=args.workers).run(args.rides, force={'network'} if args.force else set(),
+                                                             progress=run_progress(args))
+    if any('error' in r for r in results.values()):
+        sys.exit(1)
+
+
+def cmd_run(args):
+    from pipeline import Pipeline
+
+    Config.ensure_directories()
+    pipeline = Pipeline(workers=args.workers, use_processes=args.processes)
+    unknown = [s for s in args.stage if s not in pipeline.stages]
+    if unknown:
+        sys.exit(f"❌ Unknown stage(s): {', '.join(unknown)} - choose from {', '.join(pipeline.stages)}")
+    pipeline.run(args.stage, force=set(pipeline.stages) if args.force else set(args.stage), progress=run_progress(args))
+
+
+COMMANDS = {
+    'ingest': (cmd_ingest, 'Download new Strava rides into the ride store'),
+    'build-network': (cmd_build_network, 'Enrich rides and build the trail network'),
+    'analyze': (cmd_analyze, 'Find and score trail center candidates'),
+    'render': (cmd_render, 'Create the interactive map from saved artifacts'),
+    'stats': (cmd_stats, 'Print a summary of the saved artifacts'),
+    'all': (cmd_all, 'Run build-network, analyze, render and stats'),
+    'serve': (cmd_serve, 'Local HTTP query service (bbox / nearest / radius)'),
+    'serve-map': (cmd_serve_map, 'Serve the saved maps with their .br/.gz variants'),
+    'run': (cmd_run, 'Run single pipeline stages, reusing saved artifacts'),
+    'loops': (cmd_loops, 'Suggest loops of a target distance on popular trails'),
+    'similar': (cmd_similar, 'Similar rides, near duplicates and route clusters (MinHash index)'),
+    'webhook': (cmd_webhook, 'Receive Strava push events, fetch only the changed rides'),
+    'regions': (cmd_regions, 'Run the analysis for every region profile in parallel'),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='mtb-planner', description='MTB trail center planner for Šumava')
+    parser.add_argument('--region', help='region profile from data/regions.json (default: Šumava from config.py)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (func, help_text) in COMMANDS.items():
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.set_defaults(func=func)
+        if name in ('build-network', 'all', 'regions'):
+            sub.add_argument('--force', action='store_true', help='rebuild the network even if it exists')
+        if name == 'build-network':
+            sub.add_argument('--tiled', action='store_true', help='out-of-core: one spatial tile at a time (bounded memory)')
+        if name in ('all', 'run'):
+            sub.add_argument('--workers', type=int, default=4, help='stages running at the same time')
+            sub.add_argument('--processes', action='store_true', help='run CPU heavy stages in a process pool')
+        if name in ('render', 'all', 'run', 'loops'):
+            sub.add_argument('--bundle', nargs='?', const='inline', choices=['inline', 'vendor'],
+                             help='offline map: assets inlined (default) or vendored to maps/assets, + .gz/.br')
+        if name in ('ingest', 'build-network', 'all', 'run', 'regions', 'webhook'):
+            sub.add_argument('--timeout', type=float, help='cancel after this many seconds (work saved so far is kept)')
+        if name == 'ingest':
+            sub.add_argument('--dir', help='import GPX/FIT files from this directory instead of the Strava API')
+            sub.add_argument('--workers', type=int, default=4, help='parser processes for --dir')
+        if name == 'serve':
+            sub.add_argument('--host', default='127.0.0.1')
+            sub.add_argument('--port', type=int, default=8765)
+        if name == 'serve-map':
+            sub.add_argument('--dir', help=f'folder with the maps (default {Config.OUTPUT_DIR})')
+            sub.add_argument('--host', default='127.0.0.1')
+            sub.add_argument('--port', type=int, default=8080)
+            sub.add_argument('--throttle', type=float, help='simulated connection speed in KB/s (e.g. 50 for slow 3G)')
+        if name == 'run':
+            sub.add_argument('--stage', action='append', required=True, help='stage to run (repeatable)')
+            sub.add_argument('--force', action='store_true', help='recompute saved inputs as well')
+        if name == 'loops':
+            sub.add_argument('--lat', type=float, required=True, help='start point (e.g. a car park)')
+            sub.add_argument('--lon', type=float, required=True)
+            sub.add_argument('--km', type=float, default=30, help='target loop distance')
+            sub.add_argument('--n', type=int, default=5, help='number of loop suggestions')
+        if name == 'similar':
+            sub.add_argument('--ride', type=int, help='ride label (row in rides_cleaned) to find similar rides for')
+            sub.add_argument('--duplicates', action='store_true', help='list near duplicate ride pairs')
+            sub.add_argument('--clusters', action='store_true', help='group rides into route clusters (default)')
+            sub.add_argument('--threshold', type=float, help='minimum similarity (default 0.9 duplicates, 0.5 clusters)')
+            sub.add_argument('--k', type=int, default=10, help='rides to show')
+        if name == 'webhook':
+            sub.add_argument('--host', default='127.0.0.1', help='behind a tunnel / reverse proxy Strava can reach')
+            sub.add_argument('--port', type=int, default=8766)
+            sub.add_argument('--verify-token', help='subscription verify token (default $STRAVA_VERIFY_TOKEN)')
+            sub.add_argument('--subscription-id', type=int,
+                             help='only events of this push subscription are queued (default $STRAVA_SUBSCRIPTION_ID)')
+            sub.add_argument('--owner-id', type=int, help='only events of this athlete (default $STRAVA_OWNER_ID)')
+            sub.add_argument('--debounce', type=float, help=f'seconds to collect events (default {Config.WEBHOOK_DEBOUNCE_S})')
+            sub.add_argument('--no-network', action='store_true', help='only update the ride store')
+        if name == 'regions':
+            sub.add_argument('--profiles', help='region profiles JSON (default data/regions.json)')
+            sub.add_argument('--only', action='append', help='region to run (repeatable, default: all profiles)')
+            sub.add_argument('--rides', help='shared ride archive to split by AOI (default Config.STRAVA_RIDES)')
+            sub.add_argument('--workers', type=int, default=2, help='regions processed at the same time')
+    return parser
+
+
+def main(argv=None):
+    from progress import Cancelled
+
+    args = build_parser().parse_args(argv)
+    if args.region:
+        from regions import Region
+        try:
+            Region.get(args.region).apply()
+        except (FileNotFoundError, KeyError) as e:
+            sys.exit(e.args[0])
+    if getattr(args, 'bundle', None):
+        Config.MAP_BUNDLE = args.bundle
+    try:
+        args.func(args)
+    except Cancelled as e:
+        sys.exit(f"⛔ {args.command} cancelled ({e})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import json
+import sys
+from pathlib import Path
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+
+#per segment elevation profile from a local DEM (GeoTIFF, Config.DEM)
+#
+#the GeoTIFF is converted once (window by window, needs rasterio) into a raw .npy + meta.json next to it;
+#after that the raster is opened with mmap_mode='r' - sampling the network only reads the pages it touches,
+#rasterio is not needed any more.
+#
+#every segment is sampled every Config.DEM_SAMPLE_STEP meters in one vectorized pass (bilinear) =>
+#ascent_m, descent_m, max_gradient_pct, avg_gradient_pct, difficulty
+
+class DEM:
+    def __init__(self, elevation, transform, crs, nodata=None):
+        self.elevation = elevation  # (rows, cols) float32, usually a read only memmap
+        self.transform = transform  # GDAL order: x0, dx, rx, y0, ry, dy
+        self.crs = CRS.from_user_input(crs)
+        self.nodata = nodata
+
+    # === CONVERT ONCE ===
+    @staticmethod
+    def prepare(tif_path=None, cache_dir=None):
+        #GeoTIFF -> elevation.npy + meta.json, skipped while the cache is newer than the GeoTIFF
+        tif_path = Path(tif_path or Config.DEM)
+        cache_dir = Path(cache_dir or Config.DEM_CACHE)
+        npy, meta = cache_dir / 'elevation.npy', cache_dir / 'meta.json'
+        if npy.exists() and meta.exists() and npy.stat().st_mtime >= tif_path.stat().st_mtime:
+            return cache_dir
+
+        try:
+            import rasterio
+        except ImportError:
+            raise ImportError("❌ rasterio is needed once to convert the DEM GeoTIFF (pip install rasterio)")
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with rasterio.open(tif_path) as src:
+            out = np.lib.format.open_memmap(npy, mode='w+', dtype=np.float32, shape=(src.height, src.width))
+            for _, window in src.block_windows(1):  # one block at a time - bounded memory
+                block = src.read(1, window=window).astype(np.float32)
+                if src.nodata is not None:
+                    block[block == src.nodata] = np.nan
+                out[window.row_off:window.row_off + window.height, window.col_off:window.col_off + window.width] = block
+            out.flush()
+            del out
+            meta.write_text(json.dumps({'transform': list(src.transform.to_gdal()), 'crs': src.crs.to_wkt()}))
+
+        print(f"✓ DEM converted: {tif_path} -> {npy}")
+        return cache_dir
+
+    @staticmethod
+    def load(tif_path=None, cache_dir=None):
+        #None when there is no DEM at all - elevation is optional
+        tif_path = Path(tif_path or Config.DEM)
+        cache_dir = Path(cache_dir or Config.DEM_CACHE)
+        if tif_path.exists():
+            DEM.prepare(tif_path, cache_dir)
+        if not (cache_dir / 'elevation.npy').exists():
+            return None
+        meta = json.loads((cache_dir / 'meta.json').read_text())
+        return DEM(np.load(cache_dir / 'elevation.npy', mmap_mode='r'), meta['transform'], meta['crs'])
+
+    # === SAMPLING ===
+    def sample(self, x, y):
+        #bilinear elevation at x/y (DEM CRS) - NaN outside the raster or on nodata
+        x0, dx, _, y0, _, dy = self.transform
+        col = (np.asarray(x) - x0) / dx - 0.5  # pixel centers
+        row = (np.asarray(y) - y0) / dy - 0.5
+        rows, cols = self.elevation.shape
+
+        inside = (col >= 0) & (row >= 0) & (col <= cols - 1) & (row <= rows - 1)
+        z = np.full(col.shape, np.nan, dtype=np.float64)
+        c, r = col[inside], row[inside]
+        c0 = np.minimum(np.floor(c).astype(np.int64), cols - 2 if cols > 1 else 0)
+        r0 = np.minimum(np.floor(r).astype(np.int64), rows - 2 if rows > 1 else 0)
+        fc, fr = c - c0, r - r0
+        c1, r1 = np.minimum(c0 + 1, cols - 1), np.minimum(r0 + 1, rows - 1)
+
+        # fancy indexing on the memmap reads only the touched pages
+        e = self.elevation
+        z[inside] = (e[r0, c0] * (1 - fc) * (1 - fr) + e[r0, c1] * fc * (1 - fr) +
+                     e[r1, c0] * (1 - fc) * fr + e[r1, c1] * fc * fr)
+        return z
+
+
+class Elevation:
+    @staticmethod
+    def segment_profiles(geoms, dem, geoms_crs, step=None):
+        #metric line geometries -> dict of per segment arrays
+        step = step or Config.DEM_SAMPLE_STEP
+        geoms = np.asarray(geoms, dtype=object)
+        lengths = shapely.length(geoms)
+
+        # sample positions: 0, step, 2*step ... length for every segment, flattened
+        n = np.maximum(np.ceil(lengths / step).astype(np.int64), 1) + 1
+        seg = np.repeat(np.arange(len(geoms)), n)
+        first = np.cumsum(n) - n
+        k = np.arange(n.sum()) - np.repeat(first, n)
+        dist = np.minimum(k * step, lengths[seg])
+
+        points = shapely.line_interpolate_point(geoms[seg], dist)
+        x, y = shapely.get_x(points), shapely.get_y(points)
+        if CRS.from_user_input(geoms_crs) != dem.crs:
+            x, y = Transformer.from_crs(geoms_crs, dem.crs, always_xy=True).transform(x, y)
+        z = dem.sample(x, y)
+
+        # consecutive samples of the same segment
+        same = seg[1:] == seg[:-1]
+        dz = np.where(same, np.diff(z), np.nan)
+        ds = np.where(same, np.diff(dist), np.nan)
+        pair_seg = seg[:-1]
+        valid = ~np.isnan(dz) & (ds > 0)
+
+        ascent = np.bincount(pair_seg[valid], weights=np.maximum(dz[valid], 0), minlength=len(geoms))
+        descent = np.bincount(pair_seg[valid], weights=np.maximum(-dz[valid], 0), minlength=len(geoms))
+        gradient = np.zeros(len(geoms))
+        np.maximum.at(gradient, pair_seg[valid], np.abs(dz[valid] / ds[valid]) * 100)
+
+        has_z = np.bincount(seg, weights=~np.isnan(z), minlength=len(geoms)) > 0
+        z_min = np.full(len(geoms), np.nan)
+        z_max = np.full(len(geoms), np.nan)
+        np.fmin.at(z_min, seg, z)
+        np.fmax.at(z_max, seg, z)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_gradient = np.where(lengths > 0, (ascent + descent) / lengths * 100, 0)
+
+        profile = {
+            'elev_min_m': z_min,
+            'elev_max_m': z_max,
+            'ascent_m': ascent,
+            'descent_m': descent,
+            'max_gradient_pct': gradient,
+            'avg_gradient_pct': avg_gradient,
+        }
+        for key in ('ascent_m', 'descent_m', 'max_gradient_pct', 'avg_gradient_pct'):
+            profile[key] = np.where(has_z, profile[key], np.nan)
+        profile['difficulty'] = Elevation.difficulty(profile['max_gradient_pct'])
+        return profile
+
+    @staticmethod
+    def difficulty(max_gradient_pct):
+        #Config.DIFFICULTY_GRADES = upper max gradient [%] per class, anything steeper is the last class
+        names = list(Config.DIFFICULTY_GRADES) + ['Extreme']
+        classes = np.array(names, dtype=object)[np.searchsorted(list(Config.DIFFICULTY_GRADES.values()),
+                                                                np.nan_to_num(max_gradient_pct), side='right')]
+        classes[np.isnan(max_gradient_pct)] = 'Unknown'
+        return classes
+
+    @staticmethod
+    def add_to_network(network, dem=None, store=None):
+        #adds the profile columns to the network (in place) - no DEM => network unchanged
+        from geometry_store import GeometryStore
+
+        dem = dem if dem is not None else DEM.load()
+        if dem is None:
+            return network
+        store = GeometryStore.ensure(store, network=network)
+        for column, values in Elevation.segment_profiles(store.metric('network').values, dem, store.metric_crs).items():
+            network[column] = values
+        print(f"✓ Elevation profile for {len(network)} segments "
+              f"({np.nansum(network['ascent_m']) / 1000:.1f} km of climbing)")
+        return network
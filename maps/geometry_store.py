@@ -0,0 +1,58 @@
+import geopandas as gpd
+from pyproj import CRS
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+
+#projected copies of every layer (rides, network, zones...) computed once per run and shared by all stages
+#metric (UTM, meters) for lengths/buffers/clustering, display (EPSG:4326) for the map
+#a copy in a CRS is only projected on first access
+
+class GeometryStore:
+    def __init__(self, metric_crs=None, display_crs='EPSG:4326'):
+        self.metric_crs = GeometryStore._key(metric_crs or Config.METRIC_CRS)
+        self.display_crs = GeometryStore._key(display_crs)
+        self._geoms = {}  # name -> {crs: GeoSeries}
+
+    @staticmethod
+    def _key(crs):
+        return CRS.from_user_input(crs).to_string()
+
+    @staticmethod
+    def ensure(store=None, **frames):
+        #stages take store=None - without one they get a private store (same result, no sharing)
+        store = store if store is not None else GeometryStore()
+        for name, gdf in frames.items():
+            if gdf is not None and name not in store:
+                store.register(name, gdf)
+        return store
+
+    def __contains__(self, name):
+        return name in self._geoms
+
+    def register(self, name, gdf, metric=None):
+        #(re)register a layer - drops copies of an older version; metric = already projected geometry if at hand
+        self._geoms[name] = {GeometryStore._key(gdf.crs): gdf.geometry}
+        if metric is not None:
+            self._geoms[name][GeometryStore._key(metric.crs)] = metric
+
+    def get(self, name, crs):
+        copies = self._geoms[name]
+        crs = GeometryStore._key(crs)
+        if crs not in copies:
+            source = next(iter(copies.values()))
+            copies[crs] = source.to_crs(crs)
+        return copies[crs]
+
+    def metric(self, name):
+        return self.get(name, self.metric_crs)
+
+    def display(self, name):
+        return self.get(name, self.display_crs)
+
+    def metric_frame(self, name, frame):
+        #attributes of frame + cached metric geometry (no reprojection)
+        geometry = self.metric(name)
+        return gpd.GeoDataFrame(frame.drop(columns=frame.geometry.name), geometry=geometry.values,
+                                crs=geometry.crs, index=frame.index)
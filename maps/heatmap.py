@@ -6,15 +6,21 @@ import pandas as pd
 from pathlib import Path
 from sklearn.cluster import DBSCAN
 import numpy as np
-from shapely.geometry import Point
+import shapely
+from geometry_store import GeometryStore
 
 class HeatMapLayer:
     @staticmethod
-    def add_heatmap(m, rides):
+    def add_heatmap(m, rides, streams=None):
         heat_data = []
         
         for _, ride in rides.iterrows():
-            if ride.geometry:
+            # full resolution stream - sample the memory mapped slice directly, no shapely objects
+            if streams is not None and ride.get('activity_id') in streams:
+                coords = streams.coords(ride['activity_id'])
+                idx = np.linspace(0, len(coords) - 1, 30).astype(int)
+                heat_data.extend(coords[idx][:, ::-1].tolist())  # lon, lat -> lat, lon
+            elif ride.geometry:
                 # Sample points along route
                 length = ride.geometry.length
                 for i in range(30):
@@ -37,7 +43,7 @@ class HeatMapLayer:
             print(f"add heatmap layer")
     
     @staticmethod
-    def add_route_clusters(m, rides, distance_threshold=1000):
+    def add_route_clusters(m, rides, distance_threshold=1000, store=None):
         """
         Cluster rides by start-point proximity with CLEAR popularity labels
         """
@@ -47,20 +53,11 @@ class HeatMapLayer:
             print("⚠️ No valid start points for clustering")
             return
 
-        # Convert to GeoSeries
-        start_points = gpd.GeoSeries(
-            [Point(p) for p in rides_valid["start_point"]],
-            crs=rides.crs
-        )
-
-        # Project to meters for accurate distance calculation
-        start_points_proj = start_points.to_crs("EPSG:32633")
-
-        # Extract coordinates
-        coords = np.column_stack([
-            start_points_proj.x,
-            start_points_proj.y
-        ])
+        # Start points in meters = first vertex of the projected rides (no extra reprojection)
+        store = GeometryStore.ensure(store, rides=rides)
+        rides_proj = store.metric('rides')[rides["start_point"].notna()].values
+        first_lines = np.where(shapely.get_type_id(rides_proj) == 1, rides_proj, shapely.get_geometry(rides_proj, 0))
+        coords = shapely.get_coordinates(shapely.get_point(first_lines, 0))
 
         # DBSCAN clustering
         db = DBSCAN(
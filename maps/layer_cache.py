@@ -0,0 +1,158 @@
+import hashlib
+import json
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import shapely
+import folium
+from branca.element import Element, MacroElement
+from folium.map import Layer
+from geopandas.array import GeometryDtype
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+
+#serialized map layers cached on disk - render only rebuilds the layers whose inputs changed
+#
+#a layer is built on a private map, its children are rendered once and the pieces folium puts into the page
+#(header links, html, script) are saved as JSON under a fingerprint of
+#   layer name + input data + Config + source of the layer modules + folium version
+#next time the fingerprint matches, the saved pieces are spliced into the real map (LayerFragment) and the
+#layer code does not run at all. LayerStub keeps every cached overlay in the LayerControl.
+
+LAYER_SOURCES = ['base_map.py', 'trails_layer.py', 'heatmap.py', 'layer_cache.py']
+VERSIONS_KEPT = 3  # fingerprints kept per layer (e.g. cli render and the pipeline see slightly different frames)
+
+
+class LayerFragment(MacroElement):
+    #pre-rendered header/html/script of one layer, the sink map name replaced by the real one
+    def __init__(self, entry):
+        super().__init__()
+        self._name = 'LayerFragment'
+        self.entry = entry
+
+    def render(self, **kwargs):
+        figure = self.get_root()
+        map_name = self._parent.get_name()
+        for section in ('header', 'html', 'script'):
+            for name, text in self.entry[section]:
+                getattr(figure, section).add_child(Element(text.replace(self.entry['map_name'], map_name)), name=name)
+
+
+class LayerStub(Layer):
+    #LayerControl entry of a cached layer - the layer itself is created by the LayerFragment script
+    def __init__(self, var_name, name, overlay, control, show):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self.var_name = var_name
+
+    def get_name(self):
+        return self.var_name
+
+    def render(self, **kwargs):
+        pass
+
+
+class LayerCache:
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir or Config.LAYER_CACHE)
+        self._digests = {}  # id(frame) -> (frame, digest) - the same rides frame feeds several layers
+        self._sources = None
+
+    # === FINGERPRINT ===
+    def _digest(self, value):
+        key = id(value)
+        if key in self._digests and self._digests[key][0] is value:
+            return self._digests[key][1]
+
+        h = hashlib.blake2b(digest_size=16)
+        if value is None:
+            h.update(b'none')
+        elif isinstance(value, pd.DataFrame):
+            h.update(repr((list(value.columns), str(getattr(value, 'crs', None)))).encode())
+            h.update(pd.util.hash_pandas_object(value.index).to_numpy().tobytes())
+            for column in value.columns:
+                series = value[column]
+                if isinstance(series.dtype, GeometryDtype):
+                    h.update(b''.join(shapely.to_wkb(series.values)))
+                    continue
+                try:
+                    h.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+                except TypeError:  # lists / dicts (network 'rides')
+                    h.update(pd.util.hash_pandas_object(series.astype(str), index=False).to_numpy().tobytes())
+        elif isinstance(value, Path):
+            # file or directory (stream store) - size + mtime of every file
+            files = sorted(value.rglob('*')) if value.is_dir() else [value]
+            h.update(repr([(str(f), f.stat().st_size, f.stat().st_mtime_ns) for f in files if f.exists()]).encode())
+        elif hasattr(value, '__dict__') and any(isinstance(v, np.ndarray) for v in vars(value).values()):
+            for name, array in sorted(vars(value).items()):  # e.g. TimeCube
+                h.update(name.encode())
+                h.update(np.ascontiguousarray(array).tobytes() if isinstance(array, np.ndarray) else repr(array).encode())
+        else:
+            h.update(repr(value).encode())
+
+        digest = h.hexdigest()
+        self._digests[key] = (value, digest)
+        return digest
+
+    def fingerprint(self, name, *inputs):
+        if self._sources is None:
+            maps_dir = Path(__file__).parent
+            self._sources = hashlib.blake2b(b''.join((maps_dir / f).read_bytes() for f in LAYER_SOURCES),
+                                            digest_size=16).hexdigest()
+        config = repr(sorted((k, repr(v)) for k, v in vars(Config).items() if k.isupper()))
+        h = hashlib.blake2b(digest_size=16)
+        for part in [name, folium.__version__, self._sources, config] + [self._digest(v) for v in inputs]:
+            h.update(part.encode())
+        return h.hexdigest()
+
+    # === CAPTURE / SPLICE ===
+    @staticmethod
+    def _capture(sink, fingerprint):
+        figure = sink.get_root()
+        children = list(sink._children.values())
+        for child in children:
+            child.render()
+        return {
+            'fingerprint': fingerprint,
+            'map_name': sink.get_name(),
+            'header': [[n, e.render()] for n, e in figure.header._children.items()],
+            'html': [[n, e.render()] for n, e in figure.html._children.items()],
+            'script': [[n, e.render()] for n, e in figure.script._children.items()],
+            'layers': [{'var_name': c.get_name(), 'name': c.layer_name, 'overlay': c.overlay,
+                        'control': c.control, 'show': c.show} for c in children if isinstance(c, Layer)],
+        }
+
+    @staticmethod
+    def _from_entry(entry):
+        sink = folium.Map(tiles=None)
+        sink.add_child(LayerFragment(entry))
+        for layer in entry['layers']:
+            sink.add_child(LayerStub(**layer))
+        return sink
+
+    def sink(self, name, build, *inputs):
+        #private map with the layer (cached or freshly built) - build(m) adds the layer to m
+        fingerprint = self.fingerprint(name, *inputs)
+        path = self.cache_dir / f'{name}-{fingerprint}.json'
+        if path.exists():
+            path.touch()  # most recently used - survives pruning
+            print(f"   ♻️ {name} layer from cache")
+            return self._from_entry(json.loads(path.read_text()))
+
+        sink = folium.Map(tiles=None)
+        build(sink)
+        entry = self._capture(sink, fingerprint)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(entry))
+        tmp.replace(path)  # a crashed run never leaves half a fragment behind
+
+        versions = sorted(self.cache_dir.glob(f'{name}-*.json'), key=lambda p: p.stat().st_mtime_ns)
+        for old in versions[:-VERSIONS_KEPT]:
+            old.unlink(missing_ok=True)
+        return self._from_entry(entry)
+
+    def add_to(self, m, name, build, *inputs):
+        for child in list(self.sink(name, build, *inputs)._children.values()):
+            m.add_child(child)
+
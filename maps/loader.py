@@ -1,20 +1,27 @@
-import folium
-from folium.plugins import MarkerCluster, HeatMap, MiniMap, Fullscreen
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
 from config import Config
-from trails_layer import TrailsLayers
-from heatmap import HeatMapLayer
+from aoi_service import StudyArea
+from geometry_store import GeometryStore
+from coord_arrays import arrays_from_lines, lines_from_offsets
 
 class DataLoader:
     @staticmethod
     def load_data(study_area_path, rides_path):
         
-        study_area = gpd.read_file(study_area_path)
-        rides = gpd.read_file(rides_path)
+        study_area = StudyArea.load(study_area_path).frame()
+
+        # ride store GPKG (preprocessing/ride_store.py) also holds start points - read the rides layer only
+        layer = None
+        if str(rides_path).endswith('.gpkg') and 'rides' in gpd.list_layers(rides_path)['name'].values:
+            layer = 'rides'
+        rides = gpd.read_file(rides_path, layer=layer)
         
         # Ensure matching CRS
         if study_area.crs != rides.crs:
@@ -33,11 +40,165 @@ class DataLoader:
             print("No 'name' column found")
         return rides
     
+    # === TRACK CLEANING ===
+    @staticmethod
+    def clean_coords(coords, part_of, times=None):
+        #all tracks at once: coords (n, 2) in meters, part_of = track index per vertex (grouped),
+        #times = seconds per vertex (-1 = unknown) or None
+        #-> kept vertex positions, new part index per kept vertex (jumps split a track), removed counts
+        part_of = np.asarray(part_of)
+        idx = np.arange(len(coords))
+        max_speed = Config.CLEAN_MAX_SPEED_KMH / 3.6
+        report = {}
+
+        def steps(ix):
+            # distance to the previous kept vertex of the same part, inf at part starts
+            d = np.full(len(ix), np.inf)
+            if len(ix) > 1:
+                same = part_of[ix[1:]] == part_of[ix[:-1]]
+                d[1:] = np.where(same, np.hypot(*(coords[ix[1:]] - coords[ix[:-1]]).T), np.inf)
+            return d
+
+        def speeds(ix, d):
+            # m/s from the previous vertex, nan without usable timestamps
+            v = np.full(len(ix), np.nan)
+            if times is not None and len(ix) > 1:
+                dt = (times[ix[1:]] - times[ix[:-1]]).astype(np.float64)
+                ok = (times[ix[1:]] >= 0) & (times[ix[:-1]] >= 0) & (dt > 0)
+                v[1:][ok] = d[1:][ok] / dt[ok]
+                # mostly "too fast" => the clock is off (resampled / made up timestamps), not the positions
+                fast = np.bincount(part_of[ix], weights=v > max_speed, minlength=part_of.max() + 1)
+                timed = np.bincount(part_of[ix], weights=np.isfinite(v), minlength=part_of.max() + 1)
+                v[fast[part_of[ix]] > 0.5 * timed[part_of[ix]]] = np.nan
+            return v
+
+        # 1. duplicate points
+        keep = steps(idx) >= Config.CLEAN_MIN_STEP_M
+        report['duplicates'] = int((~keep).sum())
+        idx = idx[keep]
+
+        def median_step(ix, d):
+            # median step of the part every vertex belongs to (its sampling distance)
+            part, ok = part_of[ix], np.isfinite(d)
+            counts = np.bincount(part[ok], minlength=part_of.max() + 1)
+            if not ok.any():
+                return np.zeros(len(ix))
+            ordered = d[ok][np.lexsort((d[ok], part[ok]))]
+            mid = np.cumsum(counts) - counts + (counts - 1) // 2
+            return np.where(counts > 0, ordered[np.clip(mid, 0, len(ordered) - 1)], 0.0)[part]
+
+        # 2. spikes - far out and straight back (or too fast in and out); both legs must also be much longer
+        #    than the track's usual step - at summary polyline spacing a turnaround looks the same
+        d_in = steps(idx)
+        d_out = np.append(d_in[1:], np.inf)
+        inner = np.isfinite(d_in) & np.isfinite(d_out)
+        across = np.full(len(idx), np.inf)
+        across[1:-1] = np.hypot(*(coords[idx[2:]] - coords[idx[:-2]]).T)
+        shortest = np.minimum(d_in, d_out)
+        long_legs = shortest > np.maximum(Config.CLEAN_SPIKE_M, Config.CLEAN_SPIKE_STEP_FACTOR * median_step(idx, d_in))
+        spike = inner & long_legs & (across < 0.5 * shortest)
+        report['spikes'] = int(spike.sum())
+        v_in = speeds(idx, d_in)
+        v_out = np.append(v_in[1:], np.nan)
+        too_fast = inner & ~spike & (v_in > max_speed) & (v_out > max_speed)
+        report['speed'] = int(too_fast.sum())
+        idx = idx[~(spike | too_fast)]
+
+        # 3. pause clusters - track stays within a few meters over 2 * CLEAN_PAUSE_POINTS vertices
+        #    (every step in between short as well - an out-and-back also comes back to where it was)
+        k = Config.CLEAN_PAUSE_POINTS
+        pause = np.zeros(len(idx), dtype=bool)
+        if len(idx) > 2 * k:
+            a, b = idx[:-2 * k], idx[2 * k:]
+            longest = np.lib.stride_tricks.sliding_window_view(steps(idx)[1:], 2 * k).max(axis=1)
+            still = (part_of[a] == part_of[b]) & (np.hypot(*(coords[b] - coords[a]).T) < Config.CLEAN_PAUSE_RADIUS_M)
+            pause[k:-k] = still & (longest < 2 * Config.CLEAN_PAUSE_RADIUS_M)
+        report['pause'] = int(pause.sum())
+        idx = idx[~pause]
+
+        # 4. jumps (GPS lost, teleport) - the track is split instead of drawing a straight line
+        d = steps(idx)
+        jump = np.isfinite(d) & ((d > Config.CLEAN_MAX_JUMP_M) | (speeds(idx, d) > max_speed))
+        report['splits'] = int(jump.sum())
+        new_part = np.cumsum(~np.isfinite(d) | jump) - 1
+        return idx, new_part, report
+
+    @staticmethod
+    def lines_per_track(coords, new_part, track_of_part, n_tracks):
+        #cleaned parts -> one LineString / MultiLineString per track (None when nothing is left)
+        lines = lines_from_offsets(coords, np.append(0, np.cumsum(np.bincount(new_part))))
+        valid = np.array([line is not None for line in lines], dtype=bool)
+        tracks = np.full(n_tracks, None, dtype=object)
+        if not valid.any():
+            return tracks
+        owner = track_of_part[valid]
+        parts_per_track = np.bincount(owner, minlength=n_tracks)
+        single = parts_per_track[owner] == 1
+        tracks[owner[single]] = lines[valid][single]
+        multi = np.unique(owner[~single])
+        if len(multi):
+            tracks[multi] = shapely.multilinestrings(lines[valid][~single], indices=np.searchsorted(multi, owner[~single]))
+        return tracks
+
+    @staticmethod
+    def clip_to_aoi(tracks, aoi):
+        #AOI: inside as is, crossing => intersection (lines only), outside => None
+        inside = shapely.contains(aoi, tracks)
+        crossing = ~inside & shapely.intersects(aoi, tracks)
+        clipped = np.where(inside, tracks, None)
+        if crossing.any():
+            cut = shapely.intersection(tracks[crossing], aoi)
+            parts, owner = shapely.get_parts(cut, return_index=True)
+            lines = shapely.get_type_id(parts) == 1
+            clipped[np.flatnonzero(crossing)] = DataLoader.lines_per_track(
+                shapely.get_coordinates(parts[lines]),
+                np.repeat(np.arange(lines.sum()), shapely.get_num_coordinates(parts[lines])),
+                owner[lines], crossing.sum())
+        return clipped
+
     @staticmethod
-    def calculate_km(rides):
+    def clean_tracks(rides, aoi=None, store=None, first_label=0):
+        #duplicates, spikes, pause clusters and jumps out of every ride (one vectorized pass), then clip to the AOI
+        #before unary_union sees the tracks - fewer vertices, less noise in the network
+        #rides are relabelled first_label.. (= row positions once saved - the network refers to rides by label)
+        store = GeometryStore.ensure(store, rides=rides)
+        metric = store.metric('rides')
+        if aoi is None:
+            aoi = StudyArea.load(Config.STUDY_AREA).geometry(store.metric_crs)
+
+        parts, ride_of_part = shapely.get_parts(metric.values, return_index=True)
+        coords, offsets = arrays_from_lines(parts)
+        part_of = np.repeat(np.arange(len(parts)), np.diff(offsets))
+        kept, new_part, report = DataLoader.clean_coords(coords, part_of)
+
+        # new part -> original part -> ride
+        first = np.flatnonzero(np.r_[True, np.diff(new_part) != 0])
+        track_of_part = ride_of_part[part_of[kept[first]]]
+        cleaned = DataLoader.lines_per_track(coords[kept], new_part, track_of_part, len(rides))
+
+        clipped = DataLoader.clip_to_aoi(cleaned, aoi)
+        report['outside_aoi'] = int(shapely.get_num_coordinates(cleaned).sum() - shapely.get_num_coordinates(clipped).sum())
+
+        valid = pd.notna(clipped)
+        labels = pd.RangeIndex(first_label, first_label + valid.sum())
+        metric_clean = gpd.GeoSeries(clipped[valid], index=labels, crs=metric.crs)
+        rides = rides[valid].set_axis(labels)
+        rides['geometry'] = metric_clean.to_crs(rides.crs).values
+        store.register('rides', rides, metric=metric_clean)
+
+        total = len(coords)
+        removed = total - int(shapely.get_num_coordinates(metric_clean.values).sum())
+        print(f"   ✓ Cleaned tracks: {total:,} → {total - removed:,} vertices (-{removed / max(total, 1):.0%}): "
+              f"{report['duplicates']:,} duplicates, {report['spikes']:,} spikes, {report['speed']:,} too fast, "
+              f"{report['pause']:,} pause, {report['outside_aoi']:,} outside AOI, {report['splits']:,} jumps split, "
+              f"{(~valid).sum()} rides dropped")
+        return rides
+
+    @staticmethod
+    def calculate_km(rides, store=None):
         # Calculate length in km - importnat!
-        rides_proj = rides.to_crs("EPSG:32633")
-        rides["distance_km"] = rides_proj.geometry.length / 1000
+        store = GeometryStore.ensure(store, rides=rides)
+        rides["distance_km"] = store.metric('rides').length / 1000
         
         # Helper func for start/end extraction
         def get_start_point(geom):
@@ -98,3 +259,30 @@ class DataLoader:
         print(f" Enriched {len(rides)} rides")
         return rides
 
+    @staticmethod
+    def save_rides(rides, output_path, mode='w'):
+        #enriched rides -> GPKG; start/end tuples are stored as plain x/y columns (mode='a' appends a chunk)
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        rides_save = rides.drop(columns=['start_point', 'end_point', 'length_category'], errors='ignore')
+        for col in ['start_point', 'end_point']:
+            if col in rides.columns:
+                valid = rides[col].notna()
+                rides_save[f'{col}_x'] = rides[col].where(valid).map(lambda p: p[0] if p else None)
+                rides_save[f'{col}_y'] = rides[col].where(valid).map(lambda p: p[1] if p else None)
+        rides_save.to_file(output_path, driver='GPKG', mode=mode)
+        print(f"   ✓ Saved {len(rides)} enriched rides to {output_path}")
+
+    @staticmethod
+    def load_rides(path):
+        #inverse of save_rides - no need to enrich again
+        rides = gpd.read_file(path)
+        for col in ['start_point', 'end_point']:
+            if f'{col}_x' in rides.columns:
+                rides[col] = [
+                    (x, y) if pd.notna(x) else None
+                    for x, y in zip(rides.pop(f'{col}_x'), rides.pop(f'{col}_y'))
+                ]
+        print(f"   ✓ Loaded {len(rides)} enriched rides")
+        return rides
@@ -1,10 +1,12 @@
 import geopandas as gpd
 import numpy as np
+import shapely
 from shapely.geometry import Point
 from sklearn.cluster import DBSCAN
 import pandas as pd
 from pathlib import Path
-import folium
+from geometry_store import GeometryStore
+from spatial_index import PackedRTree
 
 #Trail center suitability analysis - finding the best location based on:
 
@@ -47,36 +49,48 @@ class LocationAnalyzer:
                 'cluster_traffic': cluster_segs['ride_count'].sum()
             })
         
-        return gpd.GeoDataFrame(candidates, crs="EPSG:32633", geometry='geometry')
+        return gpd.GeoDataFrame(candidates, crs=network_proj.crs, geometry='geometry')
     
     @staticmethod
-    def calculate_trail_access(candidates, network_proj, radius_m=5000):
-        #Count trails within radius of each candidate
-        for col in ['trail_count', 'trail_length_km', 'total_rides']:
-            candidates[col] = 0
-        
-        for idx, candidate in candidates.iterrows():
-            buffer = candidate.geometry.buffer(radius_m)
-            nearby = network_proj[network_proj.geometry.intersects(buffer)]
-            
-            candidates.at[idx, 'trail_count'] = len(nearby)
-            candidates.at[idx, 'trail_length_km'] = nearby['distance_km'].sum()
-            candidates.at[idx, 'total_rides'] = nearby['ride_count'].sum()
+    def _tree(geometries, index_path=None):
+        #R-tree persisted at index_path (reused while the geometries are unchanged), else built in memory
+        return PackedRTree.cached(geometries, index_path) if index_path else PackedRTree.from_geometries(geometries)
+
+    @staticmethod
+    def calculate_trail_access(candidates, network_proj, radius_m=5000, index_path=None):
+        #Count trails within radius of each candidate - one R-tree query for all candidates
+        tree = LocationAnalyzer._tree(network_proj.geometry.values, index_path)
+        cand, seg = tree.query(shapely.buffer(candidates.geometry.values, radius_m), predicate='intersects')
+        n = len(candidates)
+        km = np.bincount(cand, weights=network_proj['distance_km'].to_numpy()[seg], minlength=n)
+
+        candidates['trail_count'] = np.bincount(cand, minlength=n)
+        candidates['total_rides'] = np.bincount(cand, weights=network_proj['ride_count'].to_numpy()[seg], minlength=n).astype(int)
+        candidates['trail_length_km'] = km
+        if 'ascent_m' in network_proj.columns:
+            # climbing per km of trail around - flat areas make poor MTB trail centers
+            # (per km of segments with elevation data - NaN where the DEM covers none of them)
+            seg_ascent = network_proj['ascent_m'].to_numpy(dtype=float)[seg]
+            has_dem = ~np.isnan(seg_ascent)
+            ascent = np.bincount(cand[has_dem], weights=seg_ascent[has_dem], minlength=n)
+            dem_km = np.bincount(cand[has_dem], weights=network_proj['distance_km'].to_numpy()[seg][has_dem], minlength=n)
+            candidates['climb_m_per_km'] = np.divide(ascent, dem_km, out=np.full(n, np.nan), where=dem_km > 0)
         
         return candidates
     
     @staticmethod
-    def check_environmental_constraints(candidates, zones_proj):
+    def check_environmental_constraints(candidates, zones_proj, index_path=None):
         #Checking if candidates fall in prohibited zones
         if zones_proj is None:
             candidates['in_prohibited_zone'] = False
             candidates['zone_type'] = 'Unknown'
             return candidates
         
-        joined = gpd.sjoin(candidates, zones_proj[['ZONA', 'geometry']], 
-                          how='left', predicate='within')
-        
-        candidates['zone_type'] = joined['ZONA'].fillna('None')
+        tree = LocationAnalyzer._tree(zones_proj.geometry.values, index_path)
+        cand, zone = tree.query(candidates.geometry.values, predicate='within')
+        zone_type = np.full(len(candidates), 'None', dtype=object)
+        zone_type[cand[::-1]] = zones_proj['ZONA'].to_numpy()[zone[::-1]]  # zones do not overlap - else the first wins
+        candidates['zone_type'] = zone_type
         candidates['in_prohibited_zone'] = (candidates['zone_type'] == 'A')
         
         return candidates
@@ -94,11 +108,20 @@ class LocationAnalyzer:
             return ((series - series.min()) / (series.max() - series.min())) * 100
         
         # Composite score
-        df['suitability_score'] = (
-            normalize(df['trail_count']) * 0.40 +
-            normalize(df['total_rides']) * 0.40 +
-            normalize(df['trail_length_km']) * 0.20
-        )
+        if 'climb_m_per_km' in df.columns and df['climb_m_per_km'].notna().any():
+            # with a DEM (maps/elevation.py) terrain counts as well
+            df['suitability_score'] = (
+                normalize(df['trail_count']) * 0.35 +
+                normalize(df['total_rides']) * 0.35 +
+                normalize(df['trail_length_km']) * 0.15 +
+                normalize(df['climb_m_per_km'].fillna(0)) * 0.15
+            )
+        else:
+            df['suitability_score'] = (
+                normalize(df['trail_count']) * 0.40 +
+                normalize(df['total_rides']) * 0.40 +
+                normalize(df['trail_length_km']) * 0.20
+            )
         
         # Zone A penalty
         df.loc[df['in_prohibited_zone'], 'suitability_score'] = 0
@@ -107,10 +130,13 @@ class LocationAnalyzer:
         return df.sort_values('suitability_score', ascending=False)
     
     @staticmethod
-    def analyze(network, rides, study_area, protected_zones=None):
-        # Convert to metric CRS once
-        network_proj = network.to_crs("EPSG:32633")
-        zones_proj = protected_zones.to_crs("EPSG:32633") if protected_zones is not None else None
+    def analyze(network, rides, study_area, protected_zones=None, store=None, index_paths=None):
+        #index_paths: {'segments' | 'zones': folder} => R-trees persisted there (maps/spatial_index.py)
+        index_paths = index_paths or {}
+        # Metric copies from the store - projected once per run
+        store = GeometryStore.ensure(store, network=network, zones=protected_zones)
+        network_proj = store.metric_frame('network', network)
+        zones_proj = store.metric_frame('zones', protected_zones) if protected_zones is not None else None
         
         # Find candidates
         candidates = LocationAnalyzer.find_candidate_locations(network_proj, min_traffic=5)
@@ -118,10 +144,11 @@ class LocationAnalyzer:
             return None
         
         # Calculate accessibility
-        candidates = LocationAnalyzer.calculate_trail_access(candidates, network_proj, radius_m=5000)
+        candidates = LocationAnalyzer.calculate_trail_access(candidates, network_proj, radius_m=5000,
+                                                             index_path=index_paths.get('segments'))
         
         # Check environmental constraints
-        candidates = LocationAnalyzer.check_environmental_constraints(candidates, zones_proj)
+        candidates = LocationAnalyzer.check_environmental_constraints(candidates, zones_proj, index_paths.get('zones'))
         
         # Score and rank
         results = LocationAnalyzer.calculate_scores(candidates)
@@ -135,6 +162,7 @@ class LocationAnalyzer:
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        results[['rank', 'suitability_score', 'geometry', 'trail_count', 
-                'trail_length_km', 'total_rides', 'in_prohibited_zone', 
-                'zone_type']].to_file(output_path, driver='GPKG')
\ No newline at end of file
+        columns = ['rank', 'suitability_score', 'geometry', 'trail_count', 
+                   'trail_length_km', 'total_rides', 'in_prohibited_zone', 
+                   'zone_type', 'climb_m_per_km']
+        results[[c for c in columns if c in results.columns]].to_file(output_path, driver='GPKG')
\ No newline at end of file
@@ -0,0 +1,320 @@
+import base64
+import gzip
+import hashlib
+import mimetypes
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urljoin, urlparse
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+
+#offline map bundle - the saved folium page without CDNs, smaller on the wire
+#
+#   inline   every Leaflet/folium JS + CSS asset goes into the page (fonts/images in the CSS as data: URIs)
+#            => one self-contained file, opens from a phone or a USB stick without any connection
+#   vendor   assets written once to <map folder>/assets/ and linked relatively => mtb_planner.html and
+#            loops.html share them and the browser caches them across maps
+#
+#the generated script is minified conservatively (indentation, blank lines, whole-line // comments, coordinates
+#rounded to Config.BUNDLE_COORD_DECIMALS) and every written file gets .gz and .br (optional brotli) variants
+#next to it. Assets are downloaded once into Config.ASSET_CACHE; without a connection an asset that is not cached
+#keeps its CDN link. Map tiles always come from the tile servers.
+#
+#   python maps/cli.py render --bundle           -> maps/mtb_planner.html(.gz/.br) + size report
+#   python maps/cli.py serve-map --throttle 50   -> precompressed files over http at ~50 KB/s (field connection)
+
+ASSET_TAG = re.compile(r'<script src="(https?://[^"]+)"></script>|<link rel="stylesheet" href="(https?://[^"]+)"\s*/?>')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+FONT_FACE = re.compile(r'@font-face\s*\{[^}]*\}')
+FONT_SRC = re.compile(r'src\s*:[^;}]*;?')
+SCRIPT_BLOCK = re.compile(r'(<script>)(.*?)(</script>)', re.S)
+LONG_FLOAT = re.compile(r'(?<![\w.])-?\d+\.\d{7,}(?![\w.])')
+FONT_TYPES = {'.woff2': 'font/woff2', '.woff': 'font/woff', '.ttf': 'font/ttf', '.eot': 'application/vnd.ms-fontobject',
+              '.otf': 'font/otf', '.svg': 'image/svg+xml'}
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]  # preferred first
+PRECOMPRESSED = {'.woff2', '.woff', '.png', '.jpg', '.jpeg', '.gif', '.webp'}  # served as they are
+ASSET_DIR = 'assets'
+
+
+def _brotli():
+    #brotli module or None - the .br variant is optional
+    try:
+        import brotli
+    except ImportError:
+        try:
+            import brotlicffi as brotli
+        except ImportError:
+            return None
+    return brotli
+
+
+def fetch_asset(url):
+    #CDN asset -> bytes, cached on disk by url (None if it is not cached and cannot be downloaded)
+    cache_dir = Path(Config.ASSET_CACHE)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_file = cache_dir / (hashlib.sha1(url.encode()).hexdigest() + Path(urlparse(url).path).suffix)
+    if cache_file.exists():
+        return cache_file.read_bytes()
+
+    import requests  # only needed on a cache miss
+
+    try:
+        resp = requests.get(url, timeout=30)
+        resp.raise_for_status()
+    except requests.RequestException:
+        return None
+    cache_file.write_bytes(resp.content)
+    return resp.content
+
+
+class MapBundle:
+    # === MINIFY ===
+    @staticmethod
+    def minify(html, decimals=None):
+        #generated page -> same page without indentation / blank lines, script comments and excess coordinate digits
+        decimals = Config.BUNDLE_COORD_DECIMALS if decimals is None else decimals
+        html = '\n'.join(line for line in (l.strip() for l in html.split('\n')) if line)
+
+        def script(match):
+            body = '\n'.join(line for line in match.group(2).split('\n') if not line.startswith('//'))
+            body = LONG_FLOAT.sub(lambda f: repr(round(float(f.group(0)), decimals)), body)
+            return match.group(1) + body + match.group(3)
+
+        return SCRIPT_BLOCK.sub(script, html)
+
+    # === CSS ===
+    @staticmethod
+    def prune_fonts(css):
+        #@font-face: keep only the woff2 sources (else woff) - every browser that runs Leaflet 1.9 reads them,
+        #the eot/ttf/svg fallbacks would only make the bundle bigger
+        def font_face(match):
+            block = match.group(0)
+            sources = FONT_SRC.findall(block)
+            urls = ' '.join(sources)
+            best = '.woff2' if '.woff2' in urls else '.woff' if '.woff' in urls else None
+            if best is None:
+                return block
+            for src in sources:
+                items = [i for i in re.split(r',(?![^()]*\))', src.split(':', 1)[1].rstrip(';')) if best in i]
+                block = block.replace(src, f"src:{','.join(i.strip() for i in items)};" if items else '', 1)
+            return block
+
+        return FONT_FACE.sub(font_face, css)
+
+    @staticmethod
+    def rewrite_css(css, css_url, embed, missing):
+        #url(...) references of a CSS file -> embed(absolute url, bytes) (data: URI or vendored file name)
+        def reference(match):
+            ref = match.group(2).strip()
+            if ref.startswith(('data:', '#')):
+                return match.group(0)
+            absolute = urljoin(css_url, ref).split('#')[0]
+            data = fetch_asset(absolute.split('?')[0])
+            if data is None:
+                missing.append(absolute)
+                return f'url("{absolute}")'
+            return f'url("{embed(absolute, data)}")'
+
+        return CSS_URL.sub(reference, MapBundle.prune_fonts(css))
+
+    # === ASSETS ===
+    @staticmethod
+    def data_uri(url, data):
+        suffix = Path(urlparse(url).path).suffix.lower()
+        mime = FONT_TYPES.get(suffix) or mimetypes.guess_type(urlparse(url).path)[0] or 'application/octet-stream'
+        return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+
+    @staticmethod
+    def vendored_name(url):
+        #immutable file name per url - e.g. 3f2a9c1b0d-leaflet.js
+        name = re.sub(r'[^\w.-]', '_', Path(urlparse(url).path).name) or 'asset'
+        return f"{hashlib.sha1(url.encode()).hexdigest()[:10]}-{name}"
+
+    @staticmethod
+    def inline_assets(html, mode, asset_dir):
+        #CDN tags -> inline <script>/<style> or relative links into asset_dir -> (html, asset files, missing urls)
+        missing, files = [], {}
+
+        def vendor(url, data):
+            name = MapBundle.vendored_name(url)
+            path = asset_dir / name
+            if name not in files:
+                path.write_bytes(data)
+                files[name] = path
+            return name
+
+        def tag(match):
+            url = match.group(1) or match.group(2)
+            data = fetch_asset(url)
+            if data is None:
+                missing.append(url)
+                return match.group(0)
+            if match.group(1):  # script
+                if mode == 'vendor':
+                    return f'<script src="{ASSET_DIR}/{vendor(url, data)}"></script>'
+                js = data.decode('utf-8').replace('</script', '<\\/script')
+                return f"<script>/* {url} */\n{js}\n</script>"
+            embed = vendor if mode == 'vendor' else MapBundle.data_uri
+            css = MapBundle.rewrite_css(data.decode('utf-8'), url, embed, missing)
+            if mode == 'vendor':
+                return f'<link rel="stylesheet" href="{ASSET_DIR}/{vendor(url, css.encode())}"/>'
+            css = css.replace('</style', '<\\/style')
+            return f"<style>/* {url} */\n{css}\n</style>"
+
+        if mode == 'vendor':
+            asset_dir.mkdir(parents=True, exist_ok=True)
+        html = ASSET_TAG.sub(tag, html)
+        return html, list(files.values()), list(dict.fromkeys(missing))
+
+    # === COMPRESS ===
+    @staticmethod
+    def precompress(path, brotli=None):
+        #.gz (+ .br) next to the file -> {'raw', 'gzip', 'brotli'} sizes; stale variants removed
+        data = path.read_bytes()
+        sizes = {'raw': len(data)}
+        gz = gzip.compress(data, compresslevel=9, mtime=0)
+        path.with_name(path.name + '.gz').write_bytes(gz)
+        sizes['gzip'] = len(gz)
+        br_path = path.with_name(path.name + '.br')
+        if brotli is not None:
+            br = brotli.compress(data, quality=Config.BROTLI_QUALITY)
+            br_path.write_bytes(br)
+            sizes['brotli'] = len(br)
+        else:
+            br_path.unlink(missing_ok=True)
+        return sizes
+
+    @staticmethod
+    def clear_variants(path):
+        #plain save after a bundled one - the old .gz/.br must not be served any more
+        for _, suffix in ENCODINGS:
+            Path(path).with_name(Path(path).name + suffix).unlink(missing_ok=True)
+
+    # === BUNDLE ===
+    @staticmethod
+    def bundle(path, mode='inline', decimals=None):
+        #saved folium page -> offline bundle in place + precompressed variants -> size report dict
+        if mode not in ('inline', 'vendor'):
+            raise ValueError(f"❌ Unknown bundle mode {mode!r} - use 'inline' or 'vendor'")
+        path = Path(path)
+        html = path.read_text(encoding='utf-8')
+        report = {'mode': mode, 'folium': len(html.encode())}
+
+        html = MapBundle.minify(html, decimals)
+        report['minified'] = len(html.encode())
+        html, assets, missing = MapBundle.inline_assets(html, mode, path.parent / ASSET_DIR)
+        path.write_text(html, encoding='utf-8')
+        report.update(page=path.stat().st_size, assets=len(assets), missing=missing)
+
+        brotli = _brotli()
+        totals = {}
+        for file in [path, *assets]:
+            if file.suffix.lower() in PRECOMPRESSED:
+                sizes = dict.fromkeys(['raw', 'gzip', 'brotli'], file.stat().st_size)
+            else:
+                sizes = MapBundle.precompress(file, brotli)
+            for key, size in sizes.items():
+                totals[key] = totals.get(key, 0) + size
+        report.update(totals)
+        MapBundle.print_report(path, report, brotli is not None)
+        return report
+
+    @staticmethod
+    def print_report(path, report, has_brotli):
+        kb = lambda n: f"{n / 1024:>9,.1f} KB"
+        what = 'self-contained page' if report['mode'] == 'inline' else f"page + {report['assets']} files in {ASSET_DIR}/"
+        print(f"\n📦 Map bundle {path.name} ({report['mode']}):")
+        print(f"   folium page      {kb(report['folium'])}")
+        print(f"   minified         {kb(report['minified'])}  "
+              f"(-{(1 - report['minified'] / report['folium']) * 100:.0f}%, coordinates to {Config.BUNDLE_COORD_DECIMALS} decimals)")
+        print(f"   with assets      {kb(report['raw'])}  {what}")
+        print(f"   gzip -9          {kb(report['gzip'])}  .gz")
+        if has_brotli:
+            print(f"   brotli q{Config.BROTLI_QUALITY:<7}  {kb(report['brotli'])}  .br")
+        else:
+            print("   ⚠️ brotli not installed - no .br variant (pip install brotli)")
+        if report['missing']:
+            print(f"   ⚠️ {len(report['missing'])} assets not cached and not downloadable - still loaded from the CDN:")
+            for url in report['missing']:
+                print(f"      {url}")
+
+
+class PrecompressedHandler(BaseHTTPRequestHandler):
+    #static files, the .br / .gz variant when the browser accepts it (and it is not older than the file)
+    root = None
+    throttle = None  # bytes per second - simulated slow connection
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _serve(self, body):
+        start = time.perf_counter()
+        rel = unquote(urlparse(self.path).path).lstrip('/')
+        target = (self.root / rel).resolve()
+        if target == self.root:
+            return self._send_index(body)
+        if self.root not in target.parents or not target.is_file():
+            return self.send_error(404)
+
+        accepted = {e.split(';')[0].strip() for e in self.headers.get('Accept-Encoding', '').split(',')
+                    if not e.strip().endswith('q=0')}
+        encoding, file = None, target
+        for name, suffix in ENCODINGS:
+            variant = target.with_name(target.name + suffix)
+            if name in accepted and variant.exists() and variant.stat().st_mtime >= target.stat().st_mtime:
+                encoding, file = name, variant
+                break
+
+        data = file.read_bytes()
+        self.send_response(200)
+        self.send_header('Content-Type', mimetypes.guess_type(target.name)[0] or 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'no-cache')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        if body:
+            self._write(data)
+        print(f"   {self.command} /{rel} {encoding or 'identity'} {len(data) / 1024:,.1f} KB "
+              f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def _write(self, data, chunk=16384):
+        for i in range(0, len(data), chunk):
+            self.wfile.write(data[i:i + chunk])
+            if self.throttle:
+                time.sleep(min(chunk, len(data) - i) / self.throttle)
+
+    def _send_index(self, body):
+        links = ''.join(f'<li><a href="{p.name}">{p.name}</a></li>' for p in sorted(self.root.glob('*.html')))
+        data = f"<!DOCTYPE html><html><body><ul>{links}</ul></body></html>".encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_static(root=None, host='127.0.0.1', port=8080, throttle_kbps=None):
+    #serve the map folder until Ctrl+C; throttle_kbps = simulated download speed in KB/s
+    PrecompressedHandler.root = Path(root or Config.OUTPUT_DIR).resolve()
+    PrecompressedHandler.throttle = throttle_kbps * 1024 if throttle_kbps else None
+    server = ThreadingHTTPServer((host, port), PrecompressedHandler)
+    speed = f", throttled to {throttle_kbps:g} KB/s" if throttle_kbps else ''
+    print(f"✓ Map files from {PrecompressedHandler.root} on http://{host}:{server.server_port}/{speed}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,20 +1,46 @@
+import json
 import geopandas as gpd
+import numpy as np
+import shapely
 from shapely.geometry import LineString, MultiLineString
 from shapely.ops import unary_union, linemerge
+import sys
 from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
+from config import Config
+from geometry_store import GeometryStore
+from coord_arrays import lines_from_offsets, arrays_from_lines
+from progress import Progress
+from spatial_index import PackedRTree
 
 #built a trail network from overlappnig GPS data - to create segments
 #originally input are strava rides - therefore they overlaps a lot
 
+MATCH_BATCH = 2000  # segments per STRtree query in map_rides_to_segments (progress + cancellation in between)
+
 class NetworkBuilder:
     @staticmethod
-    def create_network(rides, tolerance=5):  #tolerance =>       
+    def create_network(rides, tolerance=5, streams=None, store=None, snap=True, progress=None):  #tolerance => tracks closer than this become one trail
+
+        store = GeometryStore.ensure(store, rides=rides)
+        # union/merge are single GEOS calls - progress (and cancellation) between the steps
+        task = Progress.ensure(progress).task('network', total=3, unit='steps')
+        if streams is not None:
+            rides_geoms = NetworkBuilder.full_resolution_geometry(rides, streams, store)
+        else:
+            rides_geoms = store.metric('rides')
 
-        rides_proj = rides.to_crs('EPSG:32633')
-        rides_proj['geometry'] = rides_proj.geometry.simplify(tolerance=tolerance, preserve_topology=True) 
+        if snap:
+            # GPS noise off first, then parallel traces of the same trail collapse onto one centreline
+            rides_geoms = rides_geoms.simplify(tolerance=min(Config.SIMPLIFY_TOLERANCE, tolerance), preserve_topology=True)
+            all_geoms = NetworkBuilder.snap_tracks(rides_geoms.values, tolerance)
+        else:
+            all_geoms = rides_geoms.simplify(tolerance=tolerance, preserve_topology=True).tolist()
+        task.advance()
 
-        all_geoms = rides_proj.geometry.tolist() 
         merged = unary_union(all_geoms) #put together overlapping lines
+        task.advance()
         
         # Try to merge connected line segments
         try:
@@ -23,6 +49,8 @@ class NetworkBuilder:
         except:
             print("Could not merge all segments")
         
+        task.advance()
+
         # Convert to list of segments 
         if isinstance(merged, LineString):
             segments = [merged]
@@ -37,64 +65,232 @@ class NetworkBuilder:
                 'length_m': [seg.length for seg in segments]
             },
             geometry=segments,
-            crs='EPSG:32633'
+            crs=store.metric_crs
         )
         
-        # Back to original CRS
+        # Back to original CRS - the metric copy is kept in the store for later stages
         network_proj['distance_km'] = network_proj["length_m"] / 1000
         network = network_proj.to_crs(rides.crs)
+        store.register('network', network, metric=network_proj.geometry)
+        task.finish()
 
         return network
     
     @staticmethod
-    def map_rides_to_segments(network, rides, buffer_distance=200):
+    def snap_tracks(geoms, tolerance):
+        #corridor collapse: every vertex moves to its nearest corridor node (_corridor_nodes) - traces of one
+        #trail pass the same nodes in the same order. The result is the distinct node-to-node edges the
+        #traces use (2 point lines), each once however many rides took it, for unary_union to node + merge.
+        #Lines are densified first so no node along a trace is skipped.
+        from scipy.spatial import cKDTree
+
+        parts = shapely.get_parts(np.asarray(geoms, dtype=object))
+        parts = shapely.segmentize(parts, tolerance / 2)
+        coords, offsets = arrays_from_lines(parts)
+        if len(coords) == 0:
+            return []
+
+        nodes = NetworkBuilder._corridor_nodes(coords, tolerance)
+        node = cKDTree(nodes).query(coords)[1]
+        part = np.repeat(np.arange(len(parts)), np.diff(offsets))
+        step = (part[1:] == part[:-1]) & (node[1:] != node[:-1])
+        edges = np.unique(np.sort(np.column_stack([node[:-1][step], node[1:][step]]), axis=1), axis=0)
+        edges = NetworkBuilder._drop_shortcuts(nodes, edges, tolerance)
+        return shapely.linestrings(nodes[edges.ravel()], indices=np.repeat(np.arange(len(edges)), 2)).tolist()
+
+    @staticmethod
+    def _drop_shortcuts(nodes, edges, tolerance):
+        #a trace that skipped a node leaves an edge a-c next to the path a-b-c the others took - a triangle
+        #that would split the trail into extra segments. Such edges are dropped when the way round is at most
+        #tolerance / 2 longer, longest first and only while both edges of the way round are still there
+        length = np.hypot(*(nodes[edges[:, 0]] - nodes[edges[:, 1]]).T)
+        neighbors = [set() for _ in range(len(nodes))]
+        for a, c in edges.tolist():
+            neighbors[a].add(c)
+            neighbors[c].add(a)
+        keep = np.ones(len(edges), dtype=bool)
+        for i in np.argsort(-length, kind='stable').tolist():
+            a, c = edges[i].tolist()
+            for b in neighbors[a] & neighbors[c]:
+                around = np.hypot(*(nodes[a] - nodes[b])) + np.hypot(*(nodes[b] - nodes[c]))
+                if around <= length[i] + tolerance / 2:
+                    keep[i] = False
+                    neighbors[a].discard(c)
+                    neighbors[c].discard(a)
+                    break
+        return edges[keep]
+
+    @staticmethod
+    def _corridor_nodes(coords, tolerance):
+        #nodes >= tolerance apart covering every vertex: vertex means per grid cell, then greedy suppression -
+        #the busiest cell mean is kept, every mean within tolerance of it is dropped, and so on. Unlike
+        #clustering vertex pairs this does not chain along a densified track, and unlike plain cell means two
+        #traces on either side of a cell border still get the same node. The node count is bounded by the
+        #area the trails cover, not by the number of rides
+        from scipy.spatial import cKDTree
+
+        keys = np.floor(coords / tolerance).astype(np.int64)
+        keys -= keys.min(axis=0)
+        _, group = np.unique(keys[:, 0] * (keys[:, 1].max() + 1) + keys[:, 1], return_inverse=True)
+        group = group.ravel()
+        counts = np.bincount(group)
+        means = np.column_stack([np.bincount(group, weights=coords[:, 0]), np.bincount(group, weights=coords[:, 1])])
+        means /= counts[:, None]
+
+        near = cKDTree(means).query_ball_point(means, tolerance)
+        dropped = np.zeros(len(means), dtype=bool)
+        kept = []
+        for i in np.argsort(-counts, kind='stable').tolist():
+            if not dropped[i]:
+                kept.append(i)
+                dropped[near[i]] = True
+        return means[kept]
+
+    @staticmethod
+    def full_resolution_geometry(rides, streams, store=None):
+        #swap summary polylines for the full GPS tracks where the stream store has them (metric CRS)
+        #streams are neither clipped nor cleaned on download - cleaned here with their timestamps (speed filter),
+        #then clipped to the AOI like the rides; a stream with nothing left keeps the ride's summary geometry
+        from pyproj import Transformer
+        from loader import DataLoader
+        from aoi_service import StudyArea
+
+        store = GeometryStore.ensure(store, rides=rides)
+        metric = store.metric('rides')
+        if 'activity_id' not in rides.columns or len(streams) == 0:
+            return metric
+
+        ids = rides['activity_id'].to_numpy()
+        has_stream = np.isin(ids, streams.activity_ids())
+        if not has_stream.any():
+            return metric
+
+        columns, offsets, found = streams.arrays(ids[has_stream], ('coords', 'time'))
+        x, y = Transformer.from_crs('EPSG:4326', store.metric_crs, always_xy=True).transform(*columns['coords'].T)
+        coords = np.column_stack([x, y])
+        part_of = np.repeat(np.arange(len(found)), np.diff(offsets))
+        kept, new_part, report = DataLoader.clean_coords(coords, part_of, times=columns['time'])
+        first = np.flatnonzero(np.r_[True, np.diff(new_part) != 0])
+        tracks = DataLoader.lines_per_track(coords[kept], new_part, part_of[kept[first]], len(found))
+
+        tracks = DataLoader.clip_to_aoi(tracks, StudyArea.load(Config.STUDY_AREA).geometry(store.metric_crs))
+        usable = tracks != None  # cleaned or clipped away entirely
+        usable[usable] = ~shapely.is_empty(tracks[usable])
+        full = metric.values.copy()
+        full[np.flatnonzero(has_stream)[usable]] = tracks[usable]
+        print(f"   ✓ Using full resolution streams for {usable.sum()}/{len(rides)} rides "
+              f"({len(coords) - len(kept):,} of {len(coords):,} points cleaned out)")
+        return gpd.GeoSeries(full, index=rides.index, crs=metric.crs)
+
+    @staticmethod
+    def map_rides_to_segments(network, rides, buffer_distance=200, store=None, workers=1, progress=None, index_path=None):
     #How far a ride can deviate from a segment and still count - buffer set to 200
+    #workers > 1 => segments are matched in a process pool, rides shared via RideArrays (no pickling)
+    #index_path => R-tree of the ride parts persisted there (maps/spatial_index.py), unchanged rides load it
 
-        # Project for accurate buffering
-        network_proj = network.to_crs('EPSG:32633')
-        rides_proj = rides.to_crs('EPSG:32633')
+        # Projected copies from the store (computed once per run)
+        store = GeometryStore.ensure(store, rides=rides, network=network)
+        network_proj = store.metric('network')
+        task = Progress.ensure(progress).task('match', total=len(network_proj), unit='segments')
+        parts, ride_of_part = shapely.get_parts(store.metric('rides').values, return_index=True)
+        tree = PackedRTree.cached(parts, index_path) if index_path else None
 
-        rides_sindex = rides_proj.sindex
-        
-        segment_rides = []
-        
-        for seg_idx, segment in network_proj.iterrows():
-            # Buffer the segment
-            seg_buffer = segment.geometry.buffer(buffer_distance)
-            
-            candidate_idx = list(
-                rides_sindex.intersection(seg_buffer.bounds)
-            )
-            candidates = rides_proj.loc[candidate_idx]
-
-            # Find intersecting rides
-            intersecting = []
-            for ride_idx, ride in candidates.iterrows():
-                if seg_buffer.intersects(ride.geometry):
-                    intersecting.append(
-                        {
-                            "activity_id": ride_idx,
-                            "distance_km": rides.loc[ride_idx, "distance_km"],
-                        }
-                    )
-
-            segment_rides.append(intersecting)
-
-            if (seg_idx + 1) % 100 == 0:
-                print(f"   Processed {seg_idx + 1}/{len(network)} segments...")
+        if workers > 1 and len(network_proj) > workers:
+            seg_idx, ride_pos = NetworkBuilder._match_parallel(network_proj, rides, store, buffer_distance, workers, task,
+                                                               None if tree is None else (index_path, tree.tag))
+        else:
+            # one tree, queried in batches of segments - progress + cancellation between the batches
+            tree = tree if tree is not None else shapely.STRtree(parts)
+            results = []
+            for a in range(0, len(network_proj), MATCH_BATCH):
+                seg, pos = match_segments(parts, ride_of_part, network_proj.values[a:a + MATCH_BATCH], buffer_distance, tree)
+                results.append((seg + a, pos))
+                task.advance(min(MATCH_BATCH, len(network_proj) - a))
+            seg_idx = np.concatenate([r[0] for r in results]) if results else np.zeros(0, dtype=np.int64)
+            ride_pos = np.concatenate([r[1] for r in results]) if results else np.zeros(0, dtype=np.int64)
+        task.finish()
 
+        # segment -> rides that pass within the buffer
+        ride_ids = rides.index.to_numpy()
+        ride_km = rides['distance_km'].to_numpy()
+        segment_rides = [[] for _ in range(len(network))]
+        for seg, pos in zip(seg_idx.tolist(), ride_pos.tolist()):
+            segment_rides[seg].append({"activity_id": ride_ids[pos], "distance_km": ride_km[pos]})
+        print(f"   Processed {len(network)} segments, {len(seg_idx)} ride matches")
 
         network['rides'] = segment_rides
         network['ride_count'] = [len(r) for r in segment_rides]
                 
         return network
-    
+
+    @staticmethod
+    def _match_parallel(network_proj, rides, store, buffer_distance, workers, task, index=None):
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        from ride_arrays import RideArrays
+
+        seg_coords, seg_offsets = arrays_from_lines(network_proj.values)
+        bounds = np.linspace(0, len(network_proj), workers + 1).astype(int)  # one chunk per worker - one STRtree build each
+        # (or none: with a persisted ride index every worker memory-maps the same tree files)
+
+        with RideArrays.from_frame(rides, crs=store.metric_crs, store=store) as shared:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(_match_chunk, shared.handle(), seg_coords[seg_offsets[a]:seg_offsets[b]],
+                                seg_offsets[a:b + 1] - seg_offsets[a], buffer_distance, a, index): b - a
+                    for a, b in zip(bounds[:-1], bounds[1:]) if b > a
+                }
+                try:
+                    for future in as_completed(futures):
+                        task.advance(futures[future])
+                except BaseException:
+                    pool.shutdown(cancel_futures=True)
+                    raise
+                results = [f.result() for f in futures]  # submission order => same pairs as sequential
+
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
     @staticmethod
-    def save_network(network, output_path):
+    def save_network(network, output_path, mode='w'):
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Save without the 'rides' list column (not serializable)!!
+        # 'rides' list column is not serializable - kept as JSON text
         network_save = network.drop(columns=['rides'], errors='ignore')
-        network_save.to_file(output_path, driver='GPKG')
-        
\ No newline at end of file
+        if 'rides' in network.columns:
+            network_save['rides_json'] = [json.dumps(r, default=int) for r in network['rides']]
+        network_save.to_file(output_path, driver='GPKG', mode=mode)
+
+    @staticmethod
+    def load_network(path):
+        network = gpd.read_file(path)
+        if 'rides_json' in network.columns:
+            network['rides'] = [json.loads(r) if r else [] for r in network.pop('rides_json')]
+        return network
+        
+
+
+def match_segments(ride_parts, ride_of_part, segments, buffer_distance, tree=None):
+    #(segment, ride position) pairs where the ride passes within buffer_distance - one STRtree (or PackedRTree) query
+    tree = tree if tree is not None else shapely.STRtree(ride_parts)
+    seg_idx, part_idx = tree.query(shapely.buffer(segments, buffer_distance, quad_segs=16), predicate='intersects')  # same buffer as geom.buffer()
+    pairs = np.unique(np.column_stack([seg_idx, ride_of_part[part_idx]]), axis=0)  # multi part rides count once
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _match_chunk(handle, seg_coords, seg_offsets, buffer_distance, first_segment, index=None):
+    #process pool worker - rides come from shared memory, only this chunk's segments are pickled
+    from ride_arrays import RideArrays
+
+    rides = RideArrays.attach(handle)
+    try:
+        parts, ride_of_part = rides.part_lines()
+        tree = PackedRTree.load(*index) if index else None  # (path, tag) of the parent's persisted tree
+        if tree is not None and len(tree) == len(parts):
+            tree.geometries = parts
+        else:
+            tree = None
+        seg_idx, ride_pos = match_segments(parts, ride_of_part, lines_from_offsets(seg_coords, seg_offsets),
+                                           buffer_distance, tree)
+    finally:
+        rides.close()
+    return seg_idx + first_segment, ride_pos
@@ -0,0 +1,191 @@
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
+from config import Config
+from geometry_store import GeometryStore
+from loader import DataLoader
+from network_layer import NetworkBuilder, match_segments
+from elevation import Elevation
+from ride_store import RideStore
+
+#incremental network update - rides added to / removed from the ride store since the last build,
+#without rebuilding the whole network (webhook ingestion, preprocessing/strava_webhook.py)
+#
+#   removed   their entries leave the segment ride lists, the labels of later rides move up (labels = row
+#             positions in CLEANED_RIDES), segments no ride uses any more are dropped
+#   added     cleaned + enriched on their own and appended to CLEANED_RIDES; the parts of their tracks farther
+#             than SNAP_TOLERANCE from every segment become new segments (create_network on just those pieces),
+#             then new rides x all segments and old rides near the new segments x new segments are matched
+#
+#existing segments are never re-merged or split - after many updates `build-network --force` gives the
+#canonical segmentation again. time cube + similarity index are rebuilt from the updated network (cheap)
+
+MIN_NEW_PIECE_M = 100  # uncovered track pieces shorter than this are GPS noise next to a known trail
+
+
+class NetworkUpdater:
+    def __init__(self, rides_path=None, network_path=None, store_path=None):
+        self.rides_path = Path(rides_path or Config.CLEANED_RIDES)
+        self.network_path = Path(network_path or Config.TRAIL_NETWORK)
+        self.store_path = Path(store_path or Config.RIDE_STORE)
+
+    def apply(self, added=(), removed=()):
+        #activity ids added to / removed from the ride store -> summary dict (None without a built network)
+        if not self.rides_path.exists() or not self.network_path.exists():
+            print(f"⚠️ No network yet ({self.network_path}) - run build-network, new rides are in the ride store")
+            return None
+        start = time.perf_counter()
+        rides = DataLoader.load_rides(self.rides_path)
+        network = NetworkBuilder.load_network(self.network_path)
+        segments_before = len(network)
+
+        rides, network, n_removed = NetworkUpdater.remove_rides(rides, network, removed)
+        segments_kept = len(network)
+        new = self._read_new(rides, added)
+        if new is not None:
+            rides, network = NetworkUpdater.add_rides(rides, network, new)
+
+        if n_removed:
+            DataLoader.save_rides(rides, self.rides_path)
+        elif new is not None:
+            DataLoader.save_rides(rides.loc[new.index], self.rides_path, mode='a')  # labels continue the file
+        if n_removed or new is not None:
+            NetworkBuilder.save_network(network, self.network_path)
+            NetworkUpdater.rebuild_indexes(network, rides)
+
+        summary = {'added': 0 if new is None else len(new), 'removed': int(n_removed), 'rides': len(rides),
+                   'segments': len(network), 'new_segments': len(network) - segments_kept,
+                   'seconds': round(time.perf_counter() - start, 2)}
+        print(f"✓ Network updated in {summary['seconds']}s: +{summary['added']} / -{summary['removed']} rides, "
+              f"{segments_before} → {len(network)} segments")
+        return summary
+
+    def _read_new(self, rides, added):
+        #new ride store rows -> cleaned + enriched, labelled after the existing rides (None if nothing new)
+        known = set(rides['activity_id'].tolist()) if 'activity_id' in rides.columns else set()
+        ids = [i for i in dict.fromkeys(int(i) for i in added) if i not in known]
+        if not ids or not self.store_path.exists():
+            return None
+        new = RideStore(self.store_path).read(activity_ids=ids)
+        if len(new) == 0:
+            return None
+        new = DataLoader.clean_ride_names(new.to_crs(rides.crs))
+        store = GeometryStore()
+        store.register('rides', new)
+        new = DataLoader.clean_tracks(new, store=store, first_label=len(rides))
+        if len(new) == 0:
+            return None
+        return DataLoader.calculate_km(new, store=store)
+
+    # === REMOVE ===
+    @staticmethod
+    def remove_rides(rides, network, activity_ids):
+        ids = [int(i) for i in activity_ids]
+        if not ids or 'activity_id' not in rides.columns:
+            return rides, network, 0
+        gone = rides['activity_id'].isin(ids).to_numpy()
+        if not gone.any():
+            return rides, network, 0
+
+        new_label = np.cumsum(~gone) - 1  # labels = row positions => every later ride moves up
+        segment_rides = [[{'activity_id': int(new_label[r['activity_id']]), 'distance_km': r['distance_km']}
+                          for r in rs if not gone[r['activity_id']]] for rs in network['rides']]
+        network = network.copy()
+        network['rides'] = segment_rides
+        network['ride_count'] = [len(r) for r in segment_rides]
+        network = network[network['ride_count'] > 0].reset_index(drop=True)  # segment ids stay as they were
+        rides = rides[~gone].reset_index(drop=True)
+        return rides, network, int(gone.sum())
+
+    # === ADD ===
+    @staticmethod
+    def add_rides(rides, network, new, tolerance=None, buffer_distance=None):
+        #new = cleaned + enriched rides labelled len(rides)..; -> (rides, network) with new segments appended
+        tolerance = tolerance if tolerance is not None else Config.SNAP_TOLERANCE
+        buffer_distance = buffer_distance if buffer_distance is not None else Config.INTERSECTION_BUFFER
+        store = GeometryStore()
+        store.register('network', network)
+        store.register('new', new)
+        segments = store.metric('network').values
+        new_metric = store.metric('new').values
+
+        # trails nobody rode before: track pieces outside the corridor of the known segments
+        pieces = NetworkUpdater.uncovered(new_metric, segments, tolerance)
+        added = NetworkUpdater._new_segments(pieces, tolerance, store.metric_crs, network)
+        added_metric = added.to_crs(store.metric_crs).geometry.values if len(added) else np.empty(0, dtype=object)
+
+        # new rides x every segment, old rides near the new segments x the new segments
+        parts, ride_of_part = shapely.get_parts(new_metric, return_index=True)
+        seg, pos = match_segments(parts, ride_of_part, np.concatenate([segments, added_metric]), buffer_distance)
+        pairs = [(seg, new.index.to_numpy()[pos], new['distance_km'].to_numpy()[pos])]
+        if len(added):
+            zone = gpd.GeoSeries(shapely.buffer(added_metric, buffer_distance), crs=store.metric_crs).to_crs(rides.crs)
+            near = np.unique(shapely.STRtree(rides.geometry.values).query(zone.values, predicate='intersects')[1])
+            if len(near):
+                old_metric = rides.geometry.iloc[near].to_crs(store.metric_crs).values
+                parts, ride_of_part = shapely.get_parts(old_metric, return_index=True)
+                seg, pos = match_segments(parts, ride_of_part, added_metric, buffer_distance)
+                pairs.append((seg + len(segments), rides.index.to_numpy()[near][pos],
+                              rides['distance_km'].to_numpy()[near][pos]))
+
+        network = pd.concat([network, added], ignore_index=True) if len(added) else network.copy()
+        segment_rides = [list(r) for r in network['rides'].iloc[:len(segments)]] + [[] for _ in range(len(added))]
+        seg = np.concatenate([p[0] for p in pairs])
+        label = np.concatenate([p[1] for p in pairs])
+        km = np.concatenate([p[2] for p in pairs])
+        for i in np.lexsort((label, seg)).tolist():  # per segment in label order, like map_rides_to_segments
+            segment_rides[seg[i]].append({'activity_id': int(label[i]), 'distance_km': float(km[i])})
+        network['rides'] = segment_rides
+        network['ride_count'] = [len(r) for r in segment_rides]
+
+        rides = pd.concat([rides, new.reindex(columns=rides.columns)])
+        print(f"   ✓ {len(new)} new rides: {len(added)} new segments, {len(seg)} ride matches")
+        return rides, network
+
+    @staticmethod
+    def uncovered(tracks, segments, tolerance, min_length=MIN_NEW_PIECE_M):
+        #parts of the tracks farther than tolerance from every segment (metric geometries)
+        track_idx, seg_idx = shapely.STRtree(segments).query(tracks, predicate='dwithin', distance=tolerance)
+        touched = np.unique(seg_idx)
+        corridor = np.empty(len(segments), dtype=object)
+        corridor[touched] = shapely.buffer(segments[touched], tolerance)
+
+        pieces = []
+        for i, track in enumerate(tracks):
+            near = seg_idx[track_idx == i]
+            rest = shapely.difference(track, shapely.union_all(corridor[near])) if len(near) else track
+            parts = shapely.get_parts(shapely.line_merge(rest) if rest.geom_type == 'MultiLineString' else rest)
+            pieces.extend(p for p in parts if p.geom_type == 'LineString' and p.length >= min_length)
+        return pieces
+
+    @staticmethod
+    def _new_segments(pieces, tolerance, metric_crs, network):
+        #segments from the uncovered pieces, ids after the highest existing one, in the network CRS
+        if not pieces:
+            return network.iloc[:0].drop(columns=['rides'], errors='ignore')
+        piece_frame = gpd.GeoDataFrame(geometry=pieces, crs=metric_crs)
+        store = GeometryStore(metric_crs)
+        store.register('rides', piece_frame)
+        added = NetworkBuilder.create_network(piece_frame, tolerance=tolerance, store=store)
+        first_id = int(network['segment_id'].max()) + 1 if len(network) else 0
+        added['segment_id'] = np.arange(first_id, first_id + len(added))
+        added = Elevation.add_to_network(added, store=store)
+        return added.to_crs(network.crs)
+
+    # === DERIVED ===
+    @staticmethod
+    def rebuild_indexes(network, rides):
+        #time cube + similarity index follow the network - both are rebuilt from the ride lists in seconds
+        from time_cube import TimeCube
+        from ride_similarity import RideSimilarity
+
+        if 'date' in rides.columns:
+            TimeCube.build(network, rides['date']).save(Config.TIME_CUBE)
+        RideSimilarity.build(network).save(Config.RIDE_SIMILARITY)
@@ -0,0 +1,312 @@
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
+from config import Config
+
+#dependency-aware stage runner
+#every stage declares its inputs and outputs (artifact names) - the runner works out what has to run,
+#starts every stage as soon as its inputs exist and runs independent stages side by side
+#data artifacts (rides, network, candidates) are persisted, so any stage can run alone later on
+#
+#map layers are built on a private folium map each (thread safe) and put together in 'render';
+#layers whose inputs did not change come from the fragment cache (maps/layer_cache.py)
+#
+#run(progress=...) reports stage events and the batches of the long stages; cancelling its token stops the
+#run between stages / batches (process pool stages run to their end)
+
+class Stage:
+    def __init__(self, name, func, inputs=(), outputs=(), process=False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.process = process  # may run in a process pool (picklable inputs/outputs, no context)
+
+
+class RunContext:
+    #state shared by the stages of one run (thread pool only)
+    def __init__(self, progress=None):
+        from geometry_store import GeometryStore
+        from stream_store import StreamStore
+        from layer_cache import LayerCache
+        from progress import Progress
+        self.progress = Progress.ensure(progress)
+        self.store = GeometryStore()
+        self.layers = LayerCache()
+        self.streams = StreamStore(Config.STREAM_STORE) if Config.STREAM_STORE.exists() else None
+
+
+# === PERSISTED ARTIFACTS ===
+def _save_rides(rides):
+    from loader import DataLoader
+    DataLoader.save_rides(rides, Config.CLEANED_RIDES)
+
+def _load_rides():
+    from loader import DataLoader
+    return DataLoader.load_rides(Config.CLEANED_RIDES)
+
+def _save_network(network):
+    from network_layer import NetworkBuilder
+    NetworkBuilder.save_network(network, Config.TRAIL_NETWORK)
+
+def _load_network():
+    from network_layer import NetworkBuilder
+    return NetworkBuilder.load_network(Config.TRAIL_NETWORK)
+
+def _save_candidates(candidates):
+    from location_analysis import LocationAnalyzer
+    if candidates is not None:
+        LocationAnalyzer.save_results(candidates, Config.CANDIDATES)
+
+def _load_candidates():
+    import geopandas as gpd
+    return gpd.read_file(Config.CANDIDATES)
+
+ARTIFACTS = {
+    # name: (Config attribute of the path, save, load) - looked up per run, a region profile may have moved it
+    'rides': ('CLEANED_RIDES', _save_rides, _load_rides),
+    'network': ('TRAIL_NETWORK', _save_network, _load_network),
+    'candidates': ('CANDIDATES', _save_candidates, _load_candidates),
+}
+
+
+# === STAGES ===
+def stage_study_area(ctx):
+    from aoi_service import StudyArea
+    return StudyArea.load(Config.STUDY_AREA).frame()
+
+def stage_zones(ctx):
+    import geopandas as gpd
+    zones = gpd.read_file(Config.PROTECTED_ZONES) if Config.PROTECTED_ZONES.exists() else None
+    if zones is not None and ctx is not None:
+        ctx.store.register('zones', zones)
+    return zones
+
+def stage_enrich(ctx):
+    from loader import DataLoader
+    rides = DataLoader.load_data(Config.STUDY_AREA, Config.STRAVA_RIDES)[1]
+    rides = DataLoader.clean_ride_names(rides)
+    ctx.store.register('rides', rides)
+    rides = DataLoader.clean_tracks(rides, store=ctx.store)
+    return DataLoader.calculate_km(rides, store=ctx.store)
+
+def stage_network(ctx, rides):
+    from network_layer import NetworkBuilder
+    from elevation import Elevation
+    from spatial_index import index_dir
+    network = NetworkBuilder.create_network(rides, tolerance=Config.SNAP_TOLERANCE, streams=ctx.streams, store=ctx.store,
+                                            progress=ctx.progress)
+    network = NetworkBuilder.map_rides_to_segments(network, rides, buffer_distance=Config.INTERSECTION_BUFFER, store=ctx.store,
+                                                   workers=Config.MATCH_WORKERS, progress=ctx.progress,
+                                                   index_path=index_dir(Config.CLEANED_RIDES, 'ride_parts'))
+    return Elevation.add_to_network(network, store=ctx.store)
+
+def stage_suitability(ctx, network, zones, study_area):
+    from location_analysis import LocationAnalyzer
+    from spatial_index import analysis_indexes
+    return LocationAnalyzer.analyze(network, None, study_area, zones, store=ctx.store if ctx else None,
+                                    index_paths=analysis_indexes())
+
+def stage_time_cube(ctx, network, rides):
+    from time_cube import TimeCube
+    if 'date' not in rides.columns:
+        return None
+    cube = TimeCube.build(network, rides['date'])
+    cube.save(Config.TIME_CUBE)
+    return cube
+
+def stage_similarity(ctx, network):
+    from ride_similarity import RideSimilarity
+    index = RideSimilarity.build(network)
+    index.save(Config.RIDE_SIMILARITY)
+    return index
+
+# layer modules are imported inside build() - a cache hit does not even import them (sklearn for the clusters)
+def stage_layer_trail_net(ctx, rides):
+    def build(m):
+        from trails_layer import TrailsLayers
+        TrailsLayers.add_trail_net(m, rides)
+    return ctx.layers.sink('trail_net', build, rides)
+
+def stage_layer_network(ctx, network, rides):
+    def build(m):
+        from trails_layer import TrailsLayers
+        TrailsLayers.add_trail_network(m, network, rides)
+    return ctx.layers.sink('network', build, network, rides)
+
+def stage_layer_length(ctx, rides):
+    def build(m):
+        from trails_layer import TrailsLayers
+        TrailsLayers.add_rides_by_length(m, rides.copy())  # adds a column - keep the shared frame untouched
+    return ctx.layers.sink('length', build, rides)
+
+def stage_layer_clusters(ctx, rides):
+    def build(m):
+        from heatmap import HeatMapLayer
+        HeatMapLayer.add_route_clusters(m, rides.copy(), Config.CLUSTER_DISTANCE, store=ctx.store)
+    return ctx.layers.sink('clusters', build, rides)
+
+def stage_layer_heatmap(ctx, rides):
+    def build(m):
+        from heatmap import HeatMapLayer
+        HeatMapLayer.add_heatmap(m, rides, streams=ctx.streams)
+    return ctx.layers.sink('heatmap', build, rides, ctx.streams.root if ctx.streams else None)
+
+def stage_layer_time(ctx, network, time_cube):
+    def build(m):
+        from trails_layer import TrailsLayers
+        if time_cube is not None:
+            TrailsLayers.add_time_slider(m, network, time_cube)
+    return ctx.layers.sink('time', build, network, time_cube)
+
+def stage_render(ctx, study_area, network, candidates, *layers):
+    import folium
+    from base_map import BaseLayers
+
+    bounds = study_area.total_bounds
+    center = [(bounds[1] + bounds[3]) / 2, (bounds[0] + bounds[2]) / 2]
+    m = BaseLayers.create_base_map(center, Config.DEFAULT_ZOOM)
+    ctx.layers.add_to(m, 'study_area', lambda s: BaseLayers.add_study_area(s, study_area), study_area)
+
+    for sink in layers:  # fixed order => same HTML no matter which stage finished first
+        for child in list(sink._children.values()):
+            m.add_child(child)
+
+    if candidates is not None:
+        ctx.layers.add_to(m, 'description', lambda s: BaseLayers.add_description(s, network, candidates),
+                          network, candidates)
+
+    folium.LayerControl(position='topright', collapsed=False).add_to(m)
+    BaseLayers.save_map(m, Config.OUTPUT_MAP)
+    return Config.OUTPUT_MAP
+
+def stage_stats(ctx, study_area, rides, network):
+    from cli import stats
+    stats(study_area, rides, network)
+
+
+LAYERS = ['layer_trail_net', 'layer_network', 'layer_length', 'layer_clusters', 'layer_heatmap', 'layer_time']
+
+STAGES = [
+    Stage('study_area', stage_study_area, outputs=['study_area']),
+    Stage('zones', stage_zones, outputs=['zones']),
+    Stage('enrich', stage_enrich, outputs=['rides']),
+    Stage('network', stage_network, inputs=['rides'], outputs=['network']),
+    Stage('suitability', stage_suitability, inputs=['network', 'zones', 'study_area'], outputs=['candidates'], process=True),
+    Stage('time_cube', stage_time_cube, inputs=['network', 'rides'], outputs=['time_cube']),
+    Stage('similarity', stage_similarity, inputs=['network'], outputs=['similarity']),
+    Stage('layer_trail_net', stage_layer_trail_net, inputs=['rides'], outputs=['layer_trail_net']),
+    Stage('layer_network', stage_layer_network, inputs=['network', 'rides'], outputs=['layer_network']),
+    Stage('layer_length', stage_layer_length, inputs=['rides'], outputs=['layer_length']),
+    Stage('layer_clusters', stage_layer_clusters, inputs=['rides'], outputs=['layer_clusters']),
+    Stage('layer_heatmap', stage_layer_heatmap, inputs=['rides'], outputs=['layer_heatmap']),
+    Stage('layer_time', stage_layer_time, inputs=['network', 'time_cube'], outputs=['layer_time']),
+    Stage('render', stage_render, inputs=['study_area', 'network', 'candidates'] + LAYERS, outputs=['map']),
+    Stage('stats', stage_stats, inputs=['study_area', 'rides', 'network']),
+]
+
+
+class Pipeline:
+    def __init__(self, stages=None, workers=4, use_processes=False):
+        self.stages = {s.name: s for s in (stages or STAGES)}
+        self.producers = {out: s.name for s in self.stages.values() for out in s.outputs}
+        self.workers = workers
+        self.use_processes = use_processes
+        self.timings = {}
+
+    def plan(self, targets, force=()):
+        #stages needed for targets - persisted artifacts are loaded instead of recomputed (unless forced)
+        to_run, to_load = [], set()
+
+        def need(stage_name):
+            if stage_name in to_run:
+                return
+            for artifact in self.stages[stage_name].inputs:
+                producer = self.producers[artifact]
+                if artifact in ARTIFACTS and getattr(Config, ARTIFACTS[artifact][0]).exists() and producer not in force:
+                    to_load.add(artifact)
+                else:
+                    need(producer)
+            to_run.append(stage_name)  # after its producers => topological order
+
+        for target in targets:
+            need(target)
+        return to_run, to_load
+
+    def run(self, targets=None, force=(), progress=None):
+        targets = targets or ['render', 'stats', 'similarity']
+        to_run, to_load = self.plan(targets, set(force))
+        print(f"\n⚙️ Pipeline: {' → '.join(to_run)}" + (f" (loading {', '.join(sorted(to_load))})" if to_load else ""))
+
+        ctx = RunContext(progress)
+        stages = ctx.progress.task('pipeline', total=len(to_run), unit='stages')
+        artifacts = {}
+        for name in to_load:
+            artifacts[name] = ARTIFACTS[name][2]()
+            if name in ('rides', 'network'):
+                ctx.store.register(name, artifacts[name])
+
+        threads = ThreadPoolExecutor(max_workers=self.workers)
+        processes = ProcessPoolExecutor(max_workers=self.workers) if self.use_processes else None
+        pending, running = list(to_run), {}
+        start = time.perf_counter()
+
+        try:
+            while pending or running:
+                # start every stage whose inputs are ready
+                for name in [n for n in pending if all(a in artifacts for a in self.stages[n].inputs)]:
+                    stage = self.stages[name]
+                    args = [artifacts[a] for a in stage.inputs]
+                    if processes is not None and stage.process:
+                        future = processes.submit(stage.func, None, *args)
+                    else:
+                        future = threads.submit(stage.func, ctx, *args)
+                    running[future] = (name, time.perf_counter())
+                    pending.remove(name)
+
+                # short waits - a cancelled run stops here even while a stage is busy
+                done, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, started = running.pop(future)
+                    result = future.result()  # re-raises stage errors
+                    self.timings[name] = (started - start, time.perf_counter() - start)
+                    self._store(name, result, artifacts, ctx)
+                    print(f"   ✓ {name} ({self.timings[name][1] - self.timings[name][0]:.2f}s)")
+                    stages.advance()
+                stages.check()
+            stages.finish()
+        finally:
+            threads.shutdown(cancel_futures=True)
+            if processes is not None:
+                processes.shutdown(cancel_futures=True)
+
+        self.report(time.perf_counter() - start)
+        return artifacts
+
+    def _store(self, name, result, artifacts, ctx):
+        outputs = self.stages[name].outputs
+        values = result if len(outputs) > 1 else (result,)
+        for artifact, value in zip(outputs, values):
+            artifacts[artifact] = value
+            if artifact in ARTIFACTS:
+                ARTIFACTS[artifact][1](value)
+            if artifact == 'network' and artifact not in ctx.store:
+                ctx.store.register('network', value)
+
+    def critical_path(self):
+        #longest chain of stage durations through the DAG (of the stages that ran)
+        longest = {}
+        for name in self.timings:  # insertion order = completion order, producers first
+            duration = self.timings[name][1] - self.timings[name][0]
+            before = [longest[self.producers[a]] for a in self.stages[name].inputs
+                      if self.producers.get(a) in longest]
+            longest[name] = duration + max(before, default=0)
+        return max(longest.values(), default=0)
+
+    def report(self, wall):
+        total = sum(end - start for start, end in self.timings.values())
+        print(f"\n⏱ Wall clock {wall:.1f}s | sum of stages {total:.1f}s | critical path {self.critical_path():.1f}s")
@@ -0,0 +1,274 @@
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import geopandas as gpd
+import shapely
+from pyproj import Transformer
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
+from config import Config
+from loader import DataLoader
+from network_layer import NetworkBuilder
+from route_planner import TrailGraph
+from ride_similarity import RideSimilarity
+from spatial_index import PackedRTree, file_fingerprint, index_dir
+
+#long running local query service - network, rides and candidates are loaded once,
+#metric copies + R-trees stay in memory, every query is a tree lookup + a few array ops.
+#the R-trees are persisted next to the data files (maps/spatial_index.py) - a restart with unchanged data
+#memory-maps them, and the ride start points come from their tree (no ride geometry read or reprojected):
+#
+#   GET /health                                          sizes + bounds of the loaded data
+#   GET /bbox?bbox=min_lon,min_lat,max_lon,max_lat       segments in a box + popularity stats
+#   GET /nearest?lat=..&lon=..&k=3                       nearest segments
+#   GET /radius?lat=..&lon=..&r=2000                     segments / rides / candidates within r meters
+#   GET /loops?lat=..&lon=..&km=30&n=5                   loop suggestions (maps/route_planner.py) as GeoJSON
+#   GET /similar?ride=ID&k=10                            rides on the same trails (maps/ride_similarity.py)
+#
+#   python maps/cli.py serve --port 8765
+
+class TrailIndex:
+    def __init__(self, network, rides, candidates=None, metric_crs=None, index_paths=None, start_tree=None,
+                 similarity=None):
+        #index_paths: {'segments' | 'starts' | 'candidates': folder} => R-trees persisted there, else built in memory
+        #start_tree: ride start points already loaded (TrailIndex.load) - rides then only need 'distance_km'
+        #similarity: RideSimilarity saved with the network (TrailIndex.load), else built from the ride lists
+        index_paths = index_paths or {}
+        tree = lambda name, geoms: (PackedRTree.cached(geoms, index_paths[name]) if name in index_paths
+                                    else PackedRTree.from_geometries(geoms))
+        self.metric_crs = metric_crs or Config.METRIC_CRS
+        self._local = threading.local()  # pyproj transformers are not thread safe - one per server thread
+        self.bounds = network.to_crs('EPSG:4326').total_bounds.tolist()
+
+        # segments - geometry, attributes and the ride lists as flat arrays (CSR)
+        self.segments = network.to_crs(self.metric_crs).geometry.values
+        self.segment_ids = network['segment_id'].to_numpy()
+        self.segment_km = network['distance_km'].to_numpy()
+        self.ride_count = network['ride_count'].to_numpy()
+        lists = network['rides'] if 'rides' in network.columns else [[]] * len(network)
+        self.ride_offsets = np.zeros(len(network) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in lists], out=self.ride_offsets[1:])
+        self.segment_rides = np.array([r['activity_id'] for rs in lists for r in rs], dtype=np.int64)
+        self.segment_tree = tree('segments', self.segments)
+        self.graph = TrailGraph(gpd.GeoDataFrame(network[['segment_id', 'ride_count']], geometry=self.segments,
+                                                 crs=self.metric_crs))
+        self._graph_lock = threading.Lock()  # dijkstra tree cache is shared between the server threads
+        self.similarity = similarity
+        if similarity is None and 'rides' in network.columns:
+            self.similarity = RideSimilarity.build(network)
+
+        # rides - start points only, that is what radius stats need
+        self.ride_km = rides['distance_km'].to_numpy()
+        self.start_tree = start_tree if start_tree is not None else tree('starts', TrailIndex.start_points(rides, self.metric_crs))
+
+        self.candidates = None
+        if candidates is not None and len(candidates):
+            self.candidates = candidates.to_crs(self.metric_crs).geometry.values
+            self.candidate_scores = candidates['suitability_score'].to_numpy()
+            self.candidate_tree = tree('candidates', self.candidates)
+
+    @staticmethod
+    def start_points(rides, metric_crs):
+        rides_metric = rides.to_crs(metric_crs).geometry.values
+        first = np.where(shapely.get_type_id(rides_metric) == 5, shapely.get_geometry(rides_metric, 0), rides_metric)
+        return shapely.get_point(first, 0)
+
+    @staticmethod
+    def load(network_path=None, rides_path=None, candidates_path=None):
+        network_path = Path(network_path or Config.TRAIL_NETWORK)
+        rides_path = Path(rides_path or Config.CLEANED_RIDES)
+        candidates_path = Path(candidates_path or Config.CANDIDATES)
+        network = NetworkBuilder.load_network(network_path)
+        candidates = gpd.read_file(candidates_path) if candidates_path.exists() else None
+
+        # start point tree tagged with the rides file - unchanged file => only the ride attributes are read
+        starts_path = index_dir(rides_path, 'starts')
+        fingerprint = file_fingerprint(rides_path, extra=Config.METRIC_CRS)
+        start_tree = PackedRTree.load(starts_path, fingerprint)
+        if start_tree is not None:
+            rides = gpd.read_file(rides_path, columns=['distance_km'], ignore_geometry=True)
+            print(f"   ✓ {len(start_tree)} ride start points from {starts_path}")
+        else:
+            rides = DataLoader.load_rides(rides_path)
+            start_tree = PackedRTree.build(shapely.bounds(TrailIndex.start_points(rides, Config.METRIC_CRS)), tag=fingerprint)
+            start_tree.save(starts_path)
+        return TrailIndex(network, rides, candidates, start_tree=start_tree,
+                          index_paths={'segments': index_dir(network_path, 'segments'),
+                                       'candidates': index_dir(candidates_path, 'candidates')},
+                          similarity=TrailIndex.load_similarity(network_path))
+
+    @staticmethod
+    def load_similarity(network_path, path=None):
+        #saved similarity index if it was written after the network (build-network saves it right after), else None
+        path = Path(path or Config.RIDE_SIMILARITY)
+        try:
+            if path.stat().st_mtime_ns < Path(network_path).stat().st_mtime_ns:
+                return None
+            similarity = RideSimilarity.load(path)
+        except (OSError, ValueError, KeyError):  # missing or unreadable => built from the network
+            return None
+        print(f"   ✓ {len(similarity.ride_ids)} ride signatures from {path}")
+        return similarity
+
+    def _transform(self, lons, lats):
+        if not hasattr(self._local, 'to_metric'):
+            self._local.to_metric = Transformer.from_crs('EPSG:4326', self.metric_crs, always_xy=True)
+        return self._local.to_metric.transform(lons, lats)
+
+    def _point(self, lat, lon):
+        return shapely.Point(*self._transform(lon, lat))
+
+    def _segment_stats(self, idx):
+        # ride ids of all segments in idx - gathered from the CSR arrays without a python loop
+        counts = self.ride_offsets[idx + 1] - self.ride_offsets[idx]
+        gather = np.repeat(self.ride_offsets[idx] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        rides = self.segment_rides[gather]
+        km = self.segment_km[idx]
+        return {
+            'segments': int(len(idx)),
+            'length_km': round(float(km.sum()), 3),
+            'unique_rides': int(len(np.unique(rides))),
+            'max_ride_count': int(self.ride_count[idx].max(initial=0)),
+            'mean_ride_count': round(float(np.average(self.ride_count[idx], weights=km)), 2) if km.sum() > 0 else 0.0,
+        }
+
+    # === QUERIES ===
+    def bbox(self, min_lon, min_lat, max_lon, max_lat, limit=50):
+        xs, ys = self._transform([min_lon, max_lon, min_lon, max_lon], [min_lat, min_lat, max_lat, max_lat])
+        box = shapely.box(min(xs), min(ys), max(xs), max(ys))
+        idx = np.sort(self.segment_tree.query(box, predicate='intersects'))  # ties in segment order, whatever the tree
+        top = idx[np.argsort(-self.ride_count[idx], kind='stable')[:limit]]
+        return {
+            **self._segment_stats(idx),
+            'top_segments': [{'segment_id': int(self.segment_ids[i]), 'ride_count': int(self.ride_count[i]),
+                              'distance_km': round(float(self.segment_km[i]), 3)} for i in top],
+        }
+
+    def nearest(self, lat, lon, k=1, max_distance=5000):
+        point = self._point(lat, lon)
+        idx = np.sort(self.segment_tree.query(point, predicate='dwithin', distance=max_distance))
+        dist = shapely.distance(self.segments[idx], point)
+        order = np.argsort(dist, kind='stable')[:k]
+        idx, dist = idx[order], dist[order]
+        return {'segments': [{'segment_id': int(self.segment_ids[i]), 'distance_m': round(float(d), 1),
+                              'ride_count': int(self.ride_count[i]), 'distance_km': round(float(self.segment_km[i]), 3)}
+                             for i, d in zip(idx, dist)]}
+
+    def radius(self, lat, lon, r=1000):
+        point = self._point(lat, lon)
+        segments = self.segment_tree.query(point, predicate='dwithin', distance=r)
+        starts = self.start_tree.query(point, predicate='dwithin', distance=r)
+        result = {
+            **self._segment_stats(segments),
+            'ride_starts': int(len(starts)),
+            'ride_starts_km': round(float(self.ride_km[starts].sum()), 1),
+        }
+        if self.candidates is not None:
+            near = self.candidate_tree.query(point, predicate='dwithin', distance=r)
+            result['candidates'] = [{'suitability_score': round(float(self.candidate_scores[i]), 1),
+                                     'distance_m': round(float(shapely.distance(self.candidates[i], point)), 1)}
+                                    for i in near]
+        return result
+
+    def loops(self, lat, lon, km=30, n=5):
+        with self._graph_lock:
+            loops = self.graph.loops(lat, lon, km, n=n)
+        if not loops:
+            return {'type': 'FeatureCollection', 'features': []}
+        geometry = gpd.GeoSeries([l['geometry'] for l in loops], crs=self.metric_crs).to_crs('EPSG:4326')
+        return {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'geometry': shapely.geometry.mapping(g),
+             'properties': {'length_km': round(float(l['length_km']), 2), 'rides_per_km': round(float(l['rides_per_km']), 2),
+                            'overlap': round(float(l['overlap']), 3), 'segment_ids': [int(s) for s in l['segment_ids']]}}
+            for g, l in zip(shapely.set_precision(geometry.values, 1e-5), loops)]}
+
+    def similar(self, ride, k=10):
+        if self.similarity is None:
+            return {'rides': []}
+        found = self.similarity.similar(ride, k=k)
+        return {'ride': ride, 'rides': [{'ride_id': int(r), 'similarity': round(float(sim), 3)}
+                                        for r, sim in zip(found['ride_id'], found['similarity'])]}
+
+    def health(self):
+        return {'segments': len(self.segments), 'rides': len(self.ride_km),
+                'candidates': 0 if self.candidates is None else len(self.candidates), 'bounds': self.bounds}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    index = None  # TrailIndex - set by serve()
+
+    ROUTES = {
+        '/health': lambda index, q: index.health(),
+        '/bbox': lambda index, q: index.bbox(*[float(v) for v in q['bbox'].split(',')], limit=int(q.get('limit', 50))),
+        '/nearest': lambda index, q: index.nearest(float(q['lat']), float(q['lon']), k=int(q.get('k', 1))),
+        '/radius': lambda index, q: index.radius(float(q['lat']), float(q['lon']), r=float(q.get('r', 1000))),
+        '/loops': lambda index, q: index.loops(float(q['lat']), float(q['lon']), km=float(q.get('km', 30)),
+                                               n=int(q.get('n', 5))),
+        '/similar': lambda index, q: index.similar(int(q['ride']), k=int(q.get('k', 10))),
+    }
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        route = self.ROUTES.get(url.path)
+        if route is None:
+            return self._send(404, {'error': f'unknown path {url.path}', 'paths': list(self.ROUTES)})
+        try:
+            result = route(self.index, query)
+        except (KeyError, ValueError, TypeError) as e:
+            return self._send(400, {'error': f'bad query: {e!r}'})
+        result['took_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        self._send(200, result)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would dominate a load test
+
+
+class PooledHTTPServer(HTTPServer):
+    #fixed worker threads - ThreadingHTTPServer starts a thread per request and pyproj needs ~3 ms
+    #to set up its context in every new thread (more than the query itself)
+    def __init__(self, address, handler, workers=8):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(cancel_futures=True)
+
+
+def serve(host='127.0.0.1', port=8765, index=None, workers=8):
+    QueryHandler.index = index or TrailIndex.load()
+    server = PooledHTTPServer((host, port), QueryHandler, workers)
+    print(f"✓ Query service on http://{host}:{port} ({', '.join(QueryHandler.ROUTES)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
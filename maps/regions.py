@@ -0,0 +1,178 @@
+import json
+import sys
+import time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
+from config import Config
+from progress import Cancelled, Progress
+
+#region profiles - the same analysis for other parks than Šumava
+#
+#   data/regions.json
+#   {
+#     "sumava":   {"aoi": "data/sumava_data/sumava_aoi.gpkg", "zones": "data/sumava_zones_2.geojson"},
+#     "bavarian": {"aoi": "data/bavarian_forest/aoi.gpkg", "metric_crs": "EPSG:25832", "output": "data/regions/bf"}
+#   }
+#
+#a profile = AOI file, protected zones file (optional), metric CRS (default: UTM zone of the AOI), time zone of
+#imported ride dates (default Config.LOCAL_TIMEZONE) and an output folder (default Config.REGION_DIR / <name>); Region.apply() points Config at them, so every module runs unchanged.
+#every region has its own ride store (+ skip list) and webhook queue - `--region X ingest / webhook` clip the rides
+#to X's AOI on the way in, so they must not land in (or be skipped for) another region's store. Full resolution
+#streams (unclipped, by activity id) and the http/layer caches stay shared between the regions.
+#
+#batch mode (RegionBatch): the shared ride archive is read once, split by AOI (one STRtree, one query per region)
+#into the region folders, then every region runs the pipeline in its own worker process (own Config overrides)
+
+# Config paths that move into the region folder (file names kept)
+REGION_OUTPUTS = ['CLEANED_RIDES', 'TRAIL_NETWORK', 'TIME_CUBE', 'RIDE_SIMILARITY', 'OUTPUT_MAP',
+                  'LOOPS_MAP', 'CANDIDATES', 'TILE_DIR', 'DEM_CACHE', 'RIDE_STORE', 'WEBHOOK_QUEUE']
+REGION_RIDES = 'rides_region.gpkg'  # the region's part of the shared archive (becomes Config.STRAVA_RIDES)
+
+
+def utm_crs(aoi_path):
+    #UTM zone (WGS84) of the AOI centre, e.g. 'EPSG:32633' for Šumava
+    import geopandas as gpd
+    return f"EPSG:{gpd.read_file(aoi_path).estimate_utm_crs().to_epsg()}"
+
+
+class Region:
+    def __init__(self, name, aoi, zones=None, metric_crs=None, output=None, dem=None, timezone=None):
+        self.name = name
+        self.aoi = Path(aoi)
+        self.zones = Path(zones) if zones else None
+        self.metric_crs = metric_crs  # None => UTM zone of the AOI, read in apply() (loading profiles reads no AOI)
+        self.output = Path(output or Config.REGION_DIR / name)
+        self.dem = Path(dem) if dem else None
+        self.timezone = timezone
+
+    @staticmethod
+    def load_profiles(path=None):
+        #{name: Region} in file order
+        path = Path(path or Config.REGIONS)
+        if not path.exists():
+            raise FileNotFoundError(f"❌ Region profiles not found: {path}")
+        return {name: Region(name, **profile) for name, profile in json.loads(path.read_text()).items()}
+
+    @staticmethod
+    def get(name, path=None):
+        profiles = Region.load_profiles(path)
+        if name not in profiles:
+            raise KeyError(f"❌ Unknown region {name!r} - choose from {', '.join(profiles)}")
+        return profiles[name]
+
+    def as_dict(self):
+        #picklable / json form - what the batch workers get
+        return {'name': self.name, 'aoi': str(self.aoi), 'zones': self.zones and str(self.zones),
+                'metric_crs': self.metric_crs, 'output': str(self.output), 'dem': self.dem and str(self.dem),
+                'timezone': self.timezone}
+
+    @property
+    def rides_path(self):
+        return self.output / REGION_RIDES
+
+    def apply(self, rides=None):
+        #point Config at this region (class attributes => the whole process); rides = input rides file
+        #(default: the region's part of the archive if it was split, else the region's own ride store if rides were
+        #ingested for it, else the shared Config.STRAVA_RIDES)
+        if not self.aoi.exists():  # StudyArea would download the Šumava AOI in its place
+            raise FileNotFoundError(f"❌ AOI of region {self.name!r} not found: {self.aoi}")
+        for key in REGION_OUTPUTS:
+            setattr(Config, key, self.output / Path(getattr(Config, key)).name)
+        Config.STUDY_AREA = str(self.aoi)
+        Config.AOI_CACHE = self.output / 'aoi_prepared.gpkg'
+        Config.PROTECTED_ZONES = self.zones or self.output / 'no_zones.geojson'  # missing file => no zone constraints
+        self.metric_crs = self.metric_crs or utm_crs(self.aoi)
+        Config.METRIC_CRS = self.metric_crs
+        Config.OUTPUT_DIR = Config.STRAVA_DIR = self.output
+        Config.DEM = self.dem or self.output / 'dem.tif'
+        Config.LOCAL_TIMEZONE = self.timezone or Config.LOCAL_TIMEZONE
+        if rides is not None or self.rides_path.exists():
+            Config.STRAVA_RIDES = str(rides or self.rides_path)
+        elif Path(Config.RIDE_STORE).exists():
+            Config.STRAVA_RIDES = str(Config.RIDE_STORE)
+        print(f"🗺 Region {self.name}: {self.aoi} ({self.metric_crs}) -> {self.output}")
+        return self
+
+
+class RegionBatch:
+    def __init__(self, regions, workers=2, stage_workers=2):
+        self.regions = list(regions)
+        self.workers = workers
+        self.stage_workers = stage_workers  # pipeline threads inside every region process
+
+    def split_rides(self, archive=None):
+        #read the shared archive once, write every region the rides that touch its AOI -> {name: ride count}
+        import geopandas as gpd
+        import shapely
+
+        archive = archive or Config.STRAVA_RIDES
+        layer = 'rides' if str(archive).endswith('.gpkg') and 'rides' in gpd.list_layers(archive)['name'].values else None
+        rides = gpd.read_file(archive, layer=layer).to_crs('EPSG:4326')
+        tree = shapely.STRtree(rides.geometry.values)
+        print(f"\n📂 {len(rides)} rides in {archive} - splitting into {len(self.regions)} regions")
+
+        counts = {}
+        for region in self.regions:
+            if not region.aoi.exists():
+                counts[region.name] = 0
+                print(f"   ⚠️ {region.name}: AOI not found ({region.aoi})")
+                continue
+            aoi = shapely.union_all(gpd.read_file(region.aoi).to_crs('EPSG:4326').geometry.values)
+            part = rides.iloc[tree.query(aoi, predicate='intersects')].sort_index()  # archive order => same labels
+            counts[region.name] = len(part)
+            region.output.mkdir(parents=True, exist_ok=True)
+            if len(part):
+                part.to_file(region.rides_path, layer='rides', driver='GPKG')
+            print(f"   ✓ {region.name}: {len(part)} rides")
+        return counts
+
+    def run(self, archive=None, targets=None, force=(), progress=None):
+        #split + one pipeline run per region in a process pool -> {name: summary dict}
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        counts = self.split_rides(archive)
+        todo = [r for r in self.regions if counts[r.name]]
+        for region in self.regions:
+            if not counts[region.name]:
+                print(f"   ⚠️ {region.name}: no rides inside the AOI - skipped")
+
+        task = Progress.ensure(progress).task('regions', total=len(todo), unit='regions')
+        results = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(run_region, r.as_dict(), targets, tuple(force), self.stage_workers): r.name for r in todo}
+            try:
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    task.advance()
+            except Cancelled:
+                pool.shutdown(cancel_futures=True)  # regions already running finish, their artifacts are kept
+                raise
+        task.finish()
+
+        RegionBatch.report(results)
+        return results
+
+    @staticmethod
+    def report(results):
+        print(f"\n{'region':<16} {'rides':>7} {'segments':>9} {'time [s]':>9}  output")
+        for name, r in results.items():
+            if 'error' in r:
+                print(f"{name:<16} {'-':>7} {'-':>9} {r['seconds']:>9.1f}  ❌ {r['error']}")
+            else:
+                print(f"{name:<16} {r['rides']:>7} {r['segments']:>9} {r['seconds']:>9.1f}  {r['map']}")
+
+
+def run_region(region, targets=None, force=(), stage_workers=2):
+    #process pool worker - Config overrides stay in this process, pipeline imported after them
+    start = time.perf_counter()
+    Region(**region).apply()
+    try:
+        from pipeline import Pipeline
+        Config.ensure_directories()
+        artifacts = Pipeline(workers=stage_workers).run(targets, force={'enrich', 'suitability', *force})
+    except Exception as e:  # one broken region must not stop the batch
+        return {'error': repr(e), 'seconds': time.perf_counter() - start}
+    return {'rides': len(artifacts.get('rides', ())), 'segments': len(artifacts.get('network', ())),
+            'map': str(Config.OUTPUT_MAP), 'seconds': time.perf_counter() - start}
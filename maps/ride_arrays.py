@@ -0,0 +1,158 @@
+import sys
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+import numpy as np
+import geopandas as gpd
+import shapely
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
+from config import Config
+from coord_arrays import lines_from_offsets
+
+#compact ride collection for process pool workers - plain arrays in one shared memory block
+#instead of pickling a GeoDataFrame of shapely objects to every worker:
+#
+#   coords         float64 (n_points, 2)  all vertices back to back
+#   part_offsets   int64 (n_parts + 1)    line part i = coords[part_offsets[i]:part_offsets[i + 1]]
+#   ride_offsets   int64 (n_rides + 1)    parts of ride j = ride_offsets[j]:ride_offsets[j + 1] (clipped rides can be multi part)
+#   activity_id, distance_km, start, end, route_type (code into route_types)
+#
+#the parent builds it once (from_frame), workers get the small picklable handle() and attach() - no copy
+#shapely geometries / GeoSeries are rebuilt on demand
+
+class RideArrays:
+    __slots__ = ('coords', 'part_offsets', 'ride_offsets', 'activity_id', 'distance_km', 'start', 'end',
+                 'route_type', 'route_types', 'crs', '_shm', '_owner', '_layout')
+
+    FIELDS = ('coords', 'part_offsets', 'ride_offsets', 'activity_id', 'distance_km', 'start', 'end', 'route_type')
+
+    def __init__(self, shm, layout, route_types, crs, owner):
+        self._shm = shm
+        self._layout = layout
+        self._owner = owner
+        self.route_types = list(route_types)
+        self.crs = crs
+        for name, (offset, dtype, shape) in layout.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            if not owner:
+                array.flags.writeable = False  # workers only read
+            setattr(self, name, array)
+
+    # === BUILD / SHARE ===
+    @classmethod
+    def from_frame(cls, rides, crs=None, store=None):
+        #rides GeoDataFrame -> shared arrays; geometry in crs (default metric), taken from the store when given
+        crs = crs or Config.METRIC_CRS
+        if store is not None and 'rides' in store:
+            geoms = store.get('rides', crs).values
+        else:
+            geoms = rides.geometry.to_crs(crs).values
+
+        parts, ride_index = shapely.get_parts(geoms, return_index=True)
+        coords, part_index = shapely.get_coordinates(parts, return_index=True)
+        part_offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(part_index, minlength=len(parts)), out=part_offsets[1:])
+        ride_offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ride_index, minlength=len(geoms)), out=ride_offsets[1:])
+
+        # first vertex of the first part, last vertex of the last part (NaN for empty rides)
+        start = np.full((len(geoms), 2), np.nan)
+        end = np.full((len(geoms), 2), np.nan)
+        has = ride_offsets[1:] > ride_offsets[:-1]
+        start[has] = coords[part_offsets[ride_offsets[:-1][has]]]
+        end[has] = coords[part_offsets[ride_offsets[1:][has]] - 1]
+
+        if 'route_type' in rides.columns:
+            codes, route_types = rides['route_type'].factorize()
+        else:
+            codes, route_types = np.full(len(rides), -1), []
+        ids = rides['activity_id'] if 'activity_id' in rides.columns else rides.index
+
+        arrays = {
+            'coords': coords,
+            'part_offsets': part_offsets,
+            'ride_offsets': ride_offsets,
+            'activity_id': np.asarray(ids, dtype=np.int64),
+            'distance_km': np.asarray(rides['distance_km'] if 'distance_km' in rides.columns
+                                      else np.full(len(rides), np.nan), dtype=np.float64),
+            'start': start,
+            'end': end,
+            'route_type': np.asarray(codes, dtype=np.int8),
+        }
+
+        layout, size = {}, 0
+        for name in cls.FIELDS:
+            array = np.ascontiguousarray(arrays[name])
+            size = -(-size // 8) * 8  # 8 byte alignment
+            layout[name] = (size, array.dtype.str, array.shape)
+            size += array.nbytes
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        rides_arrays = cls(shm, layout, route_types, str(crs), owner=True)
+        for name in cls.FIELDS:
+            getattr(rides_arrays, name)[...] = arrays[name]
+        return rides_arrays
+
+    def handle(self):
+        #everything a worker needs to attach - a few hundred bytes to pickle
+        return (self._shm.name, self._layout, self.route_types, self.crs)
+
+    @classmethod
+    def attach(cls, handle):
+        name, layout, route_types, crs = handle
+        # python < 3.13 registers attached blocks with the resource tracker too - it would unlink
+        # the block when a worker exits, only the owner may do that
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+        return cls(shm, layout, route_types, crs, owner=False)
+
+    def close(self):
+        #owner frees the block, workers just detach
+        for name in self.FIELDS:
+            setattr(self, name, None)  # drop buffer exports before closing
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # === VIEWS ===
+    def __len__(self):
+        return len(self.ride_offsets) - 1
+
+    def part_lines(self):
+        #one LineString per part + ride position of each part (for STRtree queries)
+        lines = lines_from_offsets(self.coords, self.part_offsets)
+        ride_of_part = np.repeat(np.arange(len(self)), np.diff(self.ride_offsets))
+        return lines, ride_of_part
+
+    def lines(self, rides=None):
+        #shapely geometry per ride (LineString or MultiLineString) - rides = positions, default all
+        lines, ride_of_part = self.part_lines()
+        positions = np.arange(len(self)) if rides is None else np.asarray(rides)
+        counts = np.diff(self.ride_offsets)[positions]
+        geoms = np.full(len(positions), None, dtype=object)
+
+        single = counts == 1
+        geoms[single] = lines[self.ride_offsets[positions[single]]]
+        multi = counts > 1
+        if multi.any():
+            part_ids = np.concatenate([np.arange(self.ride_offsets[p], self.ride_offsets[p + 1]) for p in positions[multi]])
+            geoms[multi] = shapely.multilinestrings(lines[part_ids], indices=np.repeat(np.arange(multi.sum()), counts[multi]))
+        return geoms
+
+    def geoseries(self, rides=None):
+        positions = np.arange(len(self)) if rides is None else np.asarray(rides)
+        return gpd.GeoSeries(self.lines(positions), index=self.activity_id[positions], crs=self.crs)
+
+    def route_type_names(self):
+        names = np.array(list(self.route_types) + [None], dtype=object)
+        return names[self.route_type]  # code -1 (missing) -> None
@@ -0,0 +1,187 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+
+#ride similarity index - MinHash signatures over the trail segments a ride traverses + LSH banding
+#
+#a ride = set of tokens, one per MINHASH_PIECE_M of every segment it uses (a long shared trail weighs more than
+#a short shared connector) => Jaccard of two token sets ~ share of trail length the two rides have in common
+#
+#   signatures   (n_rides, MINHASH_PERMUTATIONS) uint32 - min of a universal hash per permutation
+#   band keys    signature cut into MINHASH_BANDS bands, each hashed to one uint64; rides with the same key in any
+#                band are candidates (pairs above ~(1/bands)^(1/rows) similarity are found with high probability)
+#
+#"similar to this ride" = one searchsorted per band in presorted keys + signature comparisons of the candidates;
+#near duplicates and route-shape clusters come from the band buckets - no pairwise geometry anywhere.
+#stored as .npz (Config.RIDE_SIMILARITY), built from the network 'rides' lists like the time cube
+
+PRIME = 4294967291  # largest prime < 2**32 - a * x + b never leaves uint64
+PIECES_PER_SEGMENT = 1 << 20  # token = segment_id * PIECES_PER_SEGMENT + piece
+MAX_BUCKET = 200  # bigger band buckets (the same commute 500 times) pair every member with one leader only
+
+
+def _mix(x):
+    #splitmix64 finalizer -> 32 bit - consecutive segment ids spread over the whole hash range
+    x = np.asarray(x, dtype=np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return (x ^ (x >> np.uint64(31))) >> np.uint64(32)
+
+
+class RideSimilarity:
+    def __init__(self, ride_ids, signatures, bands=None):
+        self.ride_ids = np.asarray(ride_ids)
+        self.signatures = signatures
+        self.bands = bands or Config.MINHASH_BANDS
+        self.rows = signatures.shape[1] // self.bands
+        self._position = pd.Index(self.ride_ids)
+
+        # band keys + one sorted copy per band (lookups are binary searches)
+        weights = np.random.default_rng(7).integers(1, 2 ** 63, self.rows, dtype=np.uint64) | np.uint64(1)
+        banded = signatures[:, :self.bands * self.rows].reshape(len(signatures), self.bands, self.rows)
+        self.keys = (banded.astype(np.uint64) * weights).sum(axis=2, dtype=np.uint64)  # wraps mod 2**64
+        self.order = np.argsort(self.keys, axis=0, kind='stable').T
+        self.sorted_keys = np.take_along_axis(self.keys, self.order.T, axis=0).T
+
+    # === BUILD / STORE ===
+    @staticmethod
+    def build(network, permutations=None, bands=None, piece_m=None, seed=1):
+        #network with a 'rides' list column (ride labels in 'activity_id', as for the time cube)
+        permutations = permutations or Config.MINHASH_PERMUTATIONS
+        piece_m = piece_m or Config.MINHASH_PIECE_M
+
+        # tokens = pieces of the segments; a ride that uses a segment has all of its pieces =>
+        # minimum per segment first (few tokens), then the minimum over the segments of every ride
+        pieces = np.maximum(1, np.ceil(network['distance_km'].to_numpy() * 1000 / piece_m)).astype(np.int64)
+        first_piece = np.cumsum(pieces) - pieces
+        piece = np.arange(pieces.sum()) - np.repeat(first_piece, pieces)
+        tokens = _mix(np.repeat(network['segment_id'].to_numpy(), pieces) * PIECES_PER_SEGMENT + piece)
+
+        rng = np.random.default_rng(seed)
+        a = rng.integers(1, PRIME, permutations, dtype=np.uint64)
+        b = rng.integers(0, PRIME, permutations, dtype=np.uint64)
+        segment_min = np.empty((permutations, len(network)), dtype=np.uint32)  # permutation major - reduceat runs along rows
+        for i in range(permutations):
+            if len(tokens):
+                segment_min[i] = np.minimum.reduceat((a[i] * tokens + b[i]) % np.uint64(PRIME), first_piece)
+
+        # (segment, ride) pairs grouped by ride
+        counts = np.array([len(r) for r in network['rides']], dtype=np.int64)
+        seg_pos = np.repeat(np.arange(len(network)), counts)
+        ride_of_pair = np.array([r['activity_id'] for rides in network['rides'] for r in rides], dtype=np.int64)
+        order = np.argsort(ride_of_pair, kind='stable')
+        ride_ids, starts = np.unique(ride_of_pair[order], return_index=True)
+        seg_pos = seg_pos[order]
+
+        signatures = np.empty((len(ride_ids), permutations), dtype=np.uint32)
+        if len(seg_pos):
+            for i in range(permutations):  # 1d reduceat per permutation - much faster than one 2d reduceat
+                signatures[:, i] = np.minimum.reduceat(segment_min[i][seg_pos], starts)
+
+        index = RideSimilarity(ride_ids, signatures, bands)
+        print(f"✓ Ride similarity index: {len(ride_ids)} rides, {permutations} permutations in {index.bands} bands "
+              f"(candidates from ~{(1 / index.bands) ** (1 / index.rows):.2f} similarity)")
+        return index
+
+    def save(self, path=None):
+        path = Path(path or Config.RIDE_SIMILARITY)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, ride_ids=self.ride_ids, signatures=self.signatures, bands=self.bands)
+
+    @staticmethod
+    def load(path=None):
+        with np.load(Path(path or Config.RIDE_SIMILARITY)) as data:
+            return RideSimilarity(data['ride_ids'], data['signatures'], int(data['bands']))
+
+    # === QUERIES ===
+    def estimate(self, a, b):
+        #estimated Jaccard similarity of ride positions a and b (arrays, pairwise)
+        out = np.empty(len(a), dtype=np.float64)
+        for s in range(0, len(a), 100_000):  # bounded (pairs x permutations) temporary
+            out[s:s + 100_000] = (self.signatures[a[s:s + 100_000]] == self.signatures[b[s:s + 100_000]]).mean(axis=1)
+        return out
+
+    def candidates(self, pos):
+        #ride positions sharing at least one band bucket with ride position pos
+        found = []
+        for band in range(self.bands):
+            key = self.keys[pos, band]
+            lo = np.searchsorted(self.sorted_keys[band], key, side='left')
+            hi = np.searchsorted(self.sorted_keys[band], key, side='right')
+            found.append(self.order[band][lo:hi])
+        found = np.unique(np.concatenate(found))
+        return found[found != pos]
+
+    def similar(self, ride_id, k=10, min_similarity=0.0):
+        #most similar rides to ride_id -> DataFrame(ride_id, similarity), best first (empty for unknown rides)
+        if ride_id not in self._position:
+            return pd.DataFrame({'ride_id': [], 'similarity': []})
+        pos = self._position.get_loc(ride_id)
+        others = self.candidates(pos)
+        sim = self.estimate(np.full(len(others), pos), others)
+        keep = np.argsort(-sim, kind='stable')[:k]
+        keep = keep[sim[keep] >= min_similarity]
+        return pd.DataFrame({'ride_id': self.ride_ids[others[keep]], 'similarity': sim[keep]})
+
+    def pairs(self, threshold=0.5):
+        #every candidate pair with estimated similarity >= threshold -> (positions a, positions b, similarity)
+        found = []
+        for band in range(self.bands):
+            keys, order = self.sorted_keys[band], self.order[band]
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            sizes = np.diff(np.r_[starts, len(keys)])
+            for size in np.unique(sizes[sizes > 1]):
+                first = starts[sizes == size]
+                if size <= MAX_BUCKET:
+                    i, j = np.triu_indices(size, 1)
+                else:
+                    i, j = np.zeros(size - 1, dtype=np.int64), np.arange(1, size)
+                found.append(np.column_stack([order[(first[:, None] + i).ravel()], order[(first[:, None] + j).ravel()]]))
+        if not found:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+
+        pairs = np.sort(np.concatenate(found), axis=1)
+        n = np.int64(len(self.ride_ids))
+        unique = np.sort(pairs[:, 0] * n + pairs[:, 1])  # the same pair from several bands
+        unique = unique[np.r_[True, unique[1:] != unique[:-1]]]
+        a, b = unique // n, unique % n
+        sim = self.estimate(a, b)
+        keep = sim >= threshold
+        return a[keep], b[keep], sim[keep]
+
+    def near_duplicates(self, threshold=0.9):
+        #ride pairs on (almost) the same trails - the same ride uploaded twice, a daily commute
+        a, b, sim = self.pairs(threshold)
+        order = np.argsort(-sim, kind='stable')
+        return pd.DataFrame({'ride_a': self.ride_ids[a[order]], 'ride_b': self.ride_ids[b[order]], 'similarity': sim[order]})
+
+    def clusters(self, threshold=0.5, min_size=3):
+        #route-shape clusters -> Series of labels by ride id, 0 = biggest, -1 = fewer than min_size rides (like DBSCAN)
+        #leader clustering: the ride with the most similar rides takes all of them that are still free, then the next;
+        #every member is >= threshold similar to its leader (connected components would chain overlapping rides)
+        from scipy.sparse import csr_matrix
+
+        a, b, _ = self.pairs(threshold)
+        n = len(self.ride_ids)
+        graph = csr_matrix((np.ones(2 * len(a), dtype=np.int8), (np.r_[a, b], np.r_[b, a])), shape=(n, n))
+        degree = np.diff(graph.indptr)
+        labels = np.full(n, -1, dtype=np.int64)
+        cluster = 0
+        for leader in np.argsort(-degree, kind='stable')[:np.count_nonzero(degree)].tolist():
+            if labels[leader] >= 0:
+                continue
+            members = graph.indices[graph.indptr[leader]:graph.indptr[leader + 1]]
+            labels[members[labels[members] < 0]] = cluster
+            labels[leader] = cluster
+            cluster += 1
+
+        sizes = np.bincount(labels[labels >= 0], minlength=cluster)
+        rank = np.empty(cluster, dtype=np.int64)
+        rank[np.argsort(-sizes, kind='stable')] = np.arange(cluster)
+        big = (labels >= 0) & (sizes[np.maximum(labels, 0)] >= min_size)
+        labels = np.where(big, rank[np.maximum(labels, 0)], -1)
+        return pd.Series(labels, index=self.ride_ids, name='route_cluster')
@@ -0,0 +1,193 @@
+import sys
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+from pyproj import Transformer
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+
+#loop generator - "~30 km loop from this car park on popular trails"
+#
+#network segments -> graph (CSR arrays: nodes = segment ends, edges = segments).
+#edge cost = length / (1 + w * log(1 + ride_count)) => popular trails are "shorter".
+#per start node one dijkstra tree is computed and cached (distance-to-start table).
+#a loop = way out along the tree to a turn point + way back from there with the outbound edges
+#penalized; turn points are picked in different directions around the start => diverse loops
+
+class TrailGraph:
+    def __init__(self, network_proj, popularity_weight=None, cache_size=32):
+        w = Config.ROUTE_POPULARITY_WEIGHT if popularity_weight is None else popularity_weight
+        geoms = network_proj.geometry.values
+        self.geoms = geoms
+        self.crs = network_proj.crs
+        self.segment_ids = network_proj['segment_id'].to_numpy()
+        self.length = shapely.length(geoms)
+        self.rides = network_proj['ride_count'].to_numpy().astype(np.float64)
+
+        # nodes = distinct segment end points (0.1 m grid - tile borders do not meet bit-exactly)
+        ends = np.concatenate([shapely.get_coordinates(shapely.get_point(geoms, 0)),
+                               shapely.get_coordinates(shapely.get_point(geoms, -1))])
+        self.nodes, node_of_end = np.unique(np.round(ends, 1), axis=0, return_inverse=True)
+        node_of_end = node_of_end.ravel()
+        self.u, self.v = node_of_end[:len(geoms)], node_of_end[len(geoms):]
+
+        # parallel segments between the same nodes - the cheapest one is the edge
+        self.cost = self.length / (1 + w * np.log1p(self.rides))
+        order = np.lexsort((self.cost, np.maximum(self.u, self.v), np.minimum(self.u, self.v)))
+        pair = np.column_stack([np.minimum(self.u, self.v), np.maximum(self.u, self.v)])[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = np.any(pair[1:] != pair[:-1], axis=1)
+        edges = order[first & (self.u[order] != self.v[order])]  # self loops are of no use for routing
+
+        rows = np.concatenate([self.u[edges], self.v[edges]])
+        cols = np.concatenate([self.v[edges], self.u[edges]])
+        n = len(self.nodes)
+        self.graph = csr_matrix((np.concatenate([self.cost[edges]] * 2), (rows, cols)), shape=(n, n))
+        # segment behind every stored csr value (same construction => same order)
+        self.edge_of_data = csr_matrix((np.concatenate([edges + 1] * 2), (rows, cols)), shape=(n, n)).data - 1
+        self.edge_lookup = {(a, b): e for a, b, e in zip(rows.tolist(), cols.tolist(), np.concatenate([edges] * 2).tolist())}
+
+        # trail length per connected part - a start on a short isolated stub is moved to a part that fits the loop
+        _, self.component = connected_components(self.graph, directed=False)
+        self.component_m = np.bincount(self.component[self.u[edges]], weights=self.length[edges],
+                                       minlength=len(self.nodes))  # component ids < nodes (an empty network has none)
+
+        self._trees = OrderedDict()  # start node -> (predecessors, path length) - LRU
+        self._cache_size = cache_size
+        self._to_metric = Transformer.from_crs('EPSG:4326', self.crs, always_xy=True)
+
+    @staticmethod
+    def from_network(network, store=None):
+        from geometry_store import GeometryStore
+        store = GeometryStore.ensure(store, network=network)
+        return TrailGraph(store.metric_frame('network', network))
+
+    # === SHORTEST PATH TABLES ===
+    def nearest_node(self, lat, lon, min_component_m=0):
+        if not len(self.nodes):
+            return -1, float('inf')
+        x, y = self._to_metric.transform(lon, lat)
+        d = np.hypot(self.nodes[:, 0] - x, self.nodes[:, 1] - y)
+        d[self.component_m[self.component] < min_component_m] = np.inf
+        node = int(np.argmin(d))
+        return node, float(d[node])
+
+    def tree(self, start):
+        #dijkstra from start: predecessors + real length [m] of the cheapest path to every node (cached)
+        if start in self._trees:
+            self._trees.move_to_end(start)
+            return self._trees[start]
+
+        cost, pred = dijkstra(self.graph, indices=start, return_predecessors=True)
+        reached = np.flatnonzero(np.isfinite(cost))
+        reached = reached[np.argsort(cost[reached], kind='stable')]  # parents come before children
+        path_len = np.full(len(self.nodes), np.inf)
+        path_len[start] = 0.0
+        for node in reached[1:].tolist():
+            parent = int(pred[node])
+            path_len[node] = path_len[parent] + self.length[self.edge_lookup[(parent, node)]]
+
+        self._trees[start] = (pred, path_len)
+        if len(self._trees) > self._cache_size:
+            self._trees.popitem(last=False)
+        return self._trees[start]
+
+    def precompute(self, starts):
+        #warm the cache, e.g. for trail center candidates or popular start points
+        for start in starts:
+            self.tree(start)
+
+    def _path_edges(self, pred, target):
+        edges, node = [], target
+        while pred[node] >= 0:
+            edges.append(self.edge_lookup[(int(pred[node]), int(node))])
+            node = pred[node]
+        return edges[::-1]
+
+    # === LOOPS ===
+    def loops(self, lat, lon, target_km, n=5, directions=12, penalty=8.0):
+        target = target_km * 1000
+        start, snap_m = self.nearest_node(lat, lon, min_component_m=0.6 * target)
+        if not np.isfinite(snap_m):
+            return []
+        pred, path_len = self.tree(start)
+
+        # turn points: per direction sector the nodes closest to 35/45/55 % of the target away
+        # (the way back is rarely as long as the way out, the best of them per sector is kept)
+        turn = np.flatnonzero((path_len > 0.25 * target) & (path_len < 0.65 * target))
+        if len(turn) == 0:
+            return []
+        dx, dy = (self.nodes[turn] - self.nodes[start]).T
+        sector = ((np.arctan2(dy, dx) + np.pi) / (2 * np.pi) * directions).astype(int) % directions
+        picks = [(s, turn[sector == s][np.argmin(np.abs(path_len[turn[sector == s]] - f * target))])
+                 for s in np.unique(sector) for f in (0.35, 0.45, 0.55)]
+
+        loops = {}
+        for s, turn_node in dict.fromkeys(picks):
+            out = self._path_edges(pred, turn_node)
+
+            # way back: same graph, outbound edges made expensive
+            data = self.graph.data.copy()
+            data[np.isin(self.edge_of_data, out)] *= penalty
+            back_graph = csr_matrix((data, self.graph.indices, self.graph.indptr), shape=self.graph.shape)
+            _, back_pred = dijkstra(back_graph, indices=turn_node, return_predecessors=True)
+            back = self._path_edges(back_pred, start)
+
+            edges = out + back
+            length = self.length[edges].sum()
+            reused = self.length[np.intersect1d(out, back)].sum()
+            rides_per_km = (self.length[edges] * self.rides[edges]).sum() / length
+            loop = {
+                'edges': edges,
+                'length_km': length / 1000,
+                'rides_per_km': rides_per_km,  # length weighted mean ride_count
+                'overlap': reused * 2 / length,  # share ridden twice (out and back)
+                'score': rides_per_km * max(0.0, 1 - abs(length - target) / target) ** 2 * (1 - reused * 2 / length),
+            }
+            if s not in loops or loop['score'] > loops[s]['score']:
+                loops[s] = loop
+
+        # best first, drop loops that mostly repeat an already chosen one
+        chosen = []
+        for loop in sorted(loops.values(), key=lambda l: -l['score']):
+            edges = set(loop['edges'])
+            if all(len(edges & set(c['edges'])) / len(edges | set(c['edges'])) < 0.5 for c in chosen):
+                chosen.append(loop)
+            if len(chosen) == n:
+                break
+
+        for loop in chosen:
+            loop['geometry'] = self._loop_geometry(loop['edges'])
+            loop['segment_ids'] = self.segment_ids[loop['edges']].tolist()
+            loop['start_snap_m'] = snap_m
+        return chosen
+
+    def _loop_geometry(self, edges):
+        return shapely.line_merge(shapely.multilinestrings(self.geoms[edges]))
+
+
+class RoutePlannerLayer:
+    COLORS = ['#1abc9c', '#e67e22', '#2980b9', '#8e44ad', '#c0392b', '#16a085', '#d35400']
+
+    @staticmethod
+    def add_loops(m, loops, lat, lon, crs, target_km):
+        import folium
+        import geopandas as gpd
+
+        folium.Marker([lat, lon], tooltip=f'Start ({target_km:.0f} km loops)',
+                      icon=folium.Icon(color='green', icon='play')).add_to(m)
+        for i, loop in enumerate(loops):
+            color = RoutePlannerLayer.COLORS[i % len(RoutePlannerLayer.COLORS)]
+            layer = folium.FeatureGroup(name=f"Loop {i + 1}: {loop['length_km']:.1f} km, "
+                                             f"{loop['rides_per_km']:.1f} rides/km", show=(i == 0))
+            geometry = gpd.GeoSeries([loop['geometry']], crs=crs).to_crs('EPSG:4326')
+            folium.GeoJson(
+                geometry.__geo_interface__,
+                style_function=lambda x, c=color: {'color': c, 'weight': 5, 'opacity': 0.9},
+                tooltip=f"Loop {i + 1}: {loop['length_km']:.1f} km • {loop['rides_per_km']:.1f} rides/km "
+                        f"• {loop['overlap'] * 100:.0f}% out and back"
+            ).add_to(layer)
+            layer.add_to(m)
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+import numpy as np
+import shapely
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+
+#persisted spatial indexes - packed STR R-trees as plain .npy arrays next to the data they index
+#
+#   boxes    (n_nodes, 4) minx, miny, maxx, maxy - the item boxes in tree order (leaves), then every level
+#            up to the root; node j of a level covers entries j*NODE_SIZE.. of the level below
+#   items    leaf position -> geometry position in the indexed array
+#   levels   start of every level in boxes (last = len(boxes))
+#
+#the tree is tagged with a content hash (item bounds + node size, or a fingerprint of the source file the caller
+#passes); a warm run memory-maps the arrays instead of building - load is O(1), pages are read when queried.
+#queries are vectorized level by level (every query box x the nodes still overlapping it), exact predicates are
+#shapely calls on the candidate pairs. A tree of points answers 'dwithin' from its boxes alone, so a query tool
+#does not even need the geometries (query_service: ride start points)
+#
+#   <data>.sindex/<name>/meta.json + <version>/{boxes,items,levels}.npy
+#
+#a save writes a new version folder and switches meta.json last (atomic rename) - a process that has the old
+#tree memory mapped (a running query service) keeps reading the old, unlinked files
+
+NODE_SIZE = 16  # entries per node - 16 keeps the tree shallow (100k items => 5 levels)
+QUERY_CHUNK = 4096  # query boxes traversed together (bounded candidate arrays)
+INDEX_SUFFIX = '.sindex'
+ARRAYS = ('boxes', 'items', 'levels')
+
+
+def content_hash(bounds, node_size=NODE_SIZE):
+    #hash of the item boxes - the tree is valid for any geometries with exactly these bounds
+    bounds = np.ascontiguousarray(bounds, dtype=np.float64)
+    return hashlib.sha1(bounds.tobytes() + str((bounds.shape, node_size)).encode()).hexdigest()
+
+
+def file_fingerprint(*paths, extra=None):
+    #cheap tag for 'the source files did not change' - path, size and mtime (no read of the data)
+    parts = [(str(Path(p).resolve()), Path(p).stat().st_size, Path(p).stat().st_mtime_ns) for p in paths]
+    return hashlib.sha1(json.dumps([parts, extra], default=str).encode()).hexdigest()
+
+
+def index_dir(data_path, name):
+    #index folder next to a data file, e.g. data/strava/rides_cleaned.gpkg.sindex/starts
+    data_path = Path(data_path)
+    return data_path.with_name(data_path.name + INDEX_SUFFIX) / name
+
+
+def analysis_indexes():
+    #persisted trees the suitability analysis uses - shared with the query service (same metric segments)
+    return {'segments': index_dir(Config.TRAIL_NETWORK, 'segments'), 'zones': index_dir(Config.PROTECTED_ZONES, 'zones')}
+
+
+class PackedRTree:
+    def __init__(self, boxes, items, levels, node_size=NODE_SIZE, tag=None, points=False, geometries=None):
+        self.boxes = boxes
+        self.items = items
+        self.levels = levels
+        self.node_size = node_size
+        self.tag = tag
+        self.points = points  # every item box is a point => leaf boxes are the coordinates
+        self.geometries = geometries  # needed for exact predicates, not for box / point queries
+
+    def __len__(self):
+        return len(self.items)
+
+    # === BUILD ===
+    @staticmethod
+    def build(bounds, node_size=NODE_SIZE, tag=None, geometries=None):
+        #Sort-Tile-Recursive packing: items sorted into vertical slices by x centre, by y centre inside a slice
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        n = len(bounds)
+        empty = np.isnan(bounds).any(axis=1)  # empty geometries are never found
+        points = bool((~empty).any()) and bool(np.all(bounds[~empty, 0] == bounds[~empty, 2])
+                                               and np.all(bounds[~empty, 1] == bounds[~empty, 3]))
+        cx, cy = (bounds[:, 0] + bounds[:, 2]) / 2, (bounds[:, 1] + bounds[:, 3]) / 2
+        bounds = np.where(empty[:, None], np.array([np.inf, np.inf, -np.inf, -np.inf]), bounds)
+        n_leaves = max(1, -(-n // node_size))
+        slice_size = node_size * int(np.ceil(np.sqrt(n_leaves)))
+        rank_x = np.empty(n, dtype=np.int64)
+        rank_x[np.argsort(np.where(empty, np.inf, cx), kind='stable')] = np.arange(n)
+        items = np.lexsort((np.where(empty, np.inf, cy), rank_x // slice_size)).astype(np.int64)
+
+        levels_boxes, levels = [bounds[items]], [0]
+        while len(levels_boxes[-1]) > 1 or len(levels) == 1:
+            child = levels_boxes[-1]
+            starts = np.arange(0, len(child), node_size)
+            if not len(child):
+                break
+            parent = np.column_stack([np.minimum.reduceat(child[:, 0], starts), np.minimum.reduceat(child[:, 1], starts),
+                                      np.maximum.reduceat(child[:, 2], starts), np.maximum.reduceat(child[:, 3], starts)])
+            levels.append(levels[-1] + len(child))
+            levels_boxes.append(parent)
+        levels.append(levels[-1] + len(levels_boxes[-1]))
+        return PackedRTree(np.concatenate(levels_boxes), items, np.array(levels, dtype=np.int64), node_size, tag, points,
+                           geometries)
+
+    @staticmethod
+    def from_geometries(geometries, node_size=NODE_SIZE):
+        return PackedRTree.build(shapely.bounds(geometries), node_size, geometries=geometries)
+
+    # === STORE ===
+    def save(self, path):
+        path = Path(path)
+        version = f"{(self.tag or 'untagged')[:16]}-{os.getpid()}"
+        (path / version).mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            np.save(path / version / f'{name}.npy', np.ascontiguousarray(getattr(self, name)))
+        meta = path / f'meta.json.{os.getpid()}'
+        meta.write_text(json.dumps({'tag': self.tag, 'version': version, 'size': len(self), 'node_size': self.node_size,
+                                    'points': self.points}))
+        os.replace(meta, path / 'meta.json')
+        for old in path.iterdir():
+            if old.is_dir() and old.name != version:
+                shutil.rmtree(old, ignore_errors=True)
+
+    @staticmethod
+    def load(path, tag=None, mmap=True):
+        #saved tree (memory mapped) or None if there is none / it was built for other content (tag mismatch)
+        path = Path(path)
+        try:
+            meta = json.loads((path / 'meta.json').read_text())
+            if tag is not None and meta['tag'] != tag:
+                return None
+            arrays = {name: np.load(path / meta['version'] / f'{name}.npy', mmap_mode='r' if mmap else None)
+                      for name in ARRAYS}
+        except (OSError, ValueError, KeyError):  # missing, replaced while reading, older layout => rebuilt
+            return None
+        if len(arrays['items']) != meta['size']:
+            return None
+        # plain ndarray views of the mappings - the memmap subclass costs more than a small query
+        return PackedRTree(*(np.asarray(arrays[name]) for name in ARRAYS), meta['node_size'], meta['tag'], meta['points'])
+
+    @staticmethod
+    def cached(geometries, path, tag=None, node_size=NODE_SIZE):
+        #tree for geometries from path if it was built for the same content, else built + saved there
+        bounds = shapely.bounds(geometries)
+        tag = tag or content_hash(bounds, node_size)
+        tree = PackedRTree.load(path, tag)
+        if tree is None:
+            tree = PackedRTree.build(bounds, node_size, tag)
+            tree.save(path)
+        tree.geometries = geometries
+        return tree
+
+    # === QUERIES ===
+    def query_bounds(self, boxes):
+        #(query position, item position) pairs whose boxes overlap
+        q, leaf = self._candidates(boxes)
+        return q, self.items[leaf]
+
+    def _candidates(self, boxes):
+        #(query position, leaf position) pairs - QUERY_CHUNK query boxes at a time
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        found = [self._traverse(boxes[a:a + QUERY_CHUNK], a) for a in range(0, len(boxes), QUERY_CHUNK)]
+        if not found or not len(self.items):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate([f[0] for f in found]), np.concatenate([f[1] for f in found])
+
+    def _traverse(self, boxes, first_query):
+        #every query box x the nodes of a level that overlap it, from the root down to the leaves
+        levels, size = self.levels, self.node_size
+        top = len(levels) - 2
+        single = len(boxes) == 1  # one box (query service) - the same walk without the per pair query boxes
+        x0, y0, x1, y1 = boxes[0] if single else boxes.T
+        q = np.repeat(np.arange(len(boxes)), levels[top + 1] - levels[top])
+        node = np.tile(np.arange(levels[top], levels[top + 1]), len(boxes))
+        for level in range(top, -1, -1):
+            b = self.boxes[node]
+            if single:
+                hit = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)
+            else:
+                hit = (b[:, 0] <= x1[q]) & (b[:, 2] >= x0[q]) & (b[:, 1] <= y1[q]) & (b[:, 3] >= y0[q])
+            q, node = q[hit], node[hit]
+            if level == 0:
+                break
+            # children of node j = entries levels[L-1] + (j - levels[L]) * size .. of the level below
+            first = levels[level - 1] + (node - levels[level]) * size
+            count = np.minimum(size, levels[level] - first)
+            node = np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())
+            q = np.zeros(len(node), dtype=np.int64) if single else np.repeat(q, count)
+        return q + first_query, node
+
+    def query(self, geometry, predicate=None, distance=None):
+        #like shapely.STRtree.query - one geometry -> item positions, an array -> (2, n) (query, item) positions
+        scalar = np.ndim(geometry) == 0
+        geometry = np.atleast_1d(np.asarray(geometry, dtype=object))
+        boxes = shapely.bounds(geometry)
+        if predicate == 'dwithin':
+            boxes = boxes + np.array([-distance, -distance, distance, distance])
+        q, leaf = self._candidates(boxes)
+        i = self.items[leaf]
+        if predicate is None or not len(q):
+            return i if scalar else np.vstack([q, i])
+
+        if predicate == 'dwithin' and self.points and self.geometries is None:
+            # distance to the points straight from the leaf boxes - the geometries are not needed
+            keep = shapely.dwithin(geometry[q], shapely.points(self.boxes[leaf, :2]), distance)
+        elif self.geometries is None:
+            raise ValueError(f"❌ predicate {predicate!r} needs the indexed geometries (tree.geometries)")
+        else:
+            shapely.prepare(geometry)
+            if predicate == 'dwithin':
+                keep = shapely.dwithin(geometry[q], self.geometries[i], distance)
+            else:
+                keep = getattr(shapely, predicate)(geometry[q], self.geometries[i])
+        return i[keep] if scalar else np.vstack([q[keep], i[keep]])
@@ -105,7 +105,7 @@ def main():
 
     candidates = gpd.read_file(candidates_path)
     BaseLayers.add_description(m, network, candidates) 
-    TrailsLayers.add_trail_network(m, network)
+    TrailsLayers.add_trail_network(m, network, rides)
     TrailsLayers.add_trail_net(m, rides)
     
     # Add layer control
@@ -0,0 +1,170 @@
+import shutil
+import sys
+from pathlib import Path
+import numpy as np
+import geopandas as gpd
+import pyogrio
+import shapely
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'preprocessing'))
+from config import Config
+from aoi_service import StudyArea
+from geometry_store import GeometryStore
+from loader import DataLoader
+from network_layer import NetworkBuilder
+from elevation import DEM, Elevation
+from progress import Progress
+
+#out-of-core mode for archives bigger than RAM - rides are partitioned into square tiles
+#(grid anchored at the study area, Config.TILE_SIZE_M) and processed one tile at a time:
+#
+#   1. partition   read rides in chunks, enrich them (appended to CLEANED_RIDES) and append every ride
+#                  clipped to each tile it touches into data/tiles/tile_<x>_<y>.gpkg (metric CRS)
+#   2. per tile    network from the tile's rides, cut to the tile, rides matched to its segments
+#   3. merge       tile networks appended to TRAIL_NETWORK, segment ids renumbered
+#
+#tiles carry a halo (match buffer + snap tolerance) - a segment near the tile edge still sees every
+#ride within the buffer of it. Segments are split where they cross a tile edge (shorter segments =>
+#slightly lower counts there); with a single tile the result equals the in-memory build.
+#memory is bounded by one chunk / one tile.
+
+class TileGrid:
+    def __init__(self, origin, size):
+        self.x0, self.y0 = origin
+        self.size = size
+
+    @staticmethod
+    def for_study_area(study_area_path=None, size=None):
+        bounds = StudyArea.load(study_area_path).simplified(Config.METRIC_CRS).total_bounds
+        return TileGrid((bounds[0], bounds[1]), size or Config.TILE_SIZE_M)
+
+    def ranges(self, bounds, halo=0):
+        #tile index ranges (ix0, iy0, ix1, iy1) touched by each bbox grown by halo
+        b = np.atleast_2d(bounds)
+        lo = np.floor((b[:, :2] - halo - (self.x0, self.y0)) / self.size).astype(int)
+        hi = np.floor((b[:, 2:] + halo - (self.x0, self.y0)) / self.size).astype(int)
+        return np.column_stack([lo, hi])
+
+    def rect(self, key, halo=0):
+        ix, iy = key
+        x, y = self.x0 + ix * self.size, self.y0 + iy * self.size
+        return (x - halo, y - halo, x + self.size + halo, y + self.size + halo)
+
+
+class TiledNetwork:
+    def __init__(self, grid, tile_dir=None, halo=None):
+        self.grid = grid
+        self.tile_dir = Path(tile_dir or Config.TILE_DIR)
+        self.halo = halo if halo is not None else Config.INTERSECTION_BUFFER + Config.SNAP_TOLERANCE
+        self.dem = DEM.load()  # memory mapped once, shared by all tiles (None without a DEM)
+
+    def _path(self, key):
+        return self.tile_dir / f"tile_{key[0]}_{key[1]}.gpkg"
+
+    def tiles(self):
+        keys = [tuple(int(v) for v in p.stem.split('_')[1:]) for p in self.tile_dir.glob('tile_*.gpkg')]
+        return sorted(keys)
+
+    # === 1. PARTITION ===
+    def partition(self, rides_path, chunk_size=None, cleaned_path=None, progress=None):
+        chunk_size = chunk_size or Config.TILE_CHUNK_RIDES
+        cleaned_path = cleaned_path or Config.CLEANED_RIDES
+        if self.tile_dir.exists():
+            shutil.rmtree(self.tile_dir)  # tiles are rebuilt from scratch - appends must not double rides
+        self.tile_dir.mkdir(parents=True)
+
+        layer = 'rides' if str(rides_path).endswith('.gpkg') and 'rides' in gpd.list_layers(rides_path)['name'].values else None
+        total = pyogrio.read_info(rides_path, layer=layer)['features']
+        print(f"\n⚙️ Partitioning {total} rides into {self.grid.size / 1000:.0f} km tiles ({self.tile_dir})")
+
+        task = Progress.ensure(progress).task('partition', total=total, unit='rides')
+        written = 0
+        for start in range(0, total, chunk_size):
+            rides = gpd.read_file(rides_path, layer=layer, rows=slice(start, start + chunk_size))
+            if rides.crs != 'EPSG:4326':
+                rides = rides.to_crs('EPSG:4326')
+            rides = DataLoader.clean_ride_names(rides)
+
+            store = GeometryStore()
+            store.register('rides', rides)
+            # labels = row positions in the cleaned file, as if it was read whole
+            rides = DataLoader.clean_tracks(rides, store=store, first_label=written)
+            rides = DataLoader.calculate_km(rides, store=store)
+            DataLoader.save_rides(rides, cleaned_path, mode='w' if written == 0 else 'a')
+            written += len(rides)
+            self._write_tiles(rides, store.metric('rides').values)
+            task.advance(min(chunk_size, total - start))
+
+        task.finish()
+        print(f"   ✓ {len(self.tiles())} tiles")
+
+    def _write_tiles(self, rides, geoms):
+        ranges = self.grid.ranges(shapely.bounds(geoms), self.halo)
+        members = {}  # tile -> ride positions
+        for pos, (ix0, iy0, ix1, iy1) in enumerate(ranges):
+            for ix in range(ix0, ix1 + 1):
+                for iy in range(iy0, iy1 + 1):
+                    members.setdefault((ix, iy), []).append(pos)
+
+        for key, positions in members.items():
+            pieces = shapely.clip_by_rect(geoms[positions], *self.grid.rect(key, self.halo))
+            keep = ~shapely.is_empty(pieces)
+            if not keep.any():
+                continue  # bbox touched the tile, the line did not
+            tile = gpd.GeoDataFrame(
+                {'ride': rides.index[positions][keep], 'distance_km': rides['distance_km'].to_numpy()[positions][keep]},
+                geometry=pieces[keep], crs=Config.METRIC_CRS
+            )
+            path = self._path(key)
+            tile.to_file(path, driver='GPKG', mode='a' if path.exists() else 'w')
+
+    # === 2. + 3. PER TILE, MERGE ===
+    def build(self, output_path=None, tolerance=None, buffer_distance=None, progress=None):
+        output_path = Path(output_path or Config.TRAIL_NETWORK)
+        tolerance = tolerance if tolerance is not None else Config.SNAP_TOLERANCE
+        buffer_distance = buffer_distance if buffer_distance is not None else Config.INTERSECTION_BUFFER
+        if output_path.exists():
+            output_path.unlink()
+
+        n_segments = 0
+        keys = self.tiles()
+        task = Progress.ensure(progress).task('tiles', total=len(keys), unit='tiles')
+        for i, key in enumerate(keys):
+            network = self.build_tile(key, tolerance, buffer_distance)
+            if network is not None:
+                network['segment_id'] = np.arange(n_segments, n_segments + len(network))
+                n_segments += len(network)
+                NetworkBuilder.save_network(network.to_crs('EPSG:4326'), output_path, mode='a' if output_path.exists() else 'w')
+                print(f"   ✓ Tile {i + 1}/{len(keys)} {key}: {len(network)} segments")
+            task.advance()  # cancelled => the tiles saved so far stay in output_path
+
+        task.finish()
+        print(f"✓ Network saved: {n_segments} segments from {len(keys)} tiles -> {output_path}")
+        return output_path
+
+    def build_tile(self, key, tolerance, buffer_distance):
+        #network + ride matching for one tile - only this tile's rides are in memory
+        rides = gpd.read_file(self._path(key)).set_index('ride')
+        rides.index.name = None
+
+        store = GeometryStore()
+        store.register('rides', rides)
+        network = NetworkBuilder.create_network(rides, tolerance=tolerance, store=store)
+
+        # keep the part inside the tile proper - the halo belongs to the neighbours
+        segments = shapely.get_parts(shapely.clip_by_rect(network.geometry.values, *self.grid.rect(key)))
+        segments = segments[(shapely.get_type_id(segments) == 1) & (shapely.length(segments) > 0)]
+        if len(segments) == 0:
+            return None
+
+        network = gpd.GeoDataFrame({'segment_id': np.arange(len(segments)), 'length_m': shapely.length(segments)},
+                                   geometry=segments, crs=Config.METRIC_CRS)
+        network['distance_km'] = network['length_m'] / 1000
+        store.register('network', network)
+        network = NetworkBuilder.map_rides_to_segments(network, rides, buffer_distance=buffer_distance, store=store,
+                                                       workers=Config.MATCH_WORKERS)
+        return Elevation.add_to_network(network, dem=self.dem, store=store)
+
+    def run(self, rides_path, output_path=None, progress=None):
+        self.partition(rides_path, progress=progress)
+        return self.build(output_path, progress=progress)
@@ -0,0 +1,107 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+
+#segment x time popularity cube - built once from the ride/segment matching + ride dates
+#
+#   monthly        (n_segments, n_months)   rides per segment and calendar month (months = first..last ride)
+#   weekday_hour   (n_segments, 7, 24)      rides per segment by weekday (Mon = 0) and start hour
+#
+#stored as .npz (Config.TIME_CUBE) - "summer 2023" or a per-segment trend is an array slice,
+#no new map_rides_to_segments run
+
+class TimeCube:
+    def __init__(self, segment_ids, months, monthly, weekday_hour):
+        self.segment_ids = np.asarray(segment_ids)
+        self.months = np.asarray(months, dtype='datetime64[M]')
+        self.monthly = monthly
+        self.weekday_hour = weekday_hour
+
+    # === BUILD / STORE ===
+    @staticmethod
+    def build(network, dates):
+        #network with a 'rides' list column + ride dates (Series indexed like the rides, i.e. 'activity_id' in the lists)
+        dates = pd.to_datetime(dates, errors='coerce')
+        if getattr(dates.dt, 'tz', None) is not None:
+            dates = dates.dt.tz_localize(None)  # local time is what matters for weekday/hour
+
+        # (segment position, ride label) pairs
+        counts = np.array([len(r) for r in network['rides']])
+        seg_pos = np.repeat(np.arange(len(network)), counts)
+        ride_ids = [r['activity_id'] for rides in network['rides'] for r in rides]
+        when = dates.reindex(ride_ids).to_numpy()
+        known = ~pd.isna(when)
+        seg_pos, when = seg_pos[known], pd.DatetimeIndex(when[known])
+
+        if len(when) == 0:
+            months = np.array([], dtype='datetime64[M]')
+        else:
+            months = np.arange(when.min().to_datetime64().astype('datetime64[M]'),
+                               when.max().to_datetime64().astype('datetime64[M]') + 1)
+        month_pos = (when.to_numpy().astype('datetime64[M]') - (months[0] if len(months) else 0)).astype(int)
+
+        n_seg, n_months = len(network), len(months)
+        monthly = np.bincount(seg_pos * n_months + month_pos, minlength=n_seg * n_months).reshape(n_seg, n_months)
+        weekday_hour = np.bincount(seg_pos * 168 + when.weekday.to_numpy() * 24 + when.hour.to_numpy(),
+                                   minlength=n_seg * 168).reshape(n_seg, 7, 24)
+
+        dtype = np.min_scalar_type(max(monthly.max(initial=0), weekday_hour.max(initial=0)))  # uint8 mostly
+        cube = TimeCube(network['segment_id'].to_numpy(), months, monthly.astype(dtype), weekday_hour.astype(dtype))
+        print(f"✓ Time cube: {n_seg} segments x {n_months} months ({known.sum()} dated ride matches)")
+        return cube
+
+    def save(self, path=None):
+        path = Path(path or Config.TIME_CUBE)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, segment_ids=self.segment_ids, months=self.months.astype(np.int64),
+                            monthly=self.monthly, weekday_hour=self.weekday_hour)
+
+    @staticmethod
+    def load(path=None):
+        with np.load(path or Config.TIME_CUBE) as data:
+            return TimeCube(data['segment_ids'], data['months'].astype('datetime64[M]'),
+                            data['monthly'], data['weekday_hour'])
+
+    # === QUERIES (per segment arrays, in network order) ===
+    def _month_slice(self, start=None, end=None):
+        #start/end inclusive, anything np.datetime64 understands: '2023-06', '2023'
+        lo = 0 if start is None else np.searchsorted(self.months, np.datetime64(start, 'M'))
+        hi = len(self.months) if end is None else np.searchsorted(self.months, np.datetime64(end, 'M'), side='right')
+        return slice(lo, hi)
+
+    def between(self, start=None, end=None):
+        #rides per segment in [start, end] - between('2023-06', '2023-08') = summer 2023
+        return self.monthly[:, self._month_slice(start, end)].sum(axis=1, dtype=np.int64)
+
+    def seasonal(self, months, years=None):
+        #rides per segment in the given calendar months (1-12), optionally only in some years
+        calendar = self.months.astype(int) % 12 + 1
+        mask = np.isin(calendar, months)
+        if years is not None:
+            mask &= np.isin(self.months.astype('datetime64[Y]').astype(int) + 1970, years)
+        return self.monthly[:, mask].sum(axis=1, dtype=np.int64)
+
+    def yearly(self):
+        #(years, counts per segment and year)
+        years = self.months.astype('datetime64[Y]').astype(int) + 1970
+        unique, year_pos = np.unique(years, return_inverse=True)
+        counts = np.zeros((len(self.segment_ids), len(unique)), dtype=np.int64)
+        np.add.at(counts.T, year_pos, self.monthly.T)
+        return unique, counts
+
+    def trend(self):
+        #least squares slope of rides per year, per segment (0 with less than 2 years)
+        years, counts = self.yearly()
+        if len(years) < 2:
+            return np.zeros(len(self.segment_ids))
+        x = years - years.mean()
+        return (counts - counts.mean(axis=1, keepdims=True)) @ x / (x @ x)
+
+    def weekday_profile(self):
+        return self.weekday_hour.sum(axis=2, dtype=np.int64)
+
+    def hour_profile(self):
+        return self.weekday_hour.sum(axis=1, dtype=np.int64)
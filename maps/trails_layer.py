@@ -1,13 +1,22 @@
+import base64
+import json
 import folium
+from folium.map import Layer
+from folium.template import Template
 from folium.plugins import MarkerCluster
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
 from shapely.geometry import Point
 from config import Config
 
 #adding trail info to the map: 1. base trail map, 2. frequency of usage, 3. trails by lenght
 
 class TrailsLayers:
+    LENGTH_CATEGORIES = ['Short (0-25 km)', 'Medium (25-50km)', 'Long (50+)']
+    LENGTH_EDGES = [25, 50]  # km - upper ends of short / medium
+
     @staticmethod
     def add_trail_net(m, rides): #base trail map - made out of uploaded GPS data
 
@@ -29,66 +38,83 @@ class TrailsLayers:
             ).add_to(m)
         
     @staticmethod
-    def add_trail_network(m, network):
-        #differe trails by the frequency of usage  (low, medium, high)       
-        def get_traffic_color(ride_count):
-            if ride_count >= Config.TRAFFIC_THRESHOLDS['medium']:
-                return Config.COLORS['high_traffic']
-            elif ride_count >= Config.TRAFFIC_THRESHOLDS['low']:
-                return Config.COLORS['medium_traffic']
-            else:
-                return Config.COLORS['low_traffic']
-        
-        layer = folium.FeatureGroup(name='Popularity of trails', show=True)
-        
-        for idx, segment in network.iterrows():  #iterate over network - not ride!
-            ride_count = segment['ride_count']
-            color = get_traffic_color(ride_count)  
-            
-            # Build list of rides for this segment
-            rides_info = segment.get('rides', [])
-            rides_list_html = "<br>".join([
-                f"• {r['distance_km']:.1f}km (ID: {r['activity_id']})" 
-                for r in rides_info[:Config.MAX_RIDES_IN_POPUP]
-            ])
-            
-            if len(rides_info) > Config.MAX_RIDES_IN_POPUP:
-                rides_list_html += f"<br>...and {len(rides_info) - Config.MAX_RIDES_IN_POPUP} more"
-            
-            #pop up for segments - show a list of rides which pass thought that given point in the map
-            popup_html = f"""
-            <div style='font-family: Arial; min-width: 250px;'>
-                <h4 style='margin: 0 0 10px 0; color: {color};'>
-                    Trail Segment #{segment['segment_id']}
-                </h4>
-                <p style='margin: 5px 0; font-size: 13px;'>
-                    <b>Popularity:</b> {ride_count} rides<br>
-                    <b>Length:</b> {segment['distance_km']:.1f} km
-                </p>
-                <hr style='margin: 10px 0;'>
-                <p style='font-size: 12px; margin: 5px 0;'>
-                    <b>Rides using this trail:</b><br>
-                    {rides_list_html}
-                </p>
-            </div>
-            """
-            
-            folium.GeoJson(
-                segment.geometry,  
-                style_function=lambda x, c=color: {
-                    'color': c,
-                    'weight': 4,
-                    'opacity': 0.8
-                },
-                highlight_function=lambda x: {
-                    'weight': 6,
-                    'opacity': 1.0
-                },
-                popup=folium.Popup(popup_html, max_width=350),
-                tooltip=f"{ride_count} rides • {segment['distance_km']:.1f}km"
-            ).add_to(layer)  
-        
-        layer.add_to(m)  
+    def add_trail_network(m, network, rides=None):
+        #differe trails by the frequency of usage  (low, medium, high)
+        #styled in the browser from a per segment aggregates table - thresholds, filters and the popup ride list
+        #change without rerunning python (rides => route type mix, without it every ride counts as 'All')
+        table, meta = TrailsLayers.segment_table(network, rides)
+        geoms = shapely.set_precision(network.geometry.values, 1e-5)  # ~1 m - smaller HTML
+        features = [
+            {'type': 'Feature', 'id': int(segment_id), 'geometry': json.loads(g)}
+            for segment_id, g in zip(network['segment_id'], shapely.to_geojson(geoms))
+        ]
+        SegmentFilter({'type': 'FeatureCollection', 'features': features}, table, meta,
+                      name='Popularity of trails', show=True).add_to(m)
+
+    @staticmethod
+    def segment_table(network, rides=None):
+        #per segment columns keyed by segment_id: ride counts per (route type x ride length) cell, length,
+        #elevation, rides list (offsets into ride_ids/ride_km) + the labels the browser needs
+        n = len(network)
+        lists = network['rides'].tolist() if 'rides' in network.columns else [[] for _ in range(n)]
+        counts = np.array([len(r) for r in lists], dtype=np.int64)
+        ride_ids = np.array([r['activity_id'] for rs in lists for r in rs], dtype=np.int64)
+        ride_km = np.array([r['distance_km'] for rs in lists for r in rs], dtype=np.float64)
+        segment_of = np.repeat(np.arange(n), counts)
+
+        length_labels = TrailsLayers.LENGTH_CATEGORIES
+        length_of = np.searchsorted(TrailsLayers.LENGTH_EDGES, ride_km, side='left')  # (0, 25], (25, 50], (50, inf)
+        if rides is not None and 'route_type' in rides.columns:
+            types = rides['route_type'].fillna('Other').astype(str)
+            route_types = sorted(types.unique())
+            code = pd.Series(pd.Categorical(types, categories=route_types).codes, index=rides.index)
+            route_of = code.reindex(ride_ids).to_numpy()
+            if np.isnan(route_of).any():  # network from other rides than these
+                if 'Other' not in route_types:
+                    route_types.append('Other')
+                route_of = np.where(np.isnan(route_of), route_types.index('Other'), route_of)
+            route_of = route_of.astype(np.int64)
+        else:
+            route_types, route_of = ['All'], np.zeros(len(ride_ids), dtype=np.int64)
+
+        n_cells = len(route_types) * len(length_labels)
+        mix = np.bincount(segment_of * n_cells + route_of * len(length_labels) + length_of,
+                          minlength=n * n_cells).reshape(n, n_cells)
+        if 'rides' not in network.columns:  # counts only - no mix to tell
+            route_types, length_labels = ['All'], ['All']
+            mix = network['ride_count'].to_numpy()[:, None]
+
+        table = {
+            'segment_id': network['segment_id'].to_numpy(),
+            'length_km': network['distance_km'].to_numpy().astype(np.float32),
+            'ride_offsets': np.append(0, np.cumsum(counts)),
+            'ride_ids': ride_ids,
+            'ride_km': ride_km.astype(np.float32),
+        }
+        cells = []
+        for cell in np.flatnonzero(mix.sum(axis=0)):  # empty cells are not shipped
+            table[f'mix_{cell}'] = mix[:, cell]
+            cells.append({'column': f'mix_{cell}', 'route': int(cell // len(length_labels)),
+                          'length': int(cell % len(length_labels))})
+
+        difficulty_labels = []
+        if 'ascent_m' in network.columns:
+            for column in ('ascent_m', 'descent_m', 'max_gradient_pct'):
+                table[column] = network[column].to_numpy(dtype=np.float64).astype(np.float32)
+            difficulty = pd.Categorical(network['difficulty'])
+            difficulty_labels = [str(c) for c in difficulty.categories]
+            table['difficulty'] = np.where(difficulty.codes < 0, 255, difficulty.codes).astype(np.uint8)
+
+        meta = {
+            'route_types': route_types,
+            'length_labels': length_labels,
+            'cells': cells,
+            'difficulty_labels': difficulty_labels,
+            'thresholds': Config.TRAFFIC_THRESHOLDS,
+            'max_rides_in_popup': Config.MAX_RIDES_IN_POPUP,
+            'max_count': int(mix.sum(axis=1).max(initial=0)),
+        }
+        return table, meta
     
     @staticmethod
     def add_rides_by_length(m, rides):
@@ -96,15 +122,14 @@ class TrailsLayers:
         # split rides by km(short, medium, long)
         rides['length_category'] = pd.cut(
             rides['distance_km'],
-            bins=[0, 25, 50, float('inf')],
-            labels=['Short (0-25 km)', 'Medium (25-50km)', 
-                    'Long (50+)']
+            bins=[0] + TrailsLayers.LENGTH_EDGES + [float('inf')],
+            labels=TrailsLayers.LENGTH_CATEGORIES
         )
         
         colors_by_length = {
             'Short (0-25 km)': '#9b59b6',    # light purple
-            'Medium (25–50 km)': '#8e44ad',  # strong purple
-            'Very Long (50+)': '#5e3370'     # dark violet
+            'Medium (25-50km)': '#8e44ad',   # strong purple
+            'Long (50+)': '#5e3370'          # dark violet
         }
         
         for category in rides['length_category'].dropna().unique():
@@ -129,6 +154,258 @@ class TrailsLayers:
                 )
             ).add_to(layer)
             
-        layer.add_to(m)
+            layer.add_to(m)
         
 
+    @staticmethod
+    def add_time_slider(m, network, cube, min_rides=1):
+        #segment popularity per month (maps/time_cube.py) - a slider steps through the months
+        if not np.array_equal(cube.segment_ids, network['segment_id'].to_numpy()):
+            print("⚠️ Time cube does not match the network - rebuild it (python maps/cli.py build-network --force)")
+            return
+        totals = cube.monthly.sum(axis=1)
+        keep = np.flatnonzero(totals >= min_rides)
+        if len(keep) == 0 or len(cube.months) == 0:
+            return
+
+        geoms = shapely.set_precision(network.geometry.values[keep], 1e-5)  # ~1 m - smaller HTML
+        features = [
+            {'type': 'Feature', 'id': int(i), 'geometry': json.loads(g)}
+            for i, g in enumerate(shapely.to_geojson(geoms))
+        ]
+        SegmentTimeSlider(
+            {'type': 'FeatureCollection', 'features': features},
+            cube.monthly[keep].tolist(),
+            [str(month) for month in cube.months],
+            name=f'Popularity by month ({len(cube.months)} months)',
+        ).add_to(m)
+
+
+class SegmentTimeSlider(Layer):
+    #line segments restyled from a (segment, time step) counts matrix - folium's TimeSliderChoropleth
+    #colours polygon fills only and restyles every path on the map, this one keeps to its own layer
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.geoJson({{ this.data|tojson }}, {
+                style: function() { return {weight: 4, opacity: 0}; }
+            });
+            var {{ this.get_name() }}_counts = {{ this.counts|tojson }};
+            var {{ this.get_name() }}_labels = {{ this.labels|tojson }};
+            var {{ this.get_name() }}_max = {{ this.max_count }};
+            var {{ this.get_name() }}_colors = {{ this.colors|tojson }};
+
+            function {{ this.get_name() }}_show(step) {
+                document.getElementById('{{ this.get_name() }}_label').innerHTML = {{ this.get_name() }}_labels[step];
+                {{ this.get_name() }}.eachLayer(function(layer) {
+                    var count = {{ this.get_name() }}_counts[layer.feature.id][step];
+                    var level = Math.min(2, Math.floor(3 * count / ({{ this.get_name() }}_max + 1)));
+                    layer.setStyle({color: {{ this.get_name() }}_colors[level], opacity: count > 0 ? 0.9 : 0});
+                    layer.bindTooltip(count + ' rides in ' + {{ this.get_name() }}_labels[step]);
+                });
+            }
+
+            var {{ this.get_name() }}_control = L.control({position: 'bottomleft'});
+            {{ this.get_name() }}_control.onAdd = function() {
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.background = 'white';
+                div.style.padding = '6px 10px';
+                div.innerHTML = '<b id="{{ this.get_name() }}_label"></b><br>'
+                    + '<input type="range" min="0" max="' + ({{ this.get_name() }}_labels.length - 1)
+                    + '" value="' + ({{ this.get_name() }}_labels.length - 1) + '" style="width: 300px">';
+                L.DomEvent.disableClickPropagation(div);
+                div.querySelector('input').addEventListener('input', function(e) {
+                    {{ this.get_name() }}_show(parseInt(e.target.value));
+                });
+                return div;
+            };
+
+            {{ this.get_name() }}.on('add', function() {
+                {{ this.get_name() }}_control.addTo({{ this._parent.get_name() }});
+                {{ this.get_name() }}_show({{ this.get_name() }}_labels.length - 1);
+            });
+            {{ this.get_name() }}.on('remove', function() {
+                {{ this.get_name() }}_control.remove();
+            });
+        {% endmacro %}
+        """)
+
+    def __init__(self, data, counts, labels, name=None, show=False):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = 'SegmentTimeSlider'
+        self.data = data
+        self.counts = counts
+        self.labels = labels
+        self.max_count = int(max((max(c) for c in counts), default=0))
+        self.colors = [Config.COLORS['low_traffic'], Config.COLORS['medium_traffic'], Config.COLORS['high_traffic']]
+
+
+class SegmentFilter(Layer):
+    #trail network restyled in the browser: typed per segment columns (base64 little endian -> TypedArray)
+    #+ controls for minimum rides, minimum length, traffic thresholds, route types, ride lengths, popup size
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.geoJson({{ this.data|tojson }}, {
+                style: function() { return {weight: 4, opacity: 0.8}; }
+            });
+            var {{ this.get_name() }}_meta = {{ this.meta|tojson }};
+            var {{ this.get_name() }}_table = (function(columns) {
+                var types = {uint8: Uint8Array, uint16: Uint16Array, uint32: Uint32Array, int32: Int32Array,
+                             float32: Float32Array, float64: Float64Array};
+                var table = {};
+                for (var name in columns) {
+                    var bytes = Uint8Array.from(atob(columns[name].data), function(c) { return c.charCodeAt(0); });
+                    table[name] = new types[columns[name].dtype](bytes.buffer);
+                }
+                return table;
+            })({{ this.columns|tojson }});
+            var {{ this.get_name() }}_layers = [];
+            var {{ this.get_name() }}_settings = null;
+            var {{ this.get_name() }}_apply = null;
+
+            (function(meta, table, group, layers) {
+                var row = {};
+                for (var i = 0; i < table.segment_id.length; i++) { row[table.segment_id[i]] = i; }
+
+                function count(i, s) {
+                    var total = 0;
+                    meta.cells.forEach(function(cell) {
+                        if (s.routes[cell.route] && s.lengths[cell.length]) { total += table[cell.column][i]; }
+                    });
+                    return total;
+                }
+                function color(n, s) {
+                    if (n >= s.medium) { return meta.colors[2]; }
+                    return n >= s.low ? meta.colors[1] : meta.colors[0];
+                }
+                function popup(i, s) {
+                    var n = count(i, s), total = table.ride_offsets[i + 1] - table.ride_offsets[i];
+                    var html = "<div style='font-family: Arial; min-width: 250px;'>"
+                        + "<h4 style='margin: 0 0 10px 0; color: " + color(n, s) + ";'>Trail Segment #" + table.segment_id[i] + "</h4>"
+                        + "<p style='margin: 5px 0; font-size: 13px;'><b>Popularity:</b> " + n
+                        + (n != total && total > 0 ? " of " + total : "") + " rides<br>"
+                        + "<b>Length:</b> " + table.length_km[i].toFixed(1) + " km";
+                    if (table.ascent_m && !isNaN(table.ascent_m[i])) {
+                        html += "<br><b>Climb:</b> ↑" + table.ascent_m[i].toFixed(0) + " m ↓" + table.descent_m[i].toFixed(0) + " m"
+                            + "<br><b>Max gradient:</b> " + table.max_gradient_pct[i].toFixed(0) + "% ("
+                            + (meta.difficulty_labels[table.difficulty[i]] || "") + ")";
+                    }
+                    var lines = [];
+                    for (var r = table.ride_offsets[i]; r < table.ride_offsets[i + 1] && lines.length < s.popup; r++) {
+                        lines.push("• " + table.ride_km[r].toFixed(1) + "km (ID: " + table.ride_ids[r] + ")");
+                    }
+                    if (total > s.popup) { lines.push("...and " + (total - s.popup) + " more"); }
+                    return html + "</p><hr style='margin: 10px 0;'><p style='font-size: 12px; margin: 5px 0;'>"
+                        + "<b>Rides using this trail:</b><br>" + lines.join("<br>") + "</p></div>";
+                }
+
+                group.eachLayer(function(layer) {
+                    var i = row[layer.feature.id];
+                    layer.on('mouseover', function() { layer.setStyle({weight: 6, opacity: 1.0}); });
+                    layer.on('mouseout', function() { layer.setStyle({weight: 4, opacity: 0.8}); });
+                    layer.bindPopup(function() { return popup(i, {{ this.get_name() }}_settings); }, {maxWidth: 350});
+                    layer.bindTooltip(function() {
+                        return count(i, {{ this.get_name() }}_settings) + " rides • " + table.length_km[i].toFixed(1) + "km";
+                    });
+                    layers.push([layer, i]);
+                });
+
+                {{ this.get_name() }}_apply = function(s) {
+                    {{ this.get_name() }}_settings = s;
+                    var all = s.routes.every(Boolean) && s.lengths.every(Boolean);
+                    layers.forEach(function(item) {
+                        var layer = item[0], i = item[1], n = count(i, s);
+                        var visible = n >= s.min_rides && (n > 0 || all) && table.length_km[i] >= s.min_km;
+                        if (visible) {
+                            layer.setStyle({color: color(n, s)});
+                            if (!group.hasLayer(layer)) { group.addLayer(layer); }
+                        } else if (group.hasLayer(layer)) {
+                            group.removeLayer(layer);
+                        }
+                    });
+                };
+            })({{ this.get_name() }}_meta, {{ this.get_name() }}_table, {{ this.get_name() }}, {{ this.get_name() }}_layers);
+
+            var {{ this.get_name() }}_control = L.control({position: 'bottomright'});
+            {{ this.get_name() }}_control.onAdd = function() {
+                var meta = {{ this.get_name() }}_meta;
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.background = 'white';
+                div.style.padding = '6px 10px';
+                div.style.fontSize = '12px';
+                function boxes(name, labels) {
+                    return labels.map(function(label, k) {
+                        return '<label><input type="checkbox" name="' + name + '" value="' + k + '" checked> ' + label + '</label>';
+                    }).join('<br>');
+                }
+                div.innerHTML = '<b>Trail filter</b><br>'
+                    + 'Min rides <input type="range" name="min_rides" min="0" max="' + meta.max_count + '" value="0">'
+                    + ' <span name="min_rides_value">0</span><br>'
+                    + 'Min length <input type="number" name="min_km" min="0" step="0.1" value="0" style="width: 50px"> km<br>'
+                    + 'Traffic: medium ≥ <input type="number" name="low" min="0" value="' + meta.thresholds.low + '" style="width: 40px">'
+                    + ' high ≥ <input type="number" name="medium" min="0" value="' + meta.thresholds.medium + '" style="width: 40px"><br>'
+                    + (meta.route_types.length > 1 ? '<b>Route type</b><br>' + boxes('routes', meta.route_types) + '<br>' : '')
+                    + (meta.length_labels.length > 1 ? '<b>Ride length</b><br>' + boxes('lengths', meta.length_labels) + '<br>' : '')
+                    + 'Rides in popup <input type="number" name="popup" min="0" value="' + meta.max_rides_in_popup + '" style="width: 40px">';
+                L.DomEvent.disableClickPropagation(div);
+                L.DomEvent.disableScrollPropagation(div);
+
+                function read() {
+                    function value(name) { return parseFloat(div.querySelector('[name="' + name + '"]').value) || 0; }
+                    function checked(name, n) {
+                        var flags = [];
+                        for (var k = 0; k < n; k++) {
+                            var box = div.querySelector('[name="' + name + '"][value="' + k + '"]');
+                            flags.push(box ? box.checked : true);
+                        }
+                        return flags;
+                    }
+                    div.querySelector('[name="min_rides_value"]').innerHTML = value('min_rides');
+                    {{ this.get_name() }}_apply({
+                        min_rides: value('min_rides'), min_km: value('min_km'), low: value('low'), medium: value('medium'),
+                        popup: value('popup'), routes: checked('routes', meta.route_types.length),
+                        lengths: checked('lengths', meta.length_labels.length)
+                    });
+                }
+                div.addEventListener('input', read);
+                div.addEventListener('change', read);
+                setTimeout(read, 0);
+                return div;
+            };
+
+            {{ this.get_name() }}_apply({
+                min_rides: 0, min_km: 0, low: {{ this.get_name() }}_meta.thresholds.low,
+                medium: {{ this.get_name() }}_meta.thresholds.medium, popup: {{ this.get_name() }}_meta.max_rides_in_popup,
+                routes: {{ this.get_name() }}_meta.route_types.map(function() { return true; }),
+                lengths: {{ this.get_name() }}_meta.length_labels.map(function() { return true; })
+            });
+            {{ this.get_name() }}.on('add', function() {
+                {{ this.get_name() }}_control.addTo({{ this._parent.get_name() }});
+            });
+            {{ this.get_name() }}.on('remove', function() {
+                {{ this.get_name() }}_control.remove();
+            });
+        {% endmacro %}
+        """)
+
+    def __init__(self, data, table, meta, name=None, show=True):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = 'SegmentFilter'
+        self.data = data
+        self.columns = {column: SegmentFilter.encode(values) for column, values in table.items()}
+        self.meta = dict(meta, colors=[Config.COLORS['low_traffic'], Config.COLORS['medium_traffic'],
+                                       Config.COLORS['high_traffic']])
+
+    @staticmethod
+    def encode(values):
+        #smallest typed array that holds the column: counts/ids -> uint8/16/32, floats -> float32/64
+        values = np.asarray(values)
+        if values.dtype.kind in 'iub':
+            low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+            if low >= 0:
+                dtype = next((t for t in ('uint8', 'uint16', 'uint32') if high <= np.iinfo(t).max), 'float64')
+            else:
+                dtype = 'int32' if np.iinfo('int32').min <= low and high <= np.iinfo('int32').max else 'float64'
+        else:
+            dtype = 'float32' if values.dtype == np.float32 else 'float64'
+        data = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<')).tobytes()
+        return {'dtype': dtype, 'data': base64.b64encode(data).decode('ascii')}
@@ -1,10 +1,7 @@
 import geopandas as gpd
-import requests
 from pathlib import Path
-from shapely.geometry import shape
-from shapely.validation import make_valid
 import matplotlib.pyplot as plt
-import time
+from aoi_service import fetch_nominatim
 
 class SumavaDownloader:
     """Download Šumava NP & CHKO via Nominatim (robust)"""
@@ -14,27 +11,8 @@ class SumavaDownloader:
         self.output_dir.mkdir(exist_ok=True)
 
     def _download_nominatim(self, query):
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            "q": query,
-            "format": "json",
-            "polygon_geojson": 1,
-            "limit": 1
-        }
-        headers = {"User-Agent": "SumavaDownloader/1.0"}
-        time.sleep(1)  # Respect rate limit
-        resp = requests.get(url, params=params, headers=headers, timeout=30)
-        resp.raise_for_status()
-        results = resp.json()
-        if not results:
-            return None
-        geom = make_valid(shape(results[0]['geojson']))
-        gdf = gpd.GeoDataFrame([{
-            "name": results[0]["display_name"],
-            "osm_id": results[0]["osm_id"],
-            "osm_type": results[0]["osm_type"]
-        }], geometry=[geom], crs="EPSG:4326")
-        return gdf
+        # responses are cached on disk (aoi_service) - rerunning does not hit Nominatim again
+        return fetch_nominatim(query)
 
     def download_all(self):
         print("Downloading Šumava NP...")
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.validation import make_valid
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+
+#study area (AOI = NP + CHKO Šumava) loaded once and shared by every stage that clips or filters
+#   - Nominatim responses are cached on disk - no repeated downloads, no rate limit sleeps
+#   - simplified copies in EPSG:4326 and the metric CRS are persisted next to the AOI file
+#   - in memory the geometries are prepared + indexed (STRtree over polygon parts)
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+AOI_QUERIES = ["Národní park Šumava", "CHKO Šumava"]
+
+
+def cached_get_json(url, params, headers=None, min_interval=1.0):
+    #GET -> json, response cached on disk by url + params
+    cache_dir = Path(Config.HTTP_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    key = hashlib.sha1(json.dumps([url, params], sort_keys=True).encode()).hexdigest()
+    cache_file = cache_dir / f"{key}.json"
+
+    if cache_file.exists():
+        return json.loads(cache_file.read_text())
+
+    import requests  # only needed on a cache miss - keeps start-up light
+
+    time.sleep(min_interval)  # Respect rate limit - only when we really hit the server
+    resp = requests.get(url, params=params, headers=headers, timeout=30)
+    resp.raise_for_status()
+    data = resp.json()
+    cache_file.write_text(json.dumps(data))
+    return data
+
+
+def fetch_nominatim(query):
+    params = {
+        "q": query,
+        "format": "json",
+        "polygon_geojson": 1,
+        "limit": 1
+    }
+    headers = {"User-Agent": "SumavaDownloader/1.0"}
+    results = cached_get_json(NOMINATIM_URL, params, headers=headers)
+    if not results:
+        return None
+    geom = make_valid(shape(results[0]['geojson']))
+    return gpd.GeoDataFrame([{
+        "name": results[0]["display_name"],
+        "osm_id": results[0]["osm_id"],
+        "osm_type": results[0]["osm_type"]
+    }], geometry=[geom], crs="EPSG:4326")
+
+
+class StudyArea:
+    _loaded = {}  # one instance per AOI file and process
+    _lock = threading.Lock()  # pipeline stages load it from several threads - the cache is written once
+
+    def __init__(self, path, cache_path, tolerance):
+        self.path = Path(path)
+        self.cache_path = Path(cache_path)
+        self.tolerance = tolerance
+        self._frames = {}
+        self._geoms = {}
+        self._trees = {}
+
+    @classmethod
+    def load(cls, path=None, cache_path=None, tolerance=None):
+        path = Path(path or Config.STUDY_AREA)
+        key = str(path.resolve())
+        with cls._lock:
+            if key not in cls._loaded:
+                area = cls(path, cache_path or Config.AOI_CACHE, tolerance or Config.AOI_SIMPLIFY_TOLERANCE)
+                area._ensure_source()
+                area._ensure_cache()
+                cls._loaded[key] = area
+        return cls._loaded[key]
+
+    # === BUILD (once) ===
+    def _ensure_source(self):
+        #AOI file missing => download NP + CHKO (cached responses) and store their union
+        if self.path.exists():
+            return
+        print("⚙️ Study area not found - downloading NP + CHKO Šumava...")
+        parts = [fetch_nominatim(q) for q in AOI_QUERIES]
+        parts = [p for p in parts if p is not None]
+        if not parts:
+            raise RuntimeError("❌ Could not download study area from Nominatim")
+        union = make_valid(shapely.union_all([p.geometry.iloc[0] for p in parts]))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        gpd.GeoDataFrame({'name': ['NP + CHKO Šumava']}, geometry=[union], crs="EPSG:4326").to_file(self.path)
+
+    def _cache_key(self):
+        #what the cache is built from - AOI file (path, size, mtime), metric CRS and simplify tolerance
+        stat = self.path.stat()
+        return {'source': str(self.path.resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'metric_crs': str(Config.METRIC_CRS), 'tolerance': self.tolerance}
+
+    def _ensure_cache(self):
+        #simplified 4326 + metric copies, rebuilt when the AOI file, Config.METRIC_CRS or the tolerance changed
+        #(key stored next to the cache - a region profile with another metric_crs gets a matching layer)
+        key_path = self.cache_path.with_name(self.cache_path.name + '.json')
+        key = self._cache_key()
+        if self.cache_path.exists() and key_path.exists() and json.loads(key_path.read_text()) == key:
+            return
+
+        self.cache_path.unlink(missing_ok=True)  # no layers of an older metric CRS left behind
+        source = gpd.read_file(self.path)
+        metric = make_valid(shapely.union_all(source.to_crs(Config.METRIC_CRS).geometry.values))
+        metric = metric.simplify(self.tolerance, preserve_topology=True)
+        metric_gdf = gpd.GeoDataFrame(geometry=[metric], crs=Config.METRIC_CRS)
+
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        metric_gdf.to_crs("EPSG:4326").to_file(self.cache_path, layer=self._layer("EPSG:4326"), driver='GPKG')
+        metric_gdf.to_file(self.cache_path, layer=self._layer(Config.METRIC_CRS), driver='GPKG')
+        key_path.write_text(json.dumps(key))
+        print(f"✓ Study area cache written to {self.cache_path}")
+
+    @staticmethod
+    def _layer(crs):
+        return 'aoi_' + str(crs).split(':')[-1]
+
+    # === ACCESS ===
+    def frame(self):
+        #full resolution AOI as stored - for display (outline, map center)
+        if 'source' not in self._frames:
+            self._frames['source'] = gpd.read_file(self.path)
+        return self._frames['source']
+
+    def simplified(self, crs="EPSG:4326"):
+        crs = str(crs)
+        if crs not in self._frames:
+            self._frames[crs] = gpd.read_file(self.cache_path, layer=self._layer(crs))
+        return self._frames[crs]
+
+    def geometry(self, crs="EPSG:4326"):
+        #prepared union geometry - cheap repeated contains/intersects
+        crs = str(crs)
+        if crs not in self._geoms:
+            geom = self.simplified(crs).geometry.iloc[0]
+            shapely.prepare(geom)
+            self._geoms[crs] = geom
+        return self._geoms[crs]
+
+    def tree(self, crs="EPSG:4326"):
+        #STRtree over the polygon parts of the AOI
+        crs = str(crs)
+        if crs not in self._trees:
+            self._trees[crs] = shapely.STRtree(shapely.get_parts(self.geometry(crs)))
+        return self._trees[crs]
+
+    def intersects(self, geoms, crs="EPSG:4326"):
+        geoms = np.asarray(geoms, dtype=object)
+        hits = self.tree(crs).query(geoms, predicate='intersects')[0]
+        mask = np.zeros(len(geoms), dtype=bool)
+        mask[hits] = True
+        return mask
+
+    def contains(self, geoms, crs="EPSG:4326"):
+        return shapely.contains(self.geometry(crs), np.asarray(geoms, dtype=object))
+
+    def clip(self, gdf):
+        #keep what is inside, cut what crosses the boundary, drop the rest
+        crs = str(gdf.crs)
+        if crs not in ("EPSG:4326", str(Config.METRIC_CRS)):
+            return gdf.clip(self.simplified("EPSG:4326").to_crs(gdf.crs))
+
+        geoms = gdf.geometry.values
+        inside = self.contains(geoms, crs)
+        keep = inside | self.intersects(geoms, crs)
+        clipped = gdf[keep].copy()
+        crossing = ~inside[keep]
+        if crossing.any():
+            clipped.loc[crossing, 'geometry'] = shapely.intersection(
+                clipped.geometry.values[crossing], self.geometry(crs)
+            )
+        return clipped[~clipped.geometry.is_empty]
@@ -0,0 +1,209 @@
+import argparse
+import gzip
+import hashlib
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import shapely
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+from ride_store import RideStore
+from progress import Cancelled, Progress, console
+
+#bulk import of GPX / FIT exports (club members, Garmin/Strava bulk exports) into the ride store
+#
+#   python preprocessing/bulk_ingest.py exports/ --workers 4
+#   python maps/cli.py ingest --dir exports/
+#
+#files (also .gpx.gz / .fit.gz) are parsed in a process pool; activity_id = hash of the rounded track,
+#so the same ride exported twice (or imported twice) is stored once. Ride dates are the local start time
+#(Config.LOCAL_TIMEZONE, naive) like the Strava download's start_date_local. Output is the RideStore GPKG
+#('rides' + 'start_points' layers) that DataLoader.load_data reads, full resolution tracks go to the
+#stream store. FIT needs the optional fitparse package - without it FIT files are reported and skipped.
+
+SUFFIXES = ('.gpx', '.fit', '.gpx.gz', '.fit.gz')
+HASH_DECIMALS = 5  # ~1 m - GPX (decimal degrees) and FIT (semicircles) exports of one ride hash the same
+SIMPLIFY_DEG = 0.00005  # ~5 m - stored ride geometry, the stream store keeps every point
+SEMICIRCLE = 180 / 2 ** 31
+
+
+# === PARSERS (run in the worker processes) ===
+def _open(path):
+    return gzip.open(path, 'rb') if path.suffix == '.gz' else open(path, 'rb')
+
+def parse_gpx(path):
+    with _open(path) as f:
+        root = ET.parse(f).getroot()
+
+    segments, altitude, times = [], [], []
+    for seg in root.findall('.//{*}trkseg'):
+        points = seg.findall('{*}trkpt')
+        if len(points) < 2:
+            continue
+        segments.append(np.array([(float(p.get('lat')), float(p.get('lon'))) for p in points]))
+        for p in points:  # plain child loop - ElementPath per point is the slow part of GPX parsing
+            ele = stamp = None
+            for child in p:
+                tag = child.tag.rpartition('}')[2]
+                if tag == 'ele':
+                    ele = child.text
+                elif tag == 'time':
+                    stamp = child.text
+            altitude.append(float(ele) if ele else np.nan)
+            times.append(stamp)
+
+    return {
+        'name': root.findtext('{*}trk/{*}name') or root.findtext('{*}metadata/{*}name'),
+        'segments': segments,
+        'altitude': np.array(altitude, dtype=np.float64),
+        'times': pd.to_datetime(times, utc=True, format='ISO8601') if any(times) else None,
+    }
+
+def parse_fit(path):
+    try:
+        from fitparse import FitFile
+    except ImportError:
+        raise ImportError("fitparse not installed (pip install fitparse)")
+
+    with _open(path) as f:
+        fit = FitFile(f.read())
+    latlng, altitude, times = [], [], []
+    for record in fit.get_messages('record'):
+        values = record.get_values()
+        if values.get('position_lat') is None or values.get('position_long') is None:
+            continue
+        latlng.append((values['position_lat'] * SEMICIRCLE, values['position_long'] * SEMICIRCLE))
+        alt = values.get('enhanced_altitude', values.get('altitude'))
+        altitude.append(np.nan if alt is None else alt)
+        times.append(values.get('timestamp'))  # naive UTC
+
+    return {
+        'name': None,
+        'segments': [np.array(latlng)] if len(latlng) >= 2 else [],
+        'altitude': np.array(altitude, dtype=np.float64),
+        'times': pd.to_datetime(times, utc=True) if any(times) else None,
+    }
+
+def _haversine_km(latlng):
+    lat, lon = np.radians(latlng[:, 0]), np.radians(latlng[:, 1])
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    return float(6371.0088 * 2 * np.arcsin(np.sqrt(a)).sum())
+
+def parse_file(path, timezone=None):
+    #one file -> record for the ride store (+ full resolution stream), or ('error', message)
+    path = Path(path)
+    try:
+        parsed = parse_fit(path) if '.fit' in path.suffixes else parse_gpx(path)
+    except Exception as e:
+        return path, 'error', f"{type(e).__name__}: {e}"
+    if not parsed['segments']:
+        return path, 'empty', None
+
+    latlng = np.concatenate(parsed['segments'])
+    digest = hashlib.blake2b(np.round(latlng, HASH_DECIMALS).tobytes(), digest_size=8).digest()
+    activity_id = int.from_bytes(digest, 'big') >> 9  # 55 bits - stable id, never clashes with int64 limits
+
+    lines = [shapely.linestrings(seg[:, ::-1]) for seg in parsed['segments']]
+    geometry = shapely.simplify(lines[0] if len(lines) == 1 else shapely.multilinestrings(lines), SIMPLIFY_DEG,
+                                preserve_topology=False)  # plain Douglas-Peucker - a GPS track has no topology to keep
+
+    times, start, seconds = parsed['times'], None, None
+    if times is not None and times.notna().any():
+        start = times[times.notna()][0].tz_convert(timezone or Config.LOCAL_TIMEZONE).tz_localize(None).to_pydatetime()
+        seconds = np.where(times.notna(), (times - times[times.notna()][0]).total_seconds(), -1).astype(np.int32)
+
+    climb = np.diff(parsed['altitude'])
+    return path, 'ok', {
+        'activity_id': activity_id,
+        'name': parsed['name'] or path.name.split('.')[0],
+        'date': start,
+        'distance_km': sum(_haversine_km(seg) for seg in parsed['segments']),
+        'elevation_gain_m': float(np.nansum(np.maximum(climb, 0))) if len(climb) else 0.0,
+        'geometry': geometry,
+        'latlng': latlng,
+        'altitude': parsed['altitude'],
+        'time': seconds,
+    }
+
+
+# === INGEST ===
+def find_files(root):
+    root = Path(root)
+    return sorted(p for p in root.rglob('*') if p.is_file() and p.name.lower().endswith(SUFFIXES))
+
+def save_batch(store, stream_store, rides, streams):
+    #streams first (one fsync per column for the whole batch), then the rides - a ride in the store has its stream.
+    #only streams of rides the store keeps - rides outside the AOI are dropped by append (and marked skipped)
+    if stream_store is not None and streams:
+        clipped = store.clip([ride['geometry'] for ride in rides])
+        kept = {ride['activity_id'] for ride, geom in zip(rides, clipped) if geom is not None}
+        stream_store.append_many([s for s in streams if s[0] in kept])
+    store.append(rides)
+
+def ingest(root, store_path=None, workers=4, streams=True, batch_size=500, progress=None):
+    from aoi_service import StudyArea
+    from stream_store import StreamStore
+
+    files = find_files(root)
+    print(f"\n📂 {len(files)} GPX/FIT files in {root}")
+    store = RideStore(store_path or Config.RIDE_STORE, aoi_geometry=StudyArea.load().geometry('EPSG:4326'))
+    stream_store = StreamStore(Config.STREAM_STORE) if streams else None
+    seen = store.processed_ids()  # re-running on the same directory only adds new rides
+
+    counts = {'ok': 0, 'duplicate': 0, 'empty': 0, 'error': 0}
+    errors, pending, pending_streams = [], [], []
+    task = Progress.ensure(progress).task('ingest', total=len(files), unit='files')
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            for path, status, record in pool.map(partial(parse_file, timezone=Config.LOCAL_TIMEZONE), files, chunksize=16):
+                if status == 'ok' and record['activity_id'] in seen:
+                    status = 'duplicate'
+                counts[status] += 1
+                if status == 'error':
+                    errors.append((path, record))
+                if status == 'ok':
+                    seen.add(record['activity_id'])
+                    latlng, altitude, seconds = record.pop('latlng'), record.pop('altitude'), record.pop('time')
+                    if stream_store is not None and record['activity_id'] not in stream_store:
+                        pending_streams.append((record['activity_id'], latlng, altitude, seconds))
+                    pending.append(record)
+
+                if len(pending) >= batch_size:
+                    save_batch(store, stream_store, pending, pending_streams)
+                    pending, pending_streams = [], []
+                task.advance()
+        except Cancelled:
+            # rides parsed so far are kept - re-running the import only adds the rest
+            pool.shutdown(cancel_futures=True)
+            save_batch(store, stream_store, pending, pending_streams)
+            raise
+
+    save_batch(store, stream_store, pending, pending_streams)
+    task.finish()
+    elapsed = time.perf_counter() - start
+
+    print(f"\n✓ {len(files)} files in {elapsed:.1f}s = {len(files) / max(elapsed, 1e-9):.0f} files/s ({workers} workers)")
+    print(f"  new rides: {counts['ok']}, duplicates: {counts['duplicate']}, "
+          f"without track: {counts['empty']}, failed: {counts['error']}")
+    for path, message in errors[:10]:
+        print(f"  ⚠️ {path}: {message}")
+    if Path(Config.STRAVA_RIDES) != Path(store.path):
+        print(f"  → set Config.STRAVA_RIDES = '{store.path}' to build the network from the imported rides")
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import a directory of GPX/FIT files into the ride store')
+    parser.add_argument('directory')
+    parser.add_argument('--store', default=None, help=f'ride store GPKG (default {Config.RIDE_STORE})')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--no-streams', action='store_true', help='do not keep full resolution tracks')
+    args = parser.parse_args()
+    ingest(args.directory, args.store, workers=args.workers, streams=not args.no_streams, progress=Progress([console]))
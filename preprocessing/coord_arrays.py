@@ -0,0 +1,29 @@
+import numpy as np
+import shapely
+
+#flat coordinate buffer + offsets <=> shapely lines
+#offsets has len(lines) + 1 entries, line i = coords[offsets[i]:offsets[i + 1]]
+
+def lines_from_offsets(coords, offsets):
+    #one vectorized call for all lines - lines with < 2 points become None
+    counts = np.diff(offsets)
+    lines = np.full(len(counts), None, dtype=object)
+    valid = counts >= 2
+    if not valid.any():
+        return lines
+
+    keep = np.repeat(valid, counts)
+    indices = np.repeat(np.arange(valid.sum()), counts[valid])
+    built = shapely.linestrings(np.asarray(coords)[offsets[0]:offsets[-1]][keep], indices=indices)
+    lines[valid] = built
+    return lines
+
+
+def arrays_from_lines(geoms):
+    #inverse of lines_from_offsets - multi part lines are flattened into one run of coords
+    geoms = np.asarray(geoms, dtype=object)
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    counts = np.bincount(index, minlength=len(geoms))
+    offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return coords, offsets
@@ -0,0 +1,64 @@
+import numpy as np
+from coord_arrays import lines_from_offsets
+
+#batch decoder for Google encoded polylines (Strava summary_polyline)
+#all strings are decoded together with numpy into one coordinate buffer + offsets,
+#no per-point python objects - format: https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+
+def _decode_values(encoded):
+    #encoded strings -> (signed delta values of all strings, number of values per string, string is complete)
+    lengths = np.array([len(s) for s in encoded], dtype=np.int64)
+    if lengths.sum() == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(len(encoded), dtype=np.int64), np.ones(len(encoded), dtype=bool)
+
+    chunks = np.frombuffer(''.join(encoded).encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+
+    # a value is a run of 5 bit chunks, the last chunk of a run has the 0x20 bit cleared
+    last_chunk = (chunks & 0x20) == 0
+    value_starts = np.flatnonzero(np.r_[True, last_chunk[:-1]])
+    value_id = np.cumsum(last_chunk) - last_chunk
+    shift = 5 * (np.arange(len(chunks)) - value_starts[value_id])
+
+    values = np.add.reduceat((chunks & 0x1f) << shift, value_starts)
+    values = np.where(values & 1, ~(values >> 1), values >> 1)  # zigzag -> signed
+    values = values[:last_chunk.sum()]  # drop a trailing unfinished value
+
+    # values finished inside each string + whether the string ends on a finished value
+    string_ends = np.cumsum(lengths)
+    finished = np.r_[0, np.cumsum(last_chunk)][string_ends]
+    n_values = np.diff(np.r_[0, finished])
+    complete = (lengths == 0) | last_chunk[np.maximum(string_ends - 1, 0)]
+    return values, n_values, complete
+
+
+def decode_polylines(encoded, precision=5):
+    #many encoded polylines -> (coords, offsets); coords are lon, lat (x, y)
+    #broken strings (truncated / odd number of values) come out as empty lines
+    encoded = ['' if s is None else s for s in encoded]
+    values, n_values, complete = _decode_values(encoded)
+
+    valid = complete & (n_values % 2 == 0)
+    if not valid.all():
+        encoded = [s if ok else '' for s, ok in zip(encoded, valid)]
+        values, n_values, _ = _decode_values(encoded)
+
+    counts = n_values // 2
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    # positions are running sums of lat/lon deltas - restarted at the first point of every string
+    deltas = values.reshape(-1, 2)
+    totals = np.cumsum(deltas, axis=0)
+    starts = offsets[:-1][counts > 0]
+    base = np.zeros((len(counts), 2), dtype=np.int64)
+    base[counts > 0] = totals[starts] - deltas[starts]
+    totals -= np.repeat(base, counts, axis=0)
+
+    coords = totals[:, ::-1] / 10 ** precision
+    return coords, offsets
+
+
+def polylines_to_linestrings(encoded, precision=5):
+    #one vectorized shapely call for all polylines - None where a polyline is empty/broken
+    coords, offsets = decode_polylines(encoded, precision)
+    return lines_from_offsets(coords, offsets)
@@ -0,0 +1,194 @@
+import queue
+import threading
+import time
+
+#progress events + cancellation for long running stages
+#
+#a long loop takes a task from the run's Progress and advances it per batch:
+#
+#   task = progress.task('match', total=len(network), unit='segments')
+#   for batch in batches:
+#       ...
+#       task.advance(len(batch))   # event to every listener, raises Cancelled once the token is set
+#   task.finish()
+#
+#listeners are plain callables taking a ProgressEvent (console line, progress bar, scheduler heartbeat);
+#Progress.events() runs a job in a thread and yields its events instead. Functions take progress=None
+#the same way they take store=None - Progress.ensure gives a silent one.
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken:
+    #set from any thread (scheduler, signal handler, closed event generator) or by a timeout;
+    #a child token (parent=...) is cancelled with its parent, cancelling the child leaves the parent running
+    def __init__(self, timeout=None, parent=None):
+        self._event = threading.Event()
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.parent = parent
+        self.reason = None
+
+    def cancel(self, reason='cancelled'):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if self.parent is not None and self.parent.cancelled:
+            self.cancel(self.parent.reason)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.cancel('timeout')
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+
+class ProgressEvent:
+    __slots__ = ('stage', 'done', 'total', 'unit', 'elapsed', 'status')
+
+    def __init__(self, stage, done, total, unit, elapsed, status):
+        self.stage = stage
+        self.done = done
+        self.total = total  # None when unknown (API paging)
+        self.unit = unit
+        self.elapsed = elapsed
+        self.status = status  # 'start' | 'running' | 'done' | 'cancelled' | 'failed'
+
+    @property
+    def rate(self):
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        #seconds left at the current rate, None when it cannot be told yet
+        if self.total is None or self.rate == 0:
+            return None
+        return max(self.total - self.done, 0) / self.rate
+
+    def as_dict(self):
+        return {'stage': self.stage, 'done': self.done, 'total': self.total, 'unit': self.unit,
+                'elapsed': round(self.elapsed, 3), 'rate': round(self.rate, 3),
+                'eta': None if self.eta is None else round(self.eta, 1), 'status': self.status}
+
+    def __repr__(self):
+        return f"ProgressEvent({self.as_dict()})"
+
+
+class Task:
+    def __init__(self, progress, stage, total=None, unit='items'):
+        self.progress = progress
+        self.stage = stage
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last = 0.0
+        self._emit('start')
+
+    def _emit(self, status):
+        self._last = time.perf_counter()
+        self.progress.emit(ProgressEvent(self.stage, self.done, self.total, self.unit, self._last - self.started, status))
+
+    def advance(self, n=1):
+        #count n more items, tell the listeners (at most every min_interval) and stop here if cancelled
+        self.done += n
+        complete = self.total is not None and self.done >= self.total  # finish() reports that one
+        if not complete and time.perf_counter() - self._last >= self.progress.min_interval:
+            self._emit('running')
+        self.check()
+
+    def check(self):
+        try:
+            self.progress.check()
+        except Cancelled:
+            self._emit('cancelled')
+            raise
+
+    def finish(self):
+        if self.total is not None:
+            self.done = max(self.done, self.total)
+        self._emit('done')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+        elif not issubclass(exc_type, Cancelled):
+            self._emit('failed')
+        return False
+
+
+class Progress:
+    def __init__(self, listeners=(), token=None, min_interval=0.5):
+        self.listeners = list(listeners)
+        self.token = token or CancelToken()
+        self.min_interval = min_interval  # seconds between 'running' events of one task
+        self._lock = threading.Lock()  # stages of a pipeline run report from several threads
+
+    @staticmethod
+    def ensure(progress):
+        return progress if progress is not None else Progress()
+
+    def listen(self, callback):
+        self.listeners.append(callback)
+        return self
+
+    def task(self, stage, total=None, unit='items'):
+        return Task(self, stage, total, unit)
+
+    def emit(self, event):
+        with self._lock:
+            for listener in self.listeners:
+                listener(event)
+
+    def check(self):
+        self.token.check()
+
+    def cancel(self, reason='cancelled'):
+        self.token.cancel(reason)
+
+    def events(self, job, *args, **kwargs):
+        #job(*args, progress=..., **kwargs) in a thread, its events as a generator (also sent to the listeners);
+        #closing the generator early cancels that job only - the job runs on a child token, this Progress stays usable.
+        #the job's exception is re-raised at the end
+        events = queue.Queue()
+        outcome = {}
+        progress = Progress([events.put, self.emit], CancelToken(parent=self.token), self.min_interval)
+
+        def run():
+            try:
+                outcome['result'] = job(*args, progress=progress, **kwargs)
+            except BaseException as e:
+                outcome['error'] = e
+            finally:
+                events.put(None)
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        try:
+            while (event := events.get()) is not None:
+                yield event
+        finally:
+            if worker.is_alive():
+                progress.cancel('closed')
+                worker.join()
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('result')
+
+
+def console(event):
+    #listener printing one line per event - what the CLI uses
+    if event.status == 'start':
+        return
+    total = f"/{event.total}" if event.total is not None else ''
+    eta = f", ETA {event.eta:.0f}s" if event.eta is not None and event.status == 'running' else ''
+    icon = {'done': '✓', 'cancelled': '⛔', 'failed': '❌'}.get(event.status, '⏳')
+    print(f"   {icon} {event.stage}: {event.done}{total} {event.unit} ({event.rate:.0f}/s{eta})"
+          + (f" - {event.status}" if event.status in ('cancelled', 'failed') else ''))
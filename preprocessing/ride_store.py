@@ -0,0 +1,132 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+import geopandas as gpd
+import numpy as np
+import shapely
+
+#append-only store for downloaded rides - one GPKG with 'rides' and 'start_points' layers
+#every ride is clipped to the AOI once (on the way in) and appended - nothing is ever rewritten;
+#rides deleted on Strava (webhook, preprocessing/strava_webhook.py) are removed row by row with SQL
+
+class RideStore:
+    RIDES_LAYER = 'rides'
+    START_LAYER = 'start_points'
+
+    def __init__(self, path, aoi_geometry=None, crs='EPSG:4326'):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.skipped_path = self.path.with_suffix('.skipped.txt')  #ids of rides fully outside AOI / without a track - resume does not fetch them again
+        self.crs = crs
+        self.aoi = aoi_geometry
+        if self.aoi is not None:
+            shapely.prepare(self.aoi)  #prepared once - every contains/intersects after this is cheap
+
+    def _query(self, sql):
+        # GPKG is plain SQLite - reading ids does not need to touch geometries
+        if not self.path.exists():
+            return []
+        with closing(sqlite3.connect(self.path)) as con:
+            try:
+                return con.execute(sql).fetchall()
+            except sqlite3.OperationalError:  #table not created yet
+                return []
+
+    def processed_ids(self):
+        stored = self._query(f'SELECT activity_id FROM "{self.RIDES_LAYER}"')
+        skipped = self.skipped_path.read_text().split() if self.skipped_path.exists() else []
+        return {row[0] for row in stored} | {int(i) for i in skipped}
+
+    def __len__(self):
+        rows = self._query(f'SELECT COUNT(*) FROM "{self.RIDES_LAYER}"')
+        return rows[0][0] if rows else 0
+
+    def clip(self, geoms):
+        #clip to AOI: inside => kept as is, crossing => intersection, outside => None
+        geoms = np.asarray(geoms, dtype=object)
+        if self.aoi is None:
+            return geoms
+
+        clipped = np.full(len(geoms), None, dtype=object)
+        inside = shapely.contains(self.aoi, geoms)
+        crossing = ~inside & shapely.intersects(self.aoi, geoms)
+
+        clipped[inside] = geoms[inside]
+        if crossing.any():
+            clipped[crossing] = [
+                RideStore._lines_only(g) for g in shapely.intersection(geoms[crossing], self.aoi)
+            ]
+        return clipped
+
+    @staticmethod
+    def _lines_only(geom):
+        #intersection can return GeometryCollection with stray points - keep only the lines
+        parts = shapely.get_parts(geom)
+        lines = [p for p in parts if p.geom_type == 'LineString' and not p.is_empty]
+        if not lines:
+            return None
+        return lines[0] if len(lines) == 1 else shapely.multilinestrings(lines)
+
+    @staticmethod
+    def start_points(geoms):
+        #first vertex of the (first part of the) line, vectorized
+        first_parts = shapely.get_geometry(geoms, 0)  # LineString returns itself for index 0
+        first_parts = np.where(shapely.get_type_id(geoms) == 1, geoms, first_parts)
+        return shapely.get_point(first_parts, 0)
+
+    def append(self, records):
+        #records = list of dicts with 'activity_id' and 'geometry' in store CRS
+        if not records:
+            return 0
+
+        rides = gpd.GeoDataFrame(records, geometry='geometry', crs=self.crs)
+        rides['geometry'] = self.clip(rides.geometry.values)
+
+        outside = rides[rides.geometry.isna()]
+        rides = rides[rides.geometry.notna()]
+
+        if len(rides) > 0:
+            rides.to_file(self.path, layer=self.RIDES_LAYER, driver='GPKG',
+                          mode='a', geometry_type='Unknown', promote_to_multi=False)
+
+            start_points = rides.copy()
+            start_points['geometry'] = RideStore.start_points(rides.geometry.values)
+            start_points.to_file(self.path, layer=self.START_LAYER, driver='GPKG', mode='a')
+
+        if len(outside) > 0:
+            self.mark_skipped(outside['activity_id'].tolist())
+
+        print(f"💾 Appended {len(rides)} rides ({len(outside)} outside AOI) → {self.path}")
+        return len(rides)
+
+    def mark_skipped(self, activity_ids):
+        #ids resume never fetches again - rides outside the AOI or without a usable track
+        if not len(activity_ids):
+            return
+        with open(self.skipped_path, 'a') as f:
+            f.writelines(f"{int(i)}\n" for i in activity_ids)
+
+    def delete(self, activity_ids):
+        #remove rides (+ their start points) -> number of rides removed; the GPKG rtree triggers keep the index
+        ids = [int(i) for i in activity_ids]
+        if not ids or not self.path.exists():
+            return 0
+        placeholders = ','.join('?' * len(ids))
+        with closing(sqlite3.connect(self.path)) as con, con:
+            removed = 0
+            for layer in (self.RIDES_LAYER, self.START_LAYER):
+                try:
+                    cursor = con.execute(f'DELETE FROM "{layer}" WHERE activity_id IN ({placeholders})', ids)
+                except sqlite3.OperationalError:  #table not created yet
+                    continue
+                if layer == self.RIDES_LAYER:
+                    removed = cursor.rowcount
+        print(f"🗑 Removed {removed} rides → {self.path}")
+        return removed
+
+    def read(self, layer=None, activity_ids=None):
+        #activity_ids => only those rides (SQL filter, the rest of the file is not read)
+        where = None
+        if activity_ids is not None:
+            where = f"activity_id IN ({','.join(str(int(i)) for i in activity_ids) or 'NULL'})"
+        return gpd.read_file(self.path, layer=layer or self.RIDES_LAYER, where=where)
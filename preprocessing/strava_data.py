@@ -1,41 +1,45 @@
 import json
+import sys
 import time
 from pathlib import Path
 from datetime import datetime
-import geopandas as gpd
-from shapely.geometry import LineString, MultiLineString, Point
 from stravalib import Client
-import polyline
 import os
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+from polyline_codec import polylines_to_linestrings
+from aoi_service import StudyArea
+from ride_store import RideStore
+from stream_store import StreamStore
+from progress import Cancelled, Progress
 
 STRAVA_CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
 STRAVA_CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
 CODE = os.getenv("CODE")
 
-if not STRAVA_CLIENT_ID or not STRAVA_CLIENT_SECRET or not CODE:
-    raise RuntimeError("❌ STRAVA_CLIENT_ID / STRAVA_CLIENT_SECRET not set")
-
 
 # ============================================
 # CONFIG
 # ============================================
 
 TOKEN_FILE = 'data/.strava_token.json'
-OUTPUT_DIR = Path('data/strava')
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-OUTPUT_GEOJSON = OUTPUT_DIR / 'strava_routes_sumava.geojson'
-START_POINTS_GEOJSON = OUTPUT_DIR / 'strava_start_points_sumava.geojson'
-AIO = 'data/sumava_data/sumava_aoi.geojson'
+# ride store + streams: Config.RIDE_STORE / Config.STREAM_STORE (a region profile moves the ride store to its folder)
 
 ACTIVITY_TYPE = 'Ride'
 MIN_DATE = datetime(2017, 1, 1)
 REQUEST_DELAY = 5  # seconds between requests
+FETCH_STREAMS = True  # summary_polyline is heavily generalised - keep full GPS tracks too
+STREAM_TYPES = ['latlng', 'altitude', 'time']
 
 # ============================================
 # HELPERS
 # ============================================
 
+def check_credentials():
+    #checked when the API is used, not on import - the webhook receiver / its simulator import this module too
+    if not STRAVA_CLIENT_ID or not STRAVA_CLIENT_SECRET or not CODE:
+        raise RuntimeError("❌ STRAVA_CLIENT_ID / STRAVA_CLIENT_SECRET not set")
+
 def load_token():
     if not Path(TOKEN_FILE).exists():
         raise FileNotFoundError(f"Token file not found: {TOKEN_FILE}")
@@ -61,128 +65,128 @@ def refresh_token_if_needed(token_data):
     print("✅ Token refreshed")
     return new_token
 
-def decode_polyline_to_linestring(polyline_str):
-    if not polyline_str:
-        return None
-    try:
-        coords = polyline.decode(polyline_str)
-        coords_swapped = [(lon, lat) for lat, lon in coords]
-        return LineString(coords_swapped)
-    except Exception:
+def strava_client():
+    check_credentials()
+    token_data = refresh_token_if_needed(load_token())
+    return Client(access_token=token_data["access_token"])
+
+def fetch_record(client, activity_id, retries=3, activity_type=None):
+    #one activity -> store record (polyline still encoded, see add_geometries; None if the ride has no track);
+    #None if the download failed (tried again next sync) or it is not of activity_type - webhook events do not tell the sport
+    for attempt in range(retries):
+        try:
+            detailed = client.get_activity(activity_id)
+            break
+        except Exception as e:
+            wait = 2 ** attempt
+            print(f"⚠️ Error downloading activity {activity_id}: {e}. Retrying in {wait}s...")
+            time.sleep(wait)
+    else:
+        print(f"❌ Failed to download activity {activity_id}, skipping...")
         return None
 
-def get_start_point(geom):
-    if geom is None:
+    if activity_type is not None and detailed.type != activity_type:
         return None
-    if isinstance(geom, LineString):
-        return Point(geom.coords[0])
-    elif isinstance(geom, MultiLineString):
-        return Point(list(geom.geoms[0].coords)[0])
-    else:  # GeometryCollection or other
-        for g in geom.geoms:
-            if isinstance(g, LineString):
-                return Point(g.coords[0])
-    return None
-
-def save_routes_geojson(gdf, path):
-    if len(gdf) > 0:
-        gdf.to_file(path, driver='GeoJSON')
-        print(f"💾 Saved {len(gdf)} records → {path}")
+    summary_polyline = detailed.map.summary_polyline if detailed.map else None
+
+    return {
+        'activity_id': detailed.id,
+        'name': detailed.name,
+        'date': detailed.start_date_local,
+        'distance_km': float(detailed.distance) / 1000 if detailed.distance else 0,
+        'elevation_gain_m': float(detailed.total_elevation_gain) if detailed.total_elevation_gain else 0,
+        'polyline': summary_polyline or None  # decoded per batch in add_geometries
+    }
+
+def decode_polyline_to_linestring(polyline_str):
+    return polylines_to_linestrings([polyline_str])[0]
+
+def add_geometries(records, store=None):
+    #decode the polylines of the whole batch in one go, drop rides without a usable track
+    #(no polyline / broken one) - store => they are marked skipped, the next sync does not fetch them again
+    geoms = polylines_to_linestrings([r.pop('polyline') for r in records])
+    if store is not None:
+        store.mark_skipped([r['activity_id'] for r, g in zip(records, geoms) if g is None])
+    return [dict(r, geometry=g) for r, g in zip(records, geoms) if g is not None]
+
+def download_streams(client, activity_id, streams):
+    #full resolution track -> stream store; the ride still counts if this fails
+    try:
+        data = client.get_activity_streams(activity_id, types=STREAM_TYPES, resolution='high')
+    except Exception as e:
+        print(f"⚠️ No streams for activity {activity_id}: {e}")
+        return False
+
+    if not data or 'latlng' not in data:
+        return False
+
+    streams.append(
+        activity_id,
+        data['latlng'].data,
+        altitude=data['altitude'].data if 'altitude' in data else None,
+        time=data['time'].data if 'time' in data else None
+    )
+    return True
 
 # ============================================
 # MAIN DOWNLOAD FUNCTION
 # ============================================
-def download_strava_routes_incremental():
+def download_strava_routes_incremental(progress=None):
     print("\n🔹 Loading Strava token...")
-
-    token_data = load_token()
-    token_data = refresh_token_if_needed(token_data)
-
-    client = Client(access_token=token_data["access_token"])
+    client = strava_client()
 
     athlete = client.get_athlete()
     print(f"👤 Athlete: {athlete.firstname} {athlete.lastname}")
 
-    # Load AOI
-    aio_gdf = gpd.read_file(AIO)[['geometry']]
-    aio_gdf = aio_gdf.to_crs(epsg=4326)
+    # AOI - cached, simplified and prepared once by the study area service
+    store = RideStore(Config.RIDE_STORE, aoi_geometry=StudyArea.load().geometry('EPSG:4326'))
 
-    # Resume from existing file
-    if OUTPUT_GEOJSON.exists():
-        routes_gdf = gpd.read_file(OUTPUT_GEOJSON)
-        processed_ids = set(routes_gdf['activity_id'])
-        routes_list = routes_gdf.to_dict('records')
-        print(f"🔄 Resuming, {len(routes_list)} activities already saved")
-    else:
-        routes_list = []
-        processed_ids = set()
+    # Resume - only the ids are read, not the geometries
+    processed_ids = store.processed_ids()
+    if processed_ids:
+        print(f"🔄 Resuming, {len(processed_ids)} activities already processed")
 
+    streams = StreamStore(Config.STREAM_STORE) if FETCH_STREAMS else None
+
+    pending = []
     count = 0
-    batch_save = 10  # save after every 10 rides
-
-    for activity in client.get_activities(after=MIN_DATE):
-        if activity.type != ACTIVITY_TYPE or activity.id in processed_ids:
-            continue
-
-        # Retry activity download
-        retries = 3
-        for attempt in range(retries):
-            try:
-                detailed = client.get_activity(activity.id)
-                break
-            except Exception as e:
-                wait = 2 ** attempt
-                print(f"⚠️ Error downloading activity {activity.id}: {e}. Retrying in {wait}s...")
-                time.sleep(wait)
-        else:
-            print(f"❌ Failed to download activity {activity.id}, skipping...")
-            continue
-
-        geom = decode_polyline_to_linestring(
-            detailed.map.summary_polyline if detailed.map else None
-        )
-        if geom is None:
-            continue
-
-        record = {
-            'activity_id': detailed.id,
-            'name': detailed.name,
-            'date': detailed.start_date_local,
-            'distance_km': float(detailed.distance) / 1000 if detailed.distance else 0,
-            'elevation_gain_m': float(detailed.total_elevation_gain) if detailed.total_elevation_gain else 0,
-            'geometry': geom
-        }
-
-        routes_list.append(record)
-        processed_ids.add(detailed.id)
-        count += 1
-
-        # Save batch every N rides
-        if count % batch_save == 0:
-            gdf_tmp = gpd.GeoDataFrame(routes_list, crs='EPSG:4326')
-
-            # Clip to AOI to keep only rides in Sumava
-            sumava_routes = gpd.overlay(gdf_tmp, aio_gdf, how='intersection')
-            save_routes_geojson(sumava_routes, OUTPUT_GEOJSON)
-
-            # Save start points
-            start_points = sumava_routes.copy()
-            start_points['geometry'] = start_points['geometry'].apply(get_start_point)
-            save_routes_geojson(start_points, START_POINTS_GEOJSON)
-
-        time.sleep(REQUEST_DELAY)
-
-    # Save final batch
-    gdf_tmp = gpd.GeoDataFrame(routes_list, crs='EPSG:4326')
-    sumava_routes = gpd.overlay(gdf_tmp, aio_gdf, how='intersection')
-    save_routes_geojson(sumava_routes, OUTPUT_GEOJSON)
-
-    start_points = sumava_routes.copy()
-    start_points['geometry'] = start_points['geometry'].apply(get_start_point)
-    save_routes_geojson(start_points, START_POINTS_GEOJSON)
+    batch_save = 10  # append after every 10 rides
+    task = Progress.ensure(progress).task('download', unit='activities')  # total unknown - the API pages
+
+    try:
+        for activity in client.get_activities(after=MIN_DATE):
+            task.check()
+            if activity.type != ACTIVITY_TYPE or activity.id in processed_ids:
+                continue
+
+            record = fetch_record(client, activity.id)
+            if record is None:
+                continue
+
+            if streams is not None and record['polyline'] is not None and activity.id not in streams:
+                download_streams(client, activity.id, streams)
+
+            pending.append(record)
+            processed_ids.add(activity.id)
+            count += 1
+            task.advance()
+
+            # Append batch every N rides - only the new rides are clipped and written
+            if len(pending) >= batch_save:
+                store.append(add_geometries(pending, store))
+                pending = []
+
+            time.sleep(REQUEST_DELAY)
+    except Cancelled:
+        store.append(add_geometries(pending, store))  # resumes after the last saved ride next time
+        raise
+    task.finish()
+
+    # Append final batch
+    store.append(add_geometries(pending, store))
 
     print(f"\n🎉 Done! Total new activities processed this run: {count}")
-    return gpd.read_file(OUTPUT_GEOJSON)
+    return store.read()
 
 # ============================================
 # RUN
@@ -0,0 +1,277 @@
+import json
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import Config
+from ride_store import RideStore
+from progress import Cancelled, Progress
+
+#push ingestion - Strava webhook subscription events instead of polling the activity list
+#
+#   GET  /webhook?hub.mode=subscribe&hub.challenge=..&hub.verify_token=..   subscription handshake
+#   POST /webhook   {"object_type": "activity", "object_id": 123, "aspect_type": "create", "updates": {}, ...}
+#   GET  /status    queue + worker counters
+#
+#a POST is only queued if its subscription_id is ours (and owner_id, if configured) - the URL is public and a delete
+#event removes rides; until the subscription id is known (it is assigned after the handshake) every event is refused.
+#a request only writes the event to a SQLite queue (Strava wants the 200 within 2 s). A background worker waits
+#Config.WEBHOOK_DEBOUNCE_S after the oldest queued event, folds the batch per activity (create + title update =
+#one fetch, create + delete = nothing) and then
+#   fetches created rides (1 activity + 1 streams request each) -> ride store + stream store
+#   removes deleted rides and rides changed to another sport from the ride store
+#   calls on_change(added, removed) - the CLI passes the incremental network update (maps/network_update.py)
+#title / privacy updates cost no request at all. Queued events survive a restart;
+#benchmarks/webhook_sim.py posts synthetic events against a local receiver
+
+ACTIVITY_TYPE = 'Ride'
+
+
+class EventQueue:
+    #durable FIFO of raw events - one SQLite file, safe to use from the server and worker threads
+    def __init__(self, path=None):
+        self.path = Path(path or Config.WEBHOOK_QUEUE)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._execute('CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, received REAL, '
+                      "event TEXT, attempts INTEGER DEFAULT 0, state TEXT DEFAULT 'pending')")
+
+    def _execute(self, sql, params=()):
+        with closing(sqlite3.connect(self.path, timeout=30)) as con, con:
+            return con.execute(sql, params).fetchall()
+
+    def put(self, event):
+        self._execute('INSERT INTO events (received, event) VALUES (?, ?)', (time.time(), json.dumps(event)))
+
+    def pending(self, limit=5000):
+        #[(id, received, event, attempts)] oldest first
+        rows = self._execute("SELECT id, received, event, attempts FROM events WHERE state = 'pending' "
+                             "ORDER BY id LIMIT ?", (limit,))
+        return [(i, received, json.loads(event), attempts) for i, received, event, attempts in rows]
+
+    def mark(self, ids, state):
+        ids = list(ids)
+        if ids:
+            self._execute(f'UPDATE events SET state = ? WHERE id IN ({",".join("?" * len(ids))})', (state, *ids))
+
+    def retry(self, ids, max_attempts=None):
+        #one more attempt with the next batch, given up ('failed') after max_attempts
+        ids = list(ids)
+        if ids:
+            placeholders = ','.join('?' * len(ids))
+            self._execute(f'UPDATE events SET attempts = attempts + 1 WHERE id IN ({placeholders})', ids)
+            self._execute(f"UPDATE events SET state = 'failed' WHERE id IN ({placeholders}) AND attempts >= ?",
+                          (*ids, max_attempts or Config.WEBHOOK_MAX_ATTEMPTS))
+
+    def counts(self):
+        return dict(self._execute('SELECT state, COUNT(*) FROM events GROUP BY state'))
+
+
+def fold(events):
+    #events (oldest first) -> {activity_id: 'add' | 'remove' | None}, the last event that matters wins
+    actions = {}
+    for event in events:
+        if event.get('object_type') != 'activity':
+            continue
+        activity_id, aspect, updates = int(event['object_id']), event.get('aspect_type'), event.get('updates') or {}
+        if aspect == 'create':
+            actions[activity_id] = 'add'
+        elif aspect == 'delete':
+            actions[activity_id] = 'remove'
+        elif aspect == 'update' and 'type' in updates:
+            actions[activity_id] = 'add' if updates['type'] == ACTIVITY_TYPE else 'remove'
+        else:
+            actions.setdefault(activity_id, None)  # title / private - nothing to fetch
+    return actions
+
+
+class StravaFetcher:
+    #activity id -> ride store record with geometry (None: no track / other sport); stravalib imported on first use
+    def __init__(self, streams=None):
+        self.streams = streams
+
+    def __call__(self, activity_id):
+        from strava_data import strava_client, fetch_record, add_geometries, download_streams
+
+        client = strava_client()  # token file read, refreshed only when expired - the receiver runs for days
+        record = fetch_record(client, activity_id, activity_type=ACTIVITY_TYPE)
+        if record is None:
+            return None
+        if self.streams is not None and record['polyline'] is not None and activity_id not in self.streams:
+            download_streams(client, activity_id, self.streams)
+        records = add_geometries([record])
+        return records[0] if records else None
+
+
+class WebhookWorker:
+    def __init__(self, queue, fetch, store, on_change=None, debounce=None, progress=None):
+        self.queue = queue
+        self.fetch = fetch
+        self.store = store
+        self.on_change = on_change
+        self.debounce = Config.WEBHOOK_DEBOUNCE_S if debounce is None else debounce
+        self.progress = Progress.ensure(progress)
+        self.stats = {'batches': 0, 'events': 0, 'fetched': 0, 'added': 0, 'removed': 0, 'failed': 0,
+                      'last_batch': None}
+        self._wake = threading.Event()
+        self._thread = None
+        self._retry_at = 0.0  # after a failed batch
+
+    def notify(self):
+        self._wake.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def run(self):
+        #until the token is cancelled; a batch that is being processed is finished first
+        while not self.progress.token.cancelled:
+            events = self.queue.pending()
+            wait = 1.0
+            if events:
+                wait = max(events[0][1] + self.debounce, self._retry_at) - time.time()
+                if wait <= 0:
+                    try:
+                        self.process(events)
+                    except Cancelled:
+                        break
+                    except Exception as e:  # keep receiving - the events stay queued for the next try
+                        print(f"❌ Webhook batch failed: {e!r}")
+                        self._retry_at = time.time() + self.debounce
+                    else:
+                        continue
+            self._wake.wait(timeout=min(max(wait, 0.05), 1.0))
+            self._wake.clear()
+
+    def process(self, events):
+        task = self.progress.task('webhook', total=len(events), unit='events')
+        actions = fold(e[2] for e in events)
+        for event in events:
+            if event[2].get('object_type') == 'athlete' and (event[2].get('updates') or {}).get('authorized') == 'false':
+                print(f"⚠️ Athlete {event[2].get('object_id')} revoked access - no more events will come")
+
+        known = self.store.processed_ids()
+        adds = [a for a, action in actions.items() if action == 'add' and a not in known]
+        removes = [a for a, action in actions.items() if action == 'remove']
+
+        records, failed = [], set()
+        for activity_id in adds:
+            try:
+                record = self.fetch(activity_id)
+            except Cancelled:
+                raise
+            except Exception as e:
+                print(f"⚠️ Activity {activity_id} not fetched: {e} (retried with the next batch)")
+                failed.add(activity_id)
+                continue
+            self.stats['fetched'] += 1
+            if record is not None:
+                records.append(record)
+
+        removed = self.store.delete(removes)
+        self.store.append(records)
+        added = [r['activity_id'] for r in records]
+        if (added or removed) and self.on_change is not None:
+            try:
+                self.on_change(added=added, removed=removes)
+            except Exception as e:  # rides are stored - the next update or build-network catches up
+                print(f"⚠️ Network update failed: {e!r}")
+
+        retry = {e[0] for e in events if e[2].get('object_type') == 'activity' and int(e[2]['object_id']) in failed}
+        self.queue.retry(retry)
+        self.queue.mark([e[0] for e in events if e[0] not in retry], 'done')
+        self.stats.update(batches=self.stats['batches'] + 1, events=self.stats['events'] + len(events),
+                          added=self.stats['added'] + len(added), removed=self.stats['removed'] + removed,
+                          failed=self.stats['failed'] + len(failed), last_batch=time.time())
+        task.finish()
+        print(f"✓ Webhook batch: {len(events)} events -> +{len(added)} / -{removed} rides, "
+              f"{len(adds)} fetched, {len(failed)} failed")
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    queue = None  # EventQueue - set by serve()
+    worker = None  # WebhookWorker
+    verify_token = None
+    subscription_id = None  # events of other subscriptions (or any event while None) are refused
+    owner_id = None  # optional - only events of this athlete
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == '/status':
+            return self._send(200, {'queue': self.queue.counts(), 'worker': self.worker.stats})
+        if url.path != '/webhook':
+            return self._send(404, {'error': f'unknown path {url.path}'})
+        # subscription handshake - echo the challenge if the token is ours
+        if query.get('hub.mode') != 'subscribe' or query.get('hub.verify_token') != self.verify_token:
+            return self._send(403, {'error': 'verify token mismatch'})
+        self._send(200, {'hub.challenge': query.get('hub.challenge', '')})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/webhook':
+            return self._send(404, {'error': f'unknown path {self.path}'})
+        try:
+            event = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if not isinstance(event, dict) or 'object_type' not in event or 'object_id' not in event:
+                raise ValueError('not a subscription event')
+            ours = self.subscription_id is not None and int(event.get('subscription_id', -1)) == self.subscription_id
+            ours &= self.owner_id is None or int(event.get('owner_id', -1)) == self.owner_id
+        except (ValueError, TypeError) as e:
+            return self._send(400, {'error': f'bad event: {e}'})
+        if not ours:
+            return self._send(403, {'error': 'unknown subscription / owner'})
+        self.queue.put(event)
+        self.worker.notify()
+        self._send(200, {'queued': True})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host='127.0.0.1', port=8766, verify_token='mtb-planner', fetch=None, on_change=None, store=None,
+          queue=None, debounce=None, progress=None, ready=None, subscription_id=None, owner_id=None):
+    #receiver + worker until the progress token is cancelled (SIGTERM / timeout) or Ctrl+C
+    from aoi_service import StudyArea
+    from stream_store import StreamStore
+
+    progress = Progress.ensure(progress)
+    store = store or RideStore(Config.RIDE_STORE, aoi_geometry=StudyArea.load().geometry('EPSG:4326'))
+    fetch = fetch or StravaFetcher(StreamStore(Config.STREAM_STORE))
+    WebhookHandler.queue = queue or EventQueue()
+    WebhookHandler.worker = WebhookWorker(WebhookHandler.queue, fetch, store, on_change, debounce, progress).start()
+    WebhookHandler.verify_token = verify_token
+    WebhookHandler.subscription_id = None if subscription_id is None else int(subscription_id)
+    WebhookHandler.owner_id = None if owner_id is None else int(owner_id)
+
+    server = ThreadingHTTPServer((host, port), WebhookHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"✓ Webhook receiver on http://{host}:{server.server_port}/webhook "
+          f"({WebhookHandler.queue.counts().get('pending', 0)} queued events)")
+    if subscription_id is None:
+        print("⚠️ No subscription id - handshake only, events are refused until it is set (--subscription-id)")
+    if ready is not None:
+        ready(server)
+    try:
+        while not progress.token.cancelled:
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        progress.cancel('interrupted')
+    finally:
+        server.shutdown()
+        server.server_close()
+        WebhookHandler.worker._thread.join()
@@ -0,0 +1,154 @@
+import os
+from pathlib import Path
+import numpy as np
+import geopandas as gpd
+from coord_arrays import lines_from_offsets
+
+#full resolution activity streams (latlng / altitude / time) - flat columnar files, read by memory mapping
+#
+#   coords.f8     lon, lat pairs of all activities back to back
+#   altitude.f4   one value per point (NaN when the stream is missing)
+#   time.i4       seconds from activity start (-1 when missing)
+#   index.i64     activity_id, start, count - one row per activity
+#
+#data is appended (and fsynced) first and the index row last - anything past the last indexed point is a
+#half-written activity (crash) and gets overwritten by the next append; a half-written index row is ignored
+#by readers and overwritten the same way
+
+class StreamStore:
+    COLUMNS = {
+        'coords': (np.float64, 2),
+        'altitude': (np.float32, 1),
+        'time': (np.int32, 1),
+    }
+    INDEX_FILE = 'index.i64'
+    INDEX_ROW = 3 * np.dtype(np.int64).itemsize  # bytes per index row
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._index = None
+        self._maps = {}
+        self._positions_by_id = None
+
+    # === WRITING ===
+    def append(self, activity_id, latlng, altitude=None, time=None):
+        self.append_many([(activity_id, latlng, altitude, time)])
+
+    def append_many(self, activities):
+        #[(activity_id, latlng, altitude, time)] -> every column written and fsynced once, then the index rows
+        #(bulk import: 4 fsyncs per batch instead of 4 per activity)
+        parts = {name: [] for name in self.COLUMNS}
+        rows = []
+        first = start = self.n_points()
+        for activity_id, latlng, altitude, time in activities:
+            latlng = np.asarray(latlng, dtype=np.float64).reshape(-1, 2)
+            n = len(latlng)
+            if n == 0:
+                continue
+            parts['coords'].append(latlng[:, ::-1])  # strava gives lat, lon - store x, y
+            parts['altitude'].append(np.full(n, np.nan) if altitude is None else altitude)
+            parts['time'].append(np.full(n, -1) if time is None else time)
+            rows.append((activity_id, start, n))
+            start += n
+        if not rows:
+            return 0
+
+        for name, (dtype, width) in self.COLUMNS.items():
+            values = np.concatenate([np.asarray(v, dtype=dtype).reshape(-1, width) for v in parts[name]])
+            path = self._column_path(name)
+            with open(path, 'r+b' if path.exists() else 'wb') as f:
+                f.seek(first * width * np.dtype(dtype).itemsize)
+                f.write(values.tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+
+        path = self.root / self.INDEX_FILE
+        with open(path, 'r+b' if path.exists() else 'wb') as f:
+            f.seek(len(self.index()) * self.INDEX_ROW)  # after the last complete row
+            f.write(np.array(rows, dtype=np.int64).tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._index = None  # files grew - maps are rebuilt on next read
+        self._maps = {}
+        self._positions_by_id = None
+        return len(rows)
+
+    # === READING (zero copy) ===
+    def _column_path(self, name):
+        dtype, _ = self.COLUMNS[name]
+        return self.root / f'{name}.{np.dtype(dtype).str[1:]}'
+
+    def index(self):
+        if self._index is None:
+            path = self.root / self.INDEX_FILE
+            rows = path.stat().st_size // self.INDEX_ROW if path.exists() else 0  # a trailing partial row is not read
+            if rows == 0:
+                self._index = np.zeros((0, 3), dtype=np.int64)
+            else:
+                self._index = np.memmap(path, dtype=np.int64, mode='r', shape=(rows, 3))
+        return self._index
+
+    def __len__(self):
+        return len(self.index())
+
+    def __contains__(self, activity_id):
+        return activity_id in self._positions()
+
+    def n_points(self):
+        index = self.index()
+        return int(index[-1, 1] + index[-1, 2]) if len(index) else 0
+
+    def activity_ids(self):
+        return self.index()[:, 0]
+
+    def offsets(self):
+        index = self.index()
+        return np.append(index[:, 1], self.n_points())
+
+    def column(self, name):
+        #whole column as a read only memory map - nothing is loaded until sliced
+        if name not in self._maps:
+            dtype, width = self.COLUMNS[name]
+            n = self.n_points()
+            if n == 0:
+                self._maps[name] = np.zeros((0, width) if width > 1 else 0, dtype=dtype)
+            else:
+                shape = (n, width) if width > 1 else (n,)
+                self._maps[name] = np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=shape)
+        return self._maps[name]
+
+    def _positions(self):
+        if self._positions_by_id is None:
+            self._positions_by_id = {int(a): i for i, a in enumerate(self.activity_ids())}
+        return self._positions_by_id
+
+    def get(self, activity_id, name='coords'):
+        #slice of one activity - a view into the memory map, not a copy
+        i = self._positions()[int(activity_id)]
+        _, start, count = self.index()[i]
+        return self.column(name)[start:start + count]
+
+    def coords(self, activity_id):
+        return self.get(activity_id, 'coords')
+
+    def arrays(self, activity_ids=None, names=('coords',)):
+        #columns of the requested activities back to back + offsets + the ids found (unknown ids are skipped)
+        offsets = self.offsets()
+        ids = self.activity_ids()
+        if activity_ids is None:
+            return {name: self.column(name) for name in names}, offsets, ids
+
+        positions = self._positions()
+        rows = np.array([positions[int(a)] for a in activity_ids if int(a) in positions], dtype=np.int64)
+        starts, counts = self.index()[rows, 1], self.index()[rows, 2]
+        point_idx = np.concatenate([np.arange(s, s + c) for s, c in zip(starts, counts)]) if len(rows) else np.zeros(0, dtype=np.int64)
+        return {name: self.column(name)[point_idx] for name in names}, np.append(0, np.cumsum(counts)), ids[rows]
+
+    def linestrings(self, activity_ids=None, crs='EPSG:4326'):
+        #shapely geometries are only built here, on demand, for the requested activities
+        columns, offsets, ids = self.arrays(activity_ids)
+        return gpd.GeoSeries(lines_from_offsets(columns['coords'], offsets), index=np.asarray(ids), crs=crs)
@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'maps'))
+sys.path.insert(0, str(ROOT / 'preprocessing'))
+
+#the modules import each other by bare name (maps/ and preprocessing/ on sys.path) - the tests do the same
+#
+#   python -m pytest -q
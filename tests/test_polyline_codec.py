@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from polyline_codec import decode_polylines, polylines_to_linestrings
+
+polyline = pytest.importorskip('polyline')  # reference implementation (pip install polyline)
+
+
+def random_tracks(n, seed=7):
+    rng = np.random.default_rng(seed)
+    tracks = []
+    for _ in range(n):
+        start = rng.uniform([48.5, 13.0], [49.5, 14.5])
+        steps = rng.normal(0, 0.002, (rng.integers(1, 300), 2))
+        tracks.append(np.round(start + np.cumsum(steps, axis=0), 5))
+    return tracks
+
+
+def test_decode_matches_reference():
+    tracks = random_tracks(200)
+    encoded = [polyline.encode([tuple(p) for p in t]) for t in tracks]
+    coords, offsets = decode_polylines(encoded)
+
+    assert offsets.tolist() == np.cumsum([0] + [len(t) for t in tracks]).tolist()
+    for i, s in enumerate(encoded):
+        expected = np.array(polyline.decode(s))[:, ::-1]  # lat, lon -> lon, lat
+        np.testing.assert_array_equal(coords[offsets[i]:offsets[i + 1]], expected)
+
+
+def test_precision_6():
+    track = [(49.123456, 13.654321), (49.123457, 13.654300), (-0.000001, 179.999999)]
+    coords, offsets = decode_polylines([polyline.encode(track, 6)], precision=6)
+    np.testing.assert_array_equal(coords, np.array(polyline.decode(polyline.encode(track, 6), 6))[:, ::-1])
+
+
+def test_empty_and_broken_strings_are_empty_lines():
+    good = polyline.encode([(49.0, 13.0), (49.001, 13.002)])
+    odd = polyline.encode([(49.0, 13.0)]) + '?'  # a latitude without its longitude
+    encoded = [good, '', None, good[:-1], odd, good]
+    coords, offsets = decode_polylines(encoded)
+
+    assert np.diff(offsets).tolist() == [2, 0, 0, 0, 0, 2]
+    np.testing.assert_array_equal(coords[:2], coords[2:])
+    lines = polylines_to_linestrings(encoded)
+    assert [g is None for g in lines] == [False, True, True, True, True, False]
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+import shapely
+from spatial_index import PackedRTree, content_hash
+
+
+def geometries(n, seed=3):
+    #lines, polygons and points in a 10 km square, with None and empty geometries in between
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(0, 10000, (n, 2))
+    geoms = np.empty(n, dtype=object)
+    kind = rng.integers(0, 3, n)
+    geoms[kind == 0] = shapely.linestrings(np.stack([start[kind == 0], start[kind == 0] + rng.normal(0, 300, ((kind == 0).sum(), 2))], axis=1))
+    geoms[kind == 1] = shapely.buffer(shapely.points(start[kind == 1]), rng.uniform(10, 200, (kind == 1).sum()))
+    geoms[kind == 2] = shapely.points(start[kind == 2])
+    geoms[::37] = None
+    geoms[5::41] = shapely.Point()
+    return geoms
+
+
+def pairs(result):
+    return sorted(map(tuple, np.asarray(result).T.tolist()))
+
+
+@pytest.fixture(scope='module')
+def items():
+    return geometries(3000)
+
+
+@pytest.fixture(scope='module')
+def queries():
+    return geometries(400, seed=4)
+
+
+@pytest.mark.parametrize('predicate', [None, 'intersects'])
+def test_array_queries_match_strtree(items, queries, predicate):
+    expected = shapely.STRtree(items).query(queries, predicate=predicate)
+    assert pairs(PackedRTree.from_geometries(items).query(queries, predicate=predicate)) == pairs(expected)
+
+
+@pytest.mark.parametrize('distance', [0, 50, 750])
+def test_dwithin_matches_strtree(items, queries, distance):
+    expected = shapely.STRtree(items).query(queries, predicate='dwithin', distance=distance)
+    assert pairs(PackedRTree.from_geometries(items).query(queries, predicate='dwithin', distance=distance)) == pairs(expected)
+
+
+def test_scalar_queries_match_strtree(items, queries):
+    strtree, tree = shapely.STRtree(items), PackedRTree.from_geometries(items)
+    for q in queries[:60]:
+        assert sorted(tree.query(q).tolist()) == sorted(strtree.query(q).tolist())
+        assert sorted(tree.query(q, 'intersects').tolist()) == sorted(strtree.query(q, 'intersects').tolist())
+        assert (sorted(tree.query(q, 'dwithin', 400).tolist()) ==
+                sorted(strtree.query(q, 'dwithin', distance=400).tolist()))
+
+
+def test_point_tree_dwithin_without_geometries(queries):
+    points = shapely.points(np.random.default_rng(5).uniform(0, 10000, (2000, 2)))
+    tree = PackedRTree.build(shapely.bounds(points))  # boxes only, as the query service keeps the ride starts
+    assert tree.points and tree.geometries is None
+    expected = shapely.STRtree(points).query(queries, predicate='dwithin', distance=300)
+    assert pairs(tree.query(queries, predicate='dwithin', distance=300)) == pairs(expected)
+    with pytest.raises(ValueError):
+        tree.query(queries, predicate='intersects')
+
+
+def test_saved_tree_answers_the_same(items, queries, tmp_path):
+    tree = PackedRTree.from_geometries(items)
+    tree.tag = content_hash(shapely.bounds(items))
+    tree.save(tmp_path / 'items')
+    assert PackedRTree.load(tmp_path / 'items', tag='other') is None
+
+    loaded = PackedRTree.cached(items, tmp_path / 'items')
+    assert loaded.tag == tree.tag and len(loaded) == len(items)
+    assert pairs(loaded.query(queries, 'intersects')) == pairs(tree.query(queries, 'intersects'))
+
+
+@pytest.mark.parametrize('geoms', [[], [None, shapely.Point()]])
+def test_empty_tree(geoms):
+    tree = PackedRTree.from_geometries(np.array(geoms, dtype=object))
+    assert tree.query(shapely.box(0, 0, 1, 1)).tolist() == []
+    assert tree.query(np.array([shapely.box(0, 0, 1, 1)]), 'intersects').shape == (2, 0)
@@ -0,0 +1,102 @@
+from datetime import datetime
+import numpy as np
+import shapely
+from ride_store import RideStore
+from stream_store import StreamStore
+
+
+def ride(activity_id, x0, y0=49.0, n=5):
+    return {
+        'activity_id': activity_id,
+        'name': f'Ride {activity_id}',
+        'date': datetime(2024, 5, activity_id % 28 + 1, 10, 30),
+        'distance_km': float(activity_id),
+        'geometry': shapely.linestrings(np.column_stack([np.linspace(x0, x0 + 0.01, n), np.full(n, y0)])),
+    }
+
+
+def stream(n, seed):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform([49, 13], [49.1, 13.1], (n, 2)), rng.uniform(500, 1300, n).astype(np.float32),
+            np.arange(n, dtype=np.int32) * 2)
+
+
+# === RIDE STORE ===
+def test_ride_store_round_trip(tmp_path):
+    path = tmp_path / 'rides.gpkg'
+    store = RideStore(path)
+    assert store.append([ride(1, 13.0), ride(2, 13.1)]) == 2
+    assert store.append([ride(3, 13.2)]) == 1
+    assert store.delete([2, 99]) == 1
+
+    reopened = RideStore(path)
+    assert len(reopened) == 2
+    assert reopened.processed_ids() == {1, 3}
+    rides = reopened.read().sort_values('activity_id')
+    assert rides['activity_id'].tolist() == [1, 3]
+    assert rides['name'].tolist() == ['Ride 1', 'Ride 3']
+    assert shapely.equals_exact(rides.geometry.values, np.array([ride(1, 13.0)['geometry'], ride(3, 13.2)['geometry']]),
+                                tolerance=0).all()
+    starts = reopened.read(RideStore.START_LAYER).sort_values('activity_id')
+    assert shapely.get_coordinates(starts.geometry.values).tolist() == [[13.0, 49.0], [13.2, 49.0]]
+    assert reopened.read(activity_ids=[3])['activity_id'].tolist() == [3]
+
+
+def test_ride_store_clips_to_aoi_and_skips_outside(tmp_path):
+    aoi = shapely.box(13.0, 48.9, 13.105, 49.1)
+    store = RideStore(tmp_path / 'rides.gpkg', aoi_geometry=aoi)
+    assert store.append([ride(1, 13.0), ride(2, 13.1), ride(3, 14.0)]) == 2
+
+    reopened = RideStore(tmp_path / 'rides.gpkg')
+    assert reopened.processed_ids() == {1, 2, 3}  # 3 is outside - skipped, never fetched again
+    rides = reopened.read().sort_values('activity_id')
+    assert rides['activity_id'].tolist() == [1, 2]
+    assert shapely.bounds(rides.geometry.values[1]).tolist() == [13.1, 49.0, 13.105, 49.0]
+
+    store.mark_skipped([4])
+    assert RideStore(tmp_path / 'rides.gpkg').processed_ids() == {1, 2, 3, 4}
+
+
+# === STREAM STORE ===
+def test_stream_store_round_trip(tmp_path):
+    store = StreamStore(tmp_path / 'streams')
+    a, b, c = stream(10, 1), stream(3, 2), stream(7, 3)
+    store.append(11, *a)
+    store.append_many([(12, *b), (13, c[0], None, None), (14, np.zeros((0, 2)), None, None)])  # empty => not stored
+
+    reopened = StreamStore(tmp_path / 'streams')
+    assert reopened.activity_ids().tolist() == [11, 12, 13]
+    assert 14 not in reopened and 12 in reopened
+    assert reopened.offsets().tolist() == [0, 10, 13, 20]
+    np.testing.assert_array_equal(reopened.coords(12), b[0][:, ::-1])  # lat, lon in - x, y stored
+    np.testing.assert_array_equal(reopened.get(11, 'altitude'), a[1])
+    np.testing.assert_array_equal(reopened.get(11, 'time'), a[2])
+    assert np.isnan(reopened.get(13, 'altitude')).all() and (reopened.get(13, 'time') == -1).all()
+
+    columns, offsets, ids = reopened.arrays([13, 99, 11], ('coords', 'time'))
+    assert ids.tolist() == [13, 11] and offsets.tolist() == [0, 7, 17]
+    np.testing.assert_array_equal(columns['coords'], np.concatenate([c[0], a[0]])[:, ::-1])
+    lines = reopened.linestrings([12])
+    assert lines.index.tolist() == [12] and shapely.get_num_coordinates(lines.values).tolist() == [3]
+
+
+def test_stream_store_ignores_half_written_append(tmp_path):
+    store = StreamStore(tmp_path / 'streams')
+    a, b = stream(10, 1), stream(4, 2)
+    store.append(1, *a)
+    # crash while appending: column data and half an index row past the last complete row
+    with open(tmp_path / 'streams' / 'coords.f8', 'ab') as f:
+        f.write(np.ones((5, 2)).tobytes())
+    with open(tmp_path / 'streams' / StreamStore.INDEX_FILE, 'ab') as f:
+        f.write(np.array([2, 10], dtype=np.int64).tobytes())
+
+    reopened = StreamStore(tmp_path / 'streams')
+    assert reopened.activity_ids().tolist() == [1] and reopened.n_points() == 10
+    reopened.append(3, *b)  # overwrites the half written data
+
+    again = StreamStore(tmp_path / 'streams')
+    assert again.activity_ids().tolist() == [1, 3]
+    assert again.offsets().tolist() == [0, 10, 14]
+    assert (tmp_path / 'streams' / StreamStore.INDEX_FILE).stat().st_size == 2 * StreamStore.INDEX_ROW
+    np.testing.assert_array_equal(again.coords(1), a[0][:, ::-1])
+    np.testing.assert_array_equal(again.coords(3), b[0][:, ::-1])
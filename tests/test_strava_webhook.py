@@ -0,0 +1,32 @@
+from strava_webhook import fold
+
+
+def event(activity_id, aspect, updates=None, object_type='activity'):
+    return {'object_type': object_type, 'object_id': activity_id, 'aspect_type': aspect, 'updates': updates or {},
+            'subscription_id': 1, 'owner_id': 7}
+
+
+def test_create_then_title_is_one_fetch():
+    assert fold([event(1, 'create'), event(1, 'update', {'title': 'Evening ride'})]) == {1: 'add'}
+
+
+def test_last_event_wins():
+    assert fold([event(1, 'create'), event(1, 'delete')]) == {1: 'remove'}
+    assert fold([event(1, 'delete'), event(1, 'create')]) == {1: 'add'}
+
+
+def test_sport_changes():
+    assert fold([event(1, 'update', {'type': 'Run'})]) == {1: 'remove'}
+    assert fold([event(1, 'update', {'type': 'Run'}), event(1, 'update', {'type': 'Ride'})]) == {1: 'add'}
+    assert fold([event(1, 'create'), event(1, 'update', {'type': 'Hike'}), event(1, 'update', {'title': 'x'})]) == {1: 'remove'}
+
+
+def test_updates_without_a_fetch():
+    assert fold([event(1, 'update', {'title': 'x'}), event(2, 'update', {'private': 'true'})]) == {1: None, 2: None}
+
+
+def test_athlete_events_and_string_ids():
+    events = [event(7, 'update', {'authorized': 'false'}, object_type='athlete'), event('3', 'create'),
+              event(4, 'delete')]
+    assert fold(events) == {3: 'add', 4: 'remove'}
+    assert fold([]) == {}